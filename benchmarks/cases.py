@@ -0,0 +1,161 @@
+"""
+Benchmark cases. Each setup function runs once and returns the zero-argument
+callable that is timed; upstream calls inside it are served from fixtures.
+"""
+import json
+from itertools import cycle
+
+import numpy as np
+from django.core.cache import cache
+from django.http import JsonResponse
+
+from route_optimizer.http import FastJsonResponse
+from route_optimizer.services import geo_utils
+from route_optimizer.services.air_quality_service import AirQualityService
+from route_optimizer.services.dijkstra_optimizer import DijkstraOptimizer
+from route_optimizer.services.http_pool import upstream_session
+from route_optimizer.services.routing_service import RoutingService
+
+from .fixtures import OD_PAIRS
+
+CASES = {}
+
+
+def benchmark(name):
+    def register(setup):
+        CASES[name] = setup
+        return setup
+    return register
+
+
+def _fixture_route():
+    """A parsed recorded route for the first OD pair"""
+    _, (lat1, lng1), (lat2, lng2) = OD_PAIRS[0]
+    return RoutingService().get_route((lng1, lat1), (lng2, lat2))
+
+
+def _route_payload():
+    """find_route response body for the first OD pair"""
+    _, (lat1, lng1), (lat2, lng2) = OD_PAIRS[0]
+    result = DijkstraOptimizer().find_optimal_route(lat1, lng1, lat2, lng2, 'balanced', use_cache=False)
+    return {'success': True, 'route': {
+        'source': {'lat': lat1, 'lng': lng1, 'name': 'Source'},
+        'destination': {'lat': lat2, 'lng': lng2, 'name': 'Destination'},
+        'distance': round(result['distance'], 2),
+        'duration': round(result['duration'], 2),
+        'average_aqi': round(result['average_aqi'], 2),
+        'exposure': round(result['exposure'], 2),
+        'peak_aqi': round(result['peak_aqi'], 2),
+        'geometry': result['geometry'],
+        'coordinates': result['coordinates'],
+        'aqi_data': result['aqi_data'],
+        'priority': 'balanced',
+    }}
+
+
+def _find_optimal_route(priority):
+    def setup():
+        optimizer = DijkstraOptimizer()
+        pairs = cycle(OD_PAIRS)
+
+        def run():
+            _, (lat1, lng1), (lat2, lng2) = next(pairs)
+            return optimizer.find_optimal_route(lat1, lng1, lat2, lng2, priority, use_cache=False)
+        return run
+    return setup
+
+
+for _priority in ('shortest', 'balanced', 'cleanest'):
+    benchmark(f'optimizer.find_optimal_route[{_priority}]')(_find_optimal_route(_priority))
+
+
+@benchmark('optimizer.compare_routes')
+def compare_routes():
+    optimizer = DijkstraOptimizer()
+    pairs = cycle(OD_PAIRS)
+
+    def run():
+        cache.clear()  # measure routing, not route cache hits
+        _, (lat1, lng1), (lat2, lng2) = next(pairs)
+        return optimizer.compare_routes(lat1, lng1, lat2, lng2)
+    return run
+
+
+@benchmark('routing.sample_route_points')
+def sample_route_points():
+    routing = RoutingService()
+    coordinates = _fixture_route()['coordinates']
+    return lambda: routing.sample_route_points(coordinates, num_samples=10)
+
+
+def _select_strategic_waypoints(priority):
+    def setup():
+        routing = RoutingService()
+        coordinates = _fixture_route()['coordinates']
+        return lambda: routing._select_strategic_waypoints(coordinates, max_waypoints=4, priority=priority)
+    return setup
+
+
+for _priority in ('balanced', 'cleanest'):
+    benchmark(f'routing.select_strategic_waypoints[{_priority}]')(_select_strategic_waypoints(_priority))
+
+
+@benchmark('geo.haversine_km[1000]')
+def haversine():
+    rng = np.random.default_rng(0)
+    lat1, lat2 = rng.uniform(22.4, 22.7, (2, 1000))
+    lng1, lng2 = rng.uniform(88.2, 88.5, (2, 1000))
+    return lambda: geo_utils.haversine_km(lat1, lng1, lat2, lng2)
+
+
+@benchmark('geo.cumulative_distance_km')
+def cumulative_distance():
+    coords = geo_utils.as_coordinate_array(_fixture_route()['coordinates'])
+    return lambda: geo_utils.cumulative_distance_km(coords)
+
+
+@benchmark('geo.interpolate_along[50]')
+def interpolate_along():
+    coords = geo_utils.as_coordinate_array(_fixture_route()['coordinates'])
+    cumulative = geo_utils.cumulative_distance_km(coords)
+    positions = np.linspace(0.0, cumulative[-1], 50)
+    return lambda: geo_utils.interpolate_along(coords, cumulative, positions)
+
+
+@benchmark('geo.bearing_and_destination')
+def bearing_and_destination():
+    optimizer = DijkstraOptimizer()
+    _, (lat1, lng1), (lat2, lng2) = OD_PAIRS[0]
+
+    def run():
+        bearing = optimizer._calculate_bearing(lat1, lng1, lat2, lng2)
+        return optimizer._calculate_destination_point(lat1, lng1, 2.0, bearing)
+    return run
+
+
+@benchmark('aqi.parse_aqi_data')
+def parse_aqi_data():
+    service = AirQualityService()
+    _, (lat, lng), _ = OD_PAIRS[0]
+    # The raw feed, fetched the way the service fetches it
+    payload = upstream_session('waqi').get(f"{service.base_url}/feed/geo:{lat};{lng}/",
+                                           params={'token': service.api_key}, timeout=10).json()['data']
+    return lambda: service._parse_aqi_data(payload)
+
+
+@benchmark('json.JsonResponse')
+def json_response():
+    payload = _route_payload()
+    return lambda: JsonResponse(payload)
+
+
+@benchmark('json.FastJsonResponse')
+def fast_json_response():
+    payload = _route_payload()
+    return lambda: FastJsonResponse(payload)
+
+
+@benchmark('json.dumps')
+def json_dumps():
+    payload = _route_payload()
+    return lambda: json.dumps(payload)
@@ -0,0 +1,155 @@
+"""
+Synthetic road-like graphs with synthetic AQI fields, for reproducible
+routing-engine workloads. A jittered street grid (some streets removed,
+some one-way) is overlaid with faster arterials every few blocks and
+express links along a few of them. Node coordinates span the Kolkata
+service area, so real OD pairs snap onto the graph.
+"""
+import json
+from pathlib import Path
+
+import numpy as np
+
+from route_optimizer.services.geo_utils import haversine_km
+from route_optimizer.services.graph_search import CSRGraph
+
+KOLKATA_BBOX = (22.40, 88.20, 22.75, 88.50)  # SERVICE_AREA_BBOX
+OD_PATH = Path(__file__).resolve().parent / 'fixtures' / 'kolkata_od.json'
+
+STREET_KMPH = 20.0
+ARTERIAL_KMPH = 40.0
+EXPRESS_KMPH = 65.0
+
+
+class RoadGraph:
+    """Directed road graph with per-edge length (km), duration (min) and AQI, all in CSR order"""
+
+    def __init__(self, lats, lngs, sources, targets, length_km, speed_kmph, node_aqi):
+        self.lats = np.asarray(lats, dtype=float)
+        self.lngs = np.asarray(lngs, dtype=float)
+        self.graph = CSRGraph(len(self.lats), np.asarray(sources), np.asarray(targets))
+        self.length_km = self.graph.edge_values(length_km)
+        speed = self.graph.edge_values(speed_kmph)
+        self.duration_min = self.length_km / speed * 60
+        self.max_kmph = float(speed.max())
+        self.node_aqi = np.asarray(node_aqi, dtype=float)
+        owners = np.repeat(np.arange(self.num_nodes), np.diff(self.graph.indptr))
+        self.edge_aqi = (self.node_aqi[owners] + self.node_aqi[self.graph.indices]) / 2
+
+    @property
+    def num_nodes(self) -> int:
+        return self.graph.num_nodes
+
+    @property
+    def num_edges(self) -> int:
+        return len(self.graph.indices)
+
+    def weights(self, metric: str) -> np.ndarray:
+        """'duration' (min) or 'exposure' (AQI·min) per edge"""
+        if metric == 'duration':
+            return self.duration_min
+        if metric == 'exposure':
+            return self.duration_min * self.edge_aqi
+        raise ValueError(f'Unknown metric {metric}')
+
+    def potential(self, target: int, metric: str) -> np.ndarray:
+        """
+        Lower bound on the cost from every node to target: straight-line
+        distance at the top speed (times the lowest AQI for exposure)
+        """
+        km = haversine_km(self.lats, self.lngs, self.lats[target], self.lngs[target])
+        bound = km / self.max_kmph * 60
+        return bound * self.edge_aqi.min() if metric == 'exposure' else bound
+
+    def nearest_node(self, lat: float, lng: float) -> int:
+        return int(np.argmin((self.lats - lat) ** 2 + ((self.lngs - lng) * np.cos(np.radians(lat))) ** 2))
+
+    def nbytes(self) -> int:
+        """Size of the CSR structure and one weight array"""
+        return self.graph.indptr.nbytes + self.graph.indices.nbytes + self.duration_min.nbytes
+
+
+def synthetic_road_graph(num_nodes: int, seed: int = 0, bbox=KOLKATA_BBOX,
+                         arterial_every: int = 8, express_every: int = 4,
+                         street_dropout: float = 0.06, one_way: float = 0.08) -> RoadGraph:
+    """
+    About num_nodes nodes over bbox.
+    arterial_every: blocks between arterial rows/columns
+    express_every: every n-th arterial row/column also has express links
+                   jumping arterial_every nodes at a time
+    """
+    rng = np.random.default_rng(seed)
+    min_lat, min_lng, max_lat, max_lng = bbox
+    height_km = haversine_km(min_lat, min_lng, max_lat, min_lng)
+    width_km = haversine_km(min_lat, min_lng, min_lat, max_lng)
+    rows = max(2, int(round(np.sqrt(num_nodes * height_km / width_km))))
+    cols = max(2, int(round(num_nodes / rows)))
+
+    lat_step = (max_lat - min_lat) / (rows - 1)
+    lng_step = (max_lng - min_lng) / (cols - 1)
+    row, col = np.divmod(np.arange(rows * cols), cols)
+    lats = min_lat + row * lat_step + rng.uniform(-0.3, 0.3, rows * cols) * lat_step
+    lngs = min_lng + col * lng_step + rng.uniform(-0.3, 0.3, rows * cols) * lng_step
+
+    arterial_row = row % arterial_every == 0
+    arterial_col = col % arterial_every == 0
+    sources, targets, speeds = [], [], []
+
+    def add(u, v, kmph, two_way):
+        sources.extend([u, v[two_way]])
+        targets.extend([v, u[two_way]])
+        speeds.extend([kmph, kmph[two_way]])
+
+    # Neighbouring intersections along rows (east) and columns (north)
+    for d_row, d_col, arterial in ((0, 1, arterial_row), (1, 0, arterial_col)):
+        valid = (row + d_row < rows) & (col + d_col < cols)
+        u = np.flatnonzero(valid)
+        v = u + d_row * cols + d_col
+        arterial = arterial[u]
+        keep = arterial | (rng.random(len(u)) >= street_dropout)
+        u, v, arterial = u[keep], v[keep], arterial[keep]
+        kmph = np.where(arterial, ARTERIAL_KMPH, STREET_KMPH) * rng.uniform(0.8, 1.2, len(u))
+        two_way = arterial | (rng.random(len(u)) >= one_way)
+        # One-way streets run in a random direction
+        flip = ~two_way & (rng.random(len(u)) < 0.5)
+        u, v = np.where(flip, v, u), np.where(flip, u, v)
+        add(u, v, kmph, two_way)
+
+    # Express links along some arterials, skipping arterial_every nodes
+    for d_row, d_col, lines in ((0, arterial_every, row), (arterial_every, 0, col)):
+        on_line = (lines % (arterial_every * express_every) == 0)
+        valid = on_line & (row + d_row < rows) & (col + d_col < cols) & arterial_row & arterial_col
+        u = np.flatnonzero(valid)
+        v = u + d_row * cols + d_col
+        kmph = np.full(len(u), EXPRESS_KMPH)
+        add(u, v, kmph, np.ones(len(u), dtype=bool))
+
+    sources = np.concatenate(sources)
+    targets = np.concatenate(targets)
+    speeds = np.concatenate(speeds)
+    length_km = haversine_km(lats[sources], lngs[sources], lats[targets], lngs[targets])
+    length_km = length_km * rng.uniform(1.0, 1.15, len(length_km))  # road circuity
+
+    return RoadGraph(lats, lngs, sources, targets, length_km, speeds,
+                     synthetic_aqi(lats, lngs, arterial_row | arterial_col, rng))
+
+
+def synthetic_aqi(lats, lngs, arterial, rng, hotspots: int = 12) -> np.ndarray:
+    """Smooth background with pollution hotspots plus a traffic increment along arterials"""
+    km_lat = 111.0
+    km_lng = 111.0 * np.cos(np.radians(lats.mean()))
+    aqi = 60.0 + 20.0 * (lats - lats.min()) / (np.ptp(lats) or 1.0)
+    for _ in range(hotspots):
+        h_lat = rng.uniform(lats.min(), lats.max())
+        h_lng = rng.uniform(lngs.min(), lngs.max())
+        sigma_km = rng.uniform(1.0, 3.5)
+        peak = rng.uniform(60.0, 200.0)
+        sq_km = ((lats - h_lat) * km_lat) ** 2 + ((lngs - h_lng) * km_lng) ** 2
+        aqi = aqi + peak * np.exp(-sq_km / (2 * sigma_km ** 2))
+    return np.clip(aqi + np.where(arterial, 25.0, 0.0), 20.0, 500.0)
+
+
+def kolkata_od_pairs(path=OD_PATH):
+    """Fixed Kolkata OD queries: [(name, (lat, lng), (lat, lng)), ...]"""
+    return [(query['name'], tuple(query['origin']), tuple(query['destination']))
+            for query in json.loads(Path(path).read_text())]
@@ -0,0 +1,61 @@
+"""Django setup and timing shared by the benchmark runner and fixture recorder"""
+import logging
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def setup_django():
+    """Configure Django against a throwaway test database; returns a teardown callable"""
+    sys.path.insert(0, str(ROOT))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'delhi_air_route.settings')
+    # Replayed upstreams have no quota to protect; pacing would only add sleeps
+    os.environ.setdefault('UPSTREAM_RATE_LIMIT_ENABLED', 'False')
+    # Time routing, not the shared cache's file I/O, and leave the app's cache alone
+    os.environ.setdefault('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache')
+    import django
+    django.setup()
+    logging.disable(logging.WARNING)  # fixture misses and fallbacks are expected noise
+
+    from django.test.runner import DiscoverRunner
+    from django.test.utils import setup_test_environment, teardown_test_environment
+    setup_test_environment()
+    runner = DiscoverRunner(verbosity=0)
+    databases = runner.setup_databases()
+
+    def teardown():
+        runner.teardown_databases(databases)
+        teardown_test_environment()
+    return teardown
+
+
+def measure(function, min_time: float = 1.0, min_rounds: int = 5, max_rounds: int = 100000,
+            warmup: int = 1) -> dict:
+    """Time repeated calls until min_time has passed (and at least min_rounds calls)"""
+    for _ in range(warmup):
+        function()
+
+    timings = []
+    clock = time.perf_counter
+    deadline = clock() + min_time
+    while len(timings) < max_rounds and (len(timings) < min_rounds or clock() < deadline):
+        started = clock()
+        function()
+        timings.append(clock() - started)
+
+    ms = np.array(timings) * 1000
+    return {
+        'rounds': len(ms),
+        'ops_per_sec': round(float(len(ms) / (ms.sum() / 1000)), 2),
+        'mean_ms': round(float(ms.mean()), 4),
+        'p50_ms': round(float(np.percentile(ms, 50)), 4),
+        'p95_ms': round(float(np.percentile(ms, 95)), 4),
+        'p99_ms': round(float(np.percentile(ms, 99)), 4),
+        'min_ms': round(float(ms.min()), 4),
+        'max_ms': round(float(ms.max()), 4),
+    }
@@ -0,0 +1,306 @@
+"""
+Open-loop HTTP load test: replays a JSONL request log against the app
+served by a real WSGI or ASGI server, with upstreams answered by
+benchmarks.stub_upstream. Each step sends Poisson arrivals at a fixed
+rate, whether or not earlier requests have finished, and reports
+p50/p95/p99 latency (from the scheduled send time), error rate and
+throughput. The first rate that breaks --slo-ms, --max-error-rate or
+keeps up with less than 90% of the offered load is the saturation point.
+
+    python -m benchmarks.loadtest --servers wsgi asgi --rates 5 10 20 40 80
+    python -m benchmarks.loadtest --target http://127.0.0.1:8000 --rates 2 4 8
+    python -m benchmarks.loadtest --make-log 200
+
+Log lines are {"method": "POST", "path": "/api/find-route/", "body": {...}}
+or {"method": "GET", "path": "/api/history/", "query": {...}}.
+"""
+import argparse
+import json
+import os
+import shlex
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+import requests
+
+from . import stub_upstream
+from .fixtures import OD_PAIRS
+from .harness import ROOT
+
+LOG_PATH = Path(__file__).resolve().parent / 'fixtures' / 'load_requests.jsonl'
+RESULTS_DIR = Path(__file__).resolve().parent / 'results'
+
+# {port}, {workers} and {threads} are filled in; run from the repository root
+SERVER_COMMANDS = {
+    'wsgi': 'gunicorn delhi_air_route.wsgi:application --bind 127.0.0.1:{port} '
+            '--workers {workers} --threads {threads} --timeout 120',
+    'asgi': 'uvicorn delhi_air_route.asgi:application --host 127.0.0.1 --port {port} '
+            '--workers {workers} --no-access-log',
+}
+# Share of each endpoint in a generated log
+LOG_MIX = (('find_route', 0.5), ('get_aqi', 0.25), ('compare_routes', 0.15), ('history', 0.1))
+
+
+def make_log(count: int, seed: int = 0):
+    """A request log of `count` calls over the benchmark OD pairs, in LOG_MIX proportions"""
+    rng = np.random.default_rng(seed)
+    names, shares = zip(*LOG_MIX)
+    entries = []
+    for kind in rng.choice(names, size=count, p=shares):
+        _, (lat1, lng1), (lat2, lng2) = OD_PAIRS[rng.integers(len(OD_PAIRS))]
+        # Nudge endpoints so not every request is a route cache hit
+        lat1, lng1, lat2, lng2 = (round(float(v), 5) for v in np.array([lat1, lng1, lat2, lng2])
+                                  + rng.normal(0, 0.004, 4))
+        if kind == 'find_route':
+            body = {'source_lat': lat1, 'source_lng': lng1, 'dest_lat': lat2, 'dest_lng': lng2,
+                    'priority': str(rng.choice(['shortest', 'balanced', 'cleanest']))}
+            entries.append({'method': 'POST', 'path': '/api/find-route/', 'body': body})
+        elif kind == 'compare_routes':
+            body = {'source_lat': lat1, 'source_lng': lng1, 'dest_lat': lat2, 'dest_lng': lng2}
+            entries.append({'method': 'POST', 'path': '/api/compare-routes/', 'body': body})
+        elif kind == 'get_aqi':
+            entries.append({'method': 'POST', 'path': '/api/get-aqi/', 'body': {'lat': lat1, 'lng': lng1}})
+        else:
+            entries.append({'method': 'GET', 'path': '/api/history/'})
+    return entries
+
+
+def load_log(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class AppServer:
+    """The app under a WSGI/ASGI server subprocess, wired to the stub upstreams"""
+
+    def __init__(self, command: str, upstream_url: str, workers: int, threads: int):
+        self.port = _free_port()
+        self.url = f'http://127.0.0.1:{self.port}'
+        self.argv = shlex.split(command.format(port=self.port, workers=workers, threads=threads))
+        self.env = dict(os.environ,
+                        DJANGO_SETTINGS_MODULE='delhi_air_route.settings',
+                        ORS_BASE_URL=upstream_url + stub_upstream.ORS_PREFIX,
+                        WAQI_BASE_URL=upstream_url + stub_upstream.WAQI_PREFIX,
+                        ORS_API_KEY=os.environ.get('ORS_API_KEY', 'stub'),
+                        WAQI_API_KEY=os.environ.get('WAQI_API_KEY', 'stub'))
+        # The stubs have no quota; keep the shared limiter on only when asked
+        self.env.setdefault('UPSTREAM_RATE_LIMIT_ENABLED', 'False')
+        # Requests are stamped like a front proxy would; trust the stamp here
+        self.env.setdefault('ADMISSION_QUEUE_HEADER', 'X-Request-Start')
+        self.process = None
+
+    def __enter__(self):
+        try:
+            self.process = subprocess.Popen(self.argv, cwd=ROOT, env=self.env,
+                                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        except FileNotFoundError:
+            raise SystemExit(f'{self.argv[0]} is not installed; install it or pass --target')
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise SystemExit(f'{self.argv[0]} exited: {self.process.stderr.read().decode()[-2000:]}')
+            try:
+                requests.get(self.url + '/api/history/', timeout=1)
+                return self
+            except requests.RequestException:
+                time.sleep(0.2)
+        self.__exit__()
+        raise SystemExit(f'{self.argv[0]} did not start listening on {self.url}')
+
+    def __exit__(self, *exc):
+        self.process.terminate()
+        try:
+            self.process.wait(10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+
+class LoadGenerator:
+    """Sends log entries round-robin at Poisson arrival times"""
+
+    def __init__(self, base_url: str, entries, timeout: float, max_inflight: int, seed: int = 0):
+        self.base_url = base_url.rstrip('/')
+        self.entries = entries
+        self.timeout = timeout
+        self.max_inflight = max_inflight
+        self.rng = np.random.default_rng(seed)
+        self._local = threading.local()
+        self._next = 0
+
+    def _send(self, entry, scheduled):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        sent = time.perf_counter()
+        try:
+            # Stamped like a front proxy would, so admission control sees the queue
+            response = session.request(entry.get('method', 'GET'), self.base_url + entry['path'],
+                                       params=entry.get('query'), json=entry.get('body'), timeout=self.timeout,
+                                       headers={'X-Request-Start': f't={time.time():.6f}'})
+            outcome = response.status_code
+        except requests.Timeout:
+            outcome = 'timeout'
+        except requests.RequestException:
+            outcome = 'connection'
+        done = time.perf_counter()
+        return entry['path'], outcome, done - scheduled, sent - scheduled, done
+
+    def step(self, rate: float, duration: float) -> dict:
+        gaps = self.rng.exponential(1.0 / rate, int(rate * duration * 1.5) + 10)
+        offsets = np.cumsum(gaps)
+        offsets = offsets[offsets < duration]
+        futures = []
+        with ThreadPoolExecutor(self.max_inflight) as executor:
+            start = time.perf_counter()
+            for offset in offsets:
+                scheduled = start + offset
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                entry = self.entries[self._next % len(self.entries)]
+                self._next += 1
+                futures.append(executor.submit(self._send, entry, scheduled))
+            wait(futures)
+        results = [future.result() for future in futures]
+        return summarize(rate, duration, start, results)
+
+
+def summarize(rate, duration, start, results) -> dict:
+    latency_ms = np.array([r[2] for r in results]) * 1000
+    send_lag_ms = np.array([r[3] for r in results]) * 1000
+    ok = [r for r in results if isinstance(r[1], int) and r[1] < 400]
+    errors = {}
+    for path, outcome, *_ in results:
+        if not (isinstance(outcome, int) and outcome < 400):
+            errors[f'{path} {outcome}'] = errors.get(f'{path} {outcome}', 0) + 1
+    elapsed = max(duration, max((r[4] for r in results), default=start) - start)
+    by_path = {}
+    for path, outcome, latency, *_ in results:
+        by_path.setdefault(path, []).append(latency * 1000)
+
+    def percentiles(values):
+        return {f'p{q}_ms': round(float(np.percentile(values, q)), 1) for q in (50, 95, 99)} if len(values) else {}
+
+    return {
+        'offered_rps': rate,
+        'requests': len(results),
+        'throughput_rps': round(len(ok) / elapsed, 2),
+        'error_rate': round(1 - len(ok) / len(results), 4) if results else 0.0,
+        **percentiles(latency_ms),
+        'max_ms': round(float(latency_ms.max()), 1) if len(latency_ms) else None,
+        # Client-side scheduling delay; if large, the generator rather than the server was the bottleneck
+        'p99_send_lag_ms': round(float(np.percentile(send_lag_ms, 99)), 1) if len(send_lag_ms) else None,
+        'errors': errors,
+        'endpoints': {path: percentiles(np.array(values)) for path, values in sorted(by_path.items())},
+    }
+
+
+def saturated(row, slo_ms, max_error_rate) -> bool:
+    return (row['error_rate'] > max_error_rate or row.get('p99_ms', 0) > slo_ms
+            or row['throughput_rps'] < 0.9 * row['offered_rps'])
+
+
+def run_rates(name, base_url, entries, args):
+    generator = LoadGenerator(base_url, entries, args.timeout, args.max_inflight, args.seed)
+    # Warm caches, imports and connections before measuring
+    generator.step(min(args.rates), min(args.warmup, args.duration))
+    steps, saturation = [], None
+    print(f'\n{name} ({base_url})')
+    print(f"{'offered':>8} {'tput':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'errors':>7} {'lag99':>7}")
+    for rate in sorted(args.rates):
+        row = generator.step(rate, args.duration)
+        steps.append(row)
+        print(f"{rate:>8.1f} {row['throughput_rps']:>8.2f} {row.get('p50_ms', 0):>8.1f} "
+              f"{row.get('p95_ms', 0):>8.1f} {row.get('p99_ms', 0):>8.1f} "
+              f"{row['error_rate']:>7.2%} {row['p99_send_lag_ms']:>7.1f}")
+        if saturated(row, args.slo_ms, args.max_error_rate):
+            saturation = rate
+            if not args.keep_going:
+                break
+    sustained = max((row['offered_rps'] for row in steps
+                     if not saturated(row, args.slo_ms, args.max_error_rate)), default=None)
+    print(f'saturation at {saturation} rps, sustained {sustained} rps' if saturation
+          else f'not saturated up to {max(args.rates)} rps')
+    return {'base_url': base_url, 'saturation_rps': saturation, 'sustained_rps': sustained, 'steps': steps}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--log', default=str(LOG_PATH))
+    parser.add_argument('--make-log', type=int, metavar='N', help='Write an N-request log to --log and exit')
+    parser.add_argument('--servers', nargs='+', choices=sorted(SERVER_COMMANDS), default=['wsgi', 'asgi'])
+    parser.add_argument('--wsgi-cmd', default=SERVER_COMMANDS['wsgi'])
+    parser.add_argument('--asgi-cmd', default=SERVER_COMMANDS['asgi'])
+    parser.add_argument('--target', help='Load an already running server at this URL instead of starting one')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=4, help='Threads per WSGI worker')
+    parser.add_argument('--rates', type=float, nargs='+', default=[5, 10, 20, 40, 80],
+                        help='Offered requests per second, one step each')
+    parser.add_argument('--duration', type=float, default=20.0, help='Seconds per step')
+    parser.add_argument('--warmup', type=float, default=5.0)
+    parser.add_argument('--timeout', type=float, default=30.0)
+    parser.add_argument('--max-inflight', type=int, default=256, help='Client threads')
+    parser.add_argument('--slo-ms', type=float, default=2000.0, help='p99 latency above this is saturated')
+    parser.add_argument('--max-error-rate', type=float, default=0.01)
+    parser.add_argument('--keep-going', action='store_true', help='Run every rate even after saturating')
+    parser.add_argument('--upstream-latency-ms', type=float, default=30.0,
+                        help='Delay the stub upstreams add to every call')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output-dir', default=str(RESULTS_DIR))
+    args = parser.parse_args(argv)
+
+    if args.make_log:
+        Path(args.log).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.log).write_text(''.join(json.dumps(entry) + '\n' for entry in make_log(args.make_log, args.seed)))
+        print(f'Wrote {args.make_log} requests to {args.log}')
+        return 0
+
+    entries = load_log(args.log)
+    report = {
+        'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'log': str(args.log),
+        'duration_s': args.duration,
+        'slo_ms': args.slo_ms,
+        'max_error_rate': args.max_error_rate,
+        'upstream_latency_ms': args.upstream_latency_ms,
+        'servers': {},
+    }
+    if args.target:
+        report['servers']['target'] = run_rates('target', args.target, entries, args)
+    else:
+        upstream, upstream_url = stub_upstream.start(latency_ms=args.upstream_latency_ms)
+        commands = {'wsgi': args.wsgi_cmd, 'asgi': args.asgi_cmd}
+        try:
+            for name in args.servers:
+                with AppServer(commands[name], upstream_url, args.workers, args.threads) as server:
+                    report['servers'][name] = dict(run_rates(name, server.url, entries, args),
+                                                   command=' '.join(server.argv))
+        finally:
+            upstream.shutdown()
+
+    if len(report['servers']) > 1:
+        print('\nsustained rps: ' + ', '.join(f"{name} {result['sustained_rps']}"
+                                              for name, result in report['servers'].items()))
+    output_dir = Path(args.output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    output = output_dir / f"load-{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')}.json"
+    output.write_text(json.dumps(report, indent=2))
+    print(f'Results written to {output}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,39 @@
+"""
+Record the upstream responses the benchmark cases need into the fixture
+file, from the live APIs or the deterministic synthetic backend.
+
+    python -m benchmarks.record --backend live        # needs API keys
+    python -m benchmarks.record --backend synthetic
+"""
+import argparse
+
+from .fixtures import FIXTURE_PATH, OD_PAIRS, Fixtures, LiveBackend, Replay, SyntheticBackend
+from .harness import setup_django
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backend', choices=('live', 'synthetic'), default='synthetic')
+    parser.add_argument('--output', default=str(FIXTURE_PATH))
+    args = parser.parse_args(argv)
+
+    teardown = setup_django()
+    try:
+        from .cases import CASES
+
+        fixtures = Fixtures()
+        backend = LiveBackend() if args.backend == 'live' else SyntheticBackend()
+        with Replay(fixtures, backend):
+            for name, setup in CASES.items():
+                run = setup()
+                # Cases cycling over OD pairs need every pair recorded
+                for _ in range(len(OD_PAIRS)):
+                    run()
+        fixtures.save(args.output)
+        print(f'Recorded {len(fixtures.ors)} ORS and {len(fixtures.waqi)} WAQI responses to {args.output}')
+    finally:
+        teardown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,163 @@
+"""
+Compare point-to-point search variants on synthetic city-scale graphs:
+plain Dijkstra, bidirectional Dijkstra, A* and a contraction hierarchy.
+Reports preprocessing time, query latency, settled nodes and memory, and
+checks every variant returns the same costs as plain Dijkstra.
+
+    python -m benchmarks.routing_engines --nodes 10000 100000
+    python -m benchmarks.routing_engines --nodes 1000000 --algorithms dijkstra bidirectional astar
+    python -m benchmarks.routing_engines --random 200 --metric exposure --no-save
+"""
+import argparse
+import json
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+
+from .harness import ROOT
+
+sys.path.insert(0, str(ROOT))
+
+from route_optimizer.services.graph_search import (  # noqa: E402
+    ContractionHierarchy, astar, bidirectional_dijkstra, dijkstra, reverse_graph,
+)
+
+from .graphs import kolkata_od_pairs, synthetic_road_graph  # noqa: E402
+
+ALGORITHMS = ('dijkstra', 'bidirectional', 'astar', 'ch')
+RESULTS_DIR = Path(__file__).resolve().parent / 'results'
+
+
+def _queries(road, args, rng):
+    if args.random:
+        nodes = rng.integers(0, road.num_nodes, (args.random, 2))
+        return [(f'random-{i}', int(s), int(t)) for i, (s, t) in enumerate(nodes)]
+    return [(name, road.nearest_node(*origin), road.nearest_node(*destination))
+            for name, origin, destination in kolkata_od_pairs()]
+
+
+def _engines(road, weights, metric, algorithms, ch_max_nodes):
+    """name -> (preprocessing seconds, structure bytes, query(source, target) -> (cost, path, settled))"""
+    engines = {}
+    graph = road.graph
+    if 'dijkstra' in algorithms:
+        def plain(source, target):
+            cost, pred_edge, order = dijkstra(graph, source, weights, targets=[target])
+            return cost[target], None, len(order)
+        engines['dijkstra'] = (0.0, road.nbytes(), plain)
+
+    if 'bidirectional' in algorithms:
+        started = time.perf_counter()
+        backward = reverse_graph(graph)
+        backward_weights = backward.edge_values(weights)
+        elapsed = time.perf_counter() - started
+        engines['bidirectional'] = (
+            elapsed, road.nbytes() * 2,
+            lambda s, t: bidirectional_dijkstra(graph, backward, s, t, weights, backward_weights))
+
+    if 'astar' in algorithms:
+        engines['astar'] = (0.0, road.nbytes() + road.lats.nbytes * 2,
+                            lambda s, t: astar(graph, s, t, weights, road.potential(t, metric)))
+
+    if 'ch' in algorithms:
+        if road.num_nodes > ch_max_nodes:
+            print(f'  ch: skipped above --ch-max-nodes {ch_max_nodes} (pure-Python preprocessing)')
+        else:
+            started = time.perf_counter()
+            hierarchy = ContractionHierarchy(graph, weights)
+            elapsed = time.perf_counter() - started
+            print(f'  ch: {hierarchy.num_shortcuts} shortcuts in {elapsed:.1f}s')
+            engines['ch'] = (elapsed, hierarchy.nbytes(), hierarchy.query)
+    return engines
+
+
+def run_size(num_nodes, args):
+    rng = np.random.default_rng(args.seed)
+    started = time.perf_counter()
+    road = synthetic_road_graph(num_nodes, seed=args.seed)
+    build_seconds = time.perf_counter() - started
+    print(f'{road.num_nodes} nodes, {road.num_edges} edges (built in {build_seconds:.1f}s)')
+
+    weights = road.weights(args.metric)
+    queries = _queries(road, args, rng)
+    engines = _engines(road, weights, args.metric, args.algorithms, args.ch_max_nodes)
+
+    reference = {}
+    rows = {}
+    for name, (preprocess, structure_bytes, query) in engines.items():
+        latencies, settled, mismatches = [], [], 0
+        for label, source, target in queries:
+            t0 = time.perf_counter()
+            cost, _, count = query(source, target)
+            latencies.append(time.perf_counter() - t0)
+            settled.append(count)
+            expected = reference.setdefault(label, cost)
+            if not (np.isinf(expected) and np.isinf(cost)) and abs(cost - expected) > 1e-9 * max(1.0, abs(expected)):
+                mismatches += 1
+
+        # Peak Python allocation per query, on a few queries (tracemalloc is slow)
+        peaks = []
+        for _, source, target in queries[:args.memory_queries]:
+            tracemalloc.start()
+            query(source, target)
+            peaks.append(tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+
+        ms = np.array(latencies) * 1000
+        rows[name] = {
+            'preprocess_s': round(preprocess, 3),
+            'structure_mib': round(structure_bytes / 2 ** 20, 2),
+            'query_peak_mib': round(max(peaks) / 2 ** 20, 2) if peaks else None,
+            'queries': len(queries),
+            'p50_ms': round(float(np.percentile(ms, 50)), 3),
+            'p95_ms': round(float(np.percentile(ms, 95)), 3),
+            'mean_ms': round(float(ms.mean()), 3),
+            'mean_settled': round(float(np.mean(settled)), 1),
+            'cost_mismatches': mismatches,
+        }
+        row = rows[name]
+        print(f"  {name:<14} pre {row['preprocess_s']:>8.2f}s  p50 {row['p50_ms']:>9.2f} ms  "
+              f"p95 {row['p95_ms']:>9.2f} ms  settled {row['mean_settled']:>10.0f}  "
+              f"mem {row['structure_mib']:>7.2f}+{row['query_peak_mib']} MiB  mismatches {mismatches}")
+    return {'nodes': road.num_nodes, 'edges': road.num_edges, 'build_s': round(build_seconds, 2),
+            'algorithms': rows}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--nodes', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--algorithms', nargs='+', choices=ALGORITHMS, default=list(ALGORITHMS))
+    parser.add_argument('--metric', choices=('duration', 'exposure'), default='duration')
+    parser.add_argument('--random', type=int, default=0,
+                        help='Use this many random OD pairs instead of the Kolkata queries')
+    parser.add_argument('--ch-max-nodes', type=int, default=20000,
+                        help='Largest graph to build a contraction hierarchy for')
+    parser.add_argument('--memory-queries', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output-dir', default=str(RESULTS_DIR))
+    parser.add_argument('--no-save', action='store_true', help='Print the comparison without writing a result file')
+    args = parser.parse_args(argv)
+
+    report = {
+        'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'metric': args.metric,
+        'queries': f'random-{args.random}' if args.random else 'kolkata_od',
+        'seed': args.seed,
+        'sizes': [run_size(n, args) for n in args.nodes],
+    }
+    if not args.no_save:
+        output_dir = Path(args.output_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        output = output_dir / f"routing-{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')}.json"
+        output.write_text(json.dumps(report, indent=2))
+        print(f'Results written to {output}')
+    mismatched = any(row['cost_mismatches'] for size in report['sizes'] for row in size['algorithms'].values())
+    return 1 if mismatched else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,125 @@
+"""
+Offline benchmark runner: times each case against recorded fixtures,
+writes the results as JSON and flags regressions against a baseline.
+
+    python -m benchmarks.run                      # all cases, compare to last run
+    python -m benchmarks.run -k optimizer --min-time 3
+    python -m benchmarks.run --baseline benchmarks/results/<file>.json --fail-on-regression
+"""
+import argparse
+import json
+import platform
+import subprocess
+import sys
+from datetime import datetime, timezone
+from fnmatch import fnmatch
+from pathlib import Path
+
+from .fixtures import FIXTURE_PATH, Fixtures, Replay
+from .harness import ROOT, measure, setup_django
+
+RESULTS_DIR = Path(__file__).resolve().parent / 'results'
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def _environment() -> dict:
+    import numpy
+    import django
+    return {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'machine': platform.machine(),
+        'platform': platform.platform(),
+        'numpy': numpy.__version__,
+        'django': django.__version__,
+    }
+
+
+def latest_result(directory: Path, exclude: Path = None):
+    files = sorted(p for p in directory.glob('*.json') if p != exclude)
+    return files[-1] if files else None
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> dict:
+    """Per case: p50 ratio to the baseline and 'regression', 'improvement' or 'ok'"""
+    comparison = {}
+    for name, stats in results.items():
+        previous = baseline.get('results', {}).get(name)
+        if not previous or not previous.get('p50_ms'):
+            continue
+        ratio = stats['p50_ms'] / previous['p50_ms']
+        status = 'regression' if ratio > 1 + threshold else 'improvement' if ratio < 1 - threshold else 'ok'
+        comparison[name] = {'baseline_p50_ms': previous['p50_ms'], 'ratio': round(ratio, 3), 'status': status}
+    return comparison
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-k', '--filter', default='*', help='Glob over case names (default: all)')
+    parser.add_argument('--min-time', type=float, default=1.0, help='Seconds to spend per case')
+    parser.add_argument('--max-rounds', type=int, default=100000)
+    parser.add_argument('--fixtures', default=str(FIXTURE_PATH))
+    parser.add_argument('--output-dir', default=str(RESULTS_DIR))
+    parser.add_argument('--baseline', help='Result file to compare against (default: latest in --output-dir)')
+    parser.add_argument('--threshold', type=float, default=0.15,
+                        help='Relative p50 slowdown flagged as a regression (default 0.15)')
+    parser.add_argument('--fail-on-regression', action='store_true', help='Exit 1 if any case regressed')
+    parser.add_argument('--list', action='store_true', help='List case names and exit')
+    args = parser.parse_args(argv)
+
+    pattern = args.filter if any(c in args.filter for c in '*?[') else f'*{args.filter}*'
+    teardown = setup_django()
+    try:
+        from .cases import CASES
+        names = [name for name in CASES if fnmatch(name, pattern)]
+        if args.list:
+            print('\n'.join(names))
+            return 0
+
+        results = {}
+        with Replay(Fixtures.load(args.fixtures)):
+            for name in names:
+                results[name] = measure(CASES[name](), min_time=args.min_time, max_rounds=args.max_rounds)
+                stats = results[name]
+                print(f"{name:<48} {stats['ops_per_sec']:>10.1f} ops/s  p50 {stats['p50_ms']:>9.3f} ms  "
+                      f"p95 {stats['p95_ms']:>9.3f} ms  p99 {stats['p99_ms']:>9.3f} ms")
+    finally:
+        teardown()
+
+    output_dir = Path(args.output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    now = datetime.now(timezone.utc)
+    commit = _git_commit()
+    output = output_dir / f"{now.strftime('%Y%m%dT%H%M%SZ')}-{commit}.json"
+
+    baseline_path = Path(args.baseline) if args.baseline else latest_result(output_dir)
+    report = {
+        'created_at': now.isoformat(timespec='seconds'),
+        'commit': commit,
+        'environment': _environment(),
+        'settings': {'min_time': args.min_time, 'threshold': args.threshold},
+        'results': results,
+    }
+    regressions = []
+    if baseline_path is not None:
+        comparison = compare(results, json.loads(baseline_path.read_text()), args.threshold)
+        report['baseline'] = {'file': baseline_path.name, 'comparison': comparison}
+        regressions = [name for name, row in comparison.items() if row['status'] == 'regression']
+        for name, row in comparison.items():
+            if row['status'] != 'ok':
+                print(f"{row['status'].upper():<12} {name}: p50 x{row['ratio']} vs {baseline_path.name}")
+
+    output.write_text(json.dumps(report, indent=2))
+    print(f'Results written to {output}')
+    return 1 if regressions and args.fail_on_regression else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
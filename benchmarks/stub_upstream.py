@@ -0,0 +1,109 @@
+"""
+Local HTTP stand-in for ORS, Pelias and WAQI, serving the synthetic
+fixture backend's responses, so a running server can be load tested
+without API keys or upstream rate limits. Point the app at it with
+
+    ORS_BASE_URL=http://127.0.0.1:8701/ors WAQI_BASE_URL=http://127.0.0.1:8701/waqi
+
+    python -m benchmarks.stub_upstream --port 8701 --latency-ms 40
+"""
+import argparse
+import json
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, unquote, urlsplit
+
+import numpy as np
+
+from .fixtures import SyntheticBackend
+
+ORS_PREFIX = '/ors'
+WAQI_PREFIX = '/waqi'
+CITY_CENTRE = (22.5726, 88.3639)
+
+
+def _bounds_stations(backend, latlng, spacing_deg=0.03):
+    """A station every spacing_deg inside 'lat1,lng1,lat2,lng2', in /map/bounds/ format"""
+    lat1, lng1, lat2, lng2 = (float(v) for v in latlng.split(','))
+    stations = []
+    for lat in np.arange(min(lat1, lat2), max(lat1, lat2), spacing_deg):
+        for lng in np.arange(min(lng1, lng2), max(lng1, lng2), spacing_deg):
+            feed = backend.waqi(f'/feed/geo:{lat:.4f};{lng:.4f}/', None, None)['data']
+            stations.append({'uid': len(stations) + 1, 'aqi': str(feed['aqi']),
+                             'lat': round(float(lat), 4), 'lon': round(float(lng), 4),
+                             'station': {'name': feed['city']['name'], 'time': feed['time']['iso']}})
+    return {'status': 'ok', 'data': stations}
+
+
+class StubUpstreamHandler(BaseHTTPRequestHandler):
+    backend = SyntheticBackend()
+    latency = 0.0
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status, payload):
+        body = json.dumps(payload, separators=(',', ':')).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _handle(self, post_json=None):
+        if self.latency:
+            time.sleep(self.latency)
+        parts = urlsplit(self.path)
+        path = unquote(parts.path)
+        params = dict(parse_qsl(parts.query))
+        try:
+            if path.startswith(ORS_PREFIX):
+                return self._reply(200, self.backend.ors(None, path[len(ORS_PREFIX):], params, post_json))
+            if path.startswith(WAQI_PREFIX + '/map/bounds'):
+                return self._reply(200, _bounds_stations(self.backend, params['latlng']))
+            if path.startswith(WAQI_PREFIX + '/feed/'):
+                if 'geo:' not in path:  # city feed
+                    path = '/feed/geo:{:.4f};{:.4f}/'.format(*CITY_CENTRE)
+                feed = self.backend.waqi(path, params, None)
+                feed['data']['time']['iso'] = datetime.now(timezone.utc).isoformat(timespec='seconds')
+                return self._reply(200, feed)
+        except (KeyError, ValueError) as e:
+            return self._reply(400, {'error': str(e)})
+        return self._reply(404, {'error': f'No stub for {path}'})
+
+    def do_GET(self):
+        self._handle()
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        self._handle(json.loads(self.rfile.read(length) or b'null'))
+
+
+def start(port: int = 0, latency_ms: float = 0.0):
+    """Serve in a background thread; returns (server, base_url)"""
+    handler = type('Handler', (StubUpstreamHandler,), {'latency': latency_ms / 1000})
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8701)
+    parser.add_argument('--latency-ms', type=float, default=0.0,
+                        help='Delay added to every response, to mimic real upstream round trips')
+    args = parser.parse_args(argv)
+    server, base_url = start(args.port, args.latency_ms)
+    print(f'Stub upstreams on {base_url}: ORS_BASE_URL={base_url}{ORS_PREFIX} WAQI_BASE_URL={base_url}{WAQI_PREFIX}')
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -33,6 +33,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'route_optimizer.middleware.RequestProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -69,6 +70,22 @@ DATABASES = {
 }
 
 
+# Cache shared by every worker process and management command, so a snapshot
+# ingest or pre-warm run from the CLI reaches the servers (route results,
+# snapshot epoch, geocoding). The file cache covers one host; for several,
+# set CACHE_BACKEND=django.core.cache.backends.redis.RedisCache and
+# CACHE_LOCATION=redis://... . CACHE_MAX_ENTRIES applies to the file cache.
+CACHE_BACKEND = config('CACHE_BACKEND', default='django.core.cache.backends.filebased.FileBasedCache')
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': config('CACHE_LOCATION', default=str(BASE_DIR / 'artifacts' / 'cache')),
+    }
+}
+if CACHE_BACKEND.endswith('FileBasedCache'):
+    CACHES['default']['OPTIONS'] = {'MAX_ENTRIES': config('CACHE_MAX_ENTRIES', default=20000, cast=int)}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -111,3 +128,221 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # API Keys
 ORS_API_KEY = config('ORS_API_KEY')
 WAQI_API_KEY = config('WAQI_API_KEY')
+
+# Upstream API roots; point these at benchmarks.stub_upstream for load tests
+ORS_BASE_URL = config('ORS_BASE_URL', default='https://api.openrouteservice.org')
+WAQI_BASE_URL = config('WAQI_BASE_URL', default='https://api.waqi.info')
+
+# Request deadlines: route, compare, departure-window and AQI requests get
+# REQUEST_DEADLINE seconds (0 disables) for all their upstream calls. Each
+# call's timeout is capped by what is left; AQI lookups that no longer fit
+# are skipped and filled from the model, snapshot and climatology, and the
+# route is marked partial. WAQI lookups overlap, on a per-process pool of
+# UPSTREAM_POOL_SIZE threads.
+REQUEST_DEADLINE = config('REQUEST_DEADLINE', default=12.0, cast=float)
+UPSTREAM_MIN_TIMEOUT = config('UPSTREAM_MIN_TIMEOUT', default=0.25, cast=float)
+UPSTREAM_POOL_SIZE = config('UPSTREAM_POOL_SIZE', default=16, cast=int)
+ORS_TIMEOUT = config('ORS_TIMEOUT', default=10.0, cast=float)
+ORS_RETRY_TIMEOUT = config('ORS_RETRY_TIMEOUT', default=20, cast=int)
+WAQI_TIMEOUT = config('WAQI_TIMEOUT', default=10.0, cast=float)
+
+# Hedged upstream reads (off by default): a call still running after the
+# HEDGE_PERCENTILE of that operation's recent latencies (once
+# HEDGE_MIN_SAMPLES are known, never sooner than HEDGE_MIN_DELAY) gets a
+# duplicate, and the first answer wins. Costs extra upstream quota.
+HEDGE_ENABLED = config('HEDGE_ENABLED', default=False, cast=bool)
+HEDGE_PERCENTILE = config('HEDGE_PERCENTILE', default=95.0, cast=float)
+HEDGE_MIN_SAMPLES = config('HEDGE_MIN_SAMPLES', default=20, cast=int)
+HEDGE_MIN_DELAY = config('HEDGE_MIN_DELAY', default=0.05, cast=float)
+
+# Upstream quotas, shared by all worker processes through a sqlite file:
+# (requests per second, burst) per 'service' or 'service.operation' and
+# API key. A call waits for a token up to UPSTREAM_RATE_LIMIT_MAX_WAIT (or
+# the request deadline). Defaults follow the WAQI fair-use rate and the
+# ORS free plan per-minute limits; identical concurrent calls in a process
+# share one request.
+UPSTREAM_RATE_LIMIT_ENABLED = config('UPSTREAM_RATE_LIMIT_ENABLED', default=True, cast=bool)
+UPSTREAM_RATE_LIMIT_DB = BASE_DIR / 'artifacts' / 'upstream_quota.sqlite3'
+UPSTREAM_RATE_LIMIT_MAX_WAIT = config('UPSTREAM_RATE_LIMIT_MAX_WAIT', default=30.0, cast=float)
+UPSTREAM_RATE_LIMITS = {
+    'waqi': (10.0, 10),
+    'ors.directions': (40 / 60, 40),
+    'ors.matrix': (40 / 60, 40),
+    'ors.isochrones': (20 / 60, 20),
+    'pelias': (100 / 60, 100),
+}
+
+# Startup warm-up: serving processes (gunicorn, uvicorn, runserver, ...)
+# import the service modules and load the zone matrix, AQI rasters, forecast
+# layers, AQI model and upstream clients at startup, in a background thread
+# unless STARTUP_WARMUP_BLOCKING. Management commands skip it. With gunicorn
+# --preload use blocking warm-up, so it finishes before workers fork and they
+# share the loaded pages.
+STARTUP_WARMUP = config('STARTUP_WARMUP', default=True, cast=bool)
+STARTUP_WARMUP_BLOCKING = config('STARTUP_WARMUP_BLOCKING', default=False, cast=bool)
+
+# Admission control: each request is served 'live' (live WAQI along the
+# route), 'cached' (snapshot/climatology AQI) or 'shortest_only' (no
+# detours), or shed with a 503, by comparing the request queue, each
+# upstream's p95 latency over the last ADMISSION_WINDOW seconds (against
+# ADMISSION_LATENCY_TARGETS) and its quota backlog (against
+# ADMISSION_QUOTA_BACKLOG seconds). Above ADMISSION_SOFT_PRESSURE of a limit
+# requests start moving down a mode. Batch requests (departure windows,
+# exposure matrices, or any request sent with ADMISSION_CLASS_HEADER: batch)
+# get ADMISSION_BATCH_SHARE of each limit.
+# The queue is the p95 time requests waited for a worker, measured from the
+# timestamp the front proxy puts in ADMISSION_QUEUE_HEADER (nginx:
+# proxy_set_header X-Request-Start "t=${msec}";), against
+# ADMISSION_QUEUE_TARGET seconds. Clients can send that header too, so only
+# set ADMISSION_QUEUE_HEADER behind a proxy that overwrites it on every
+# request; it is off by default. Stamps in the future or over a minute old
+# are ignored. This process's in-flight requests count too, against
+# ADMISSION_MAX_INFLIGHT; that only fills up with threaded or async
+# workers, so set it to about the threads per worker (gunicorn --threads).
+# Sync workers rely on the queue header alone.
+ADMISSION_CONTROL_ENABLED = config('ADMISSION_CONTROL_ENABLED', default=True, cast=bool)
+ADMISSION_QUEUE_HEADER = config('ADMISSION_QUEUE_HEADER', default='')
+ADMISSION_QUEUE_TARGET = config('ADMISSION_QUEUE_TARGET', default=0.5, cast=float)
+ADMISSION_MAX_INFLIGHT = config('ADMISSION_MAX_INFLIGHT', default=4, cast=int)
+ADMISSION_SOFT_PRESSURE = config('ADMISSION_SOFT_PRESSURE', default=0.7, cast=float)
+ADMISSION_LATENCY_TARGETS = {'waqi': 2.0, 'ors': 4.0}
+ADMISSION_WINDOW = config('ADMISSION_WINDOW', default=60.0, cast=float)
+ADMISSION_MIN_SAMPLES = config('ADMISSION_MIN_SAMPLES', default=10, cast=int)
+ADMISSION_QUOTA_BACKLOG = config('ADMISSION_QUOTA_BACKLOG', default=5.0, cast=float)
+ADMISSION_BATCH_SHARE = config('ADMISSION_BATCH_SHARE', default=0.5, cast=float)
+ADMISSION_CLASS_HEADER = config('ADMISSION_CLASS_HEADER', default='X-Request-Class')
+ADMISSION_RETRY_AFTER = config('ADMISSION_RETRY_AFTER', default=5, cast=int)
+
+# Route AQI sampling: initial spacing along the route, the AQI jump between
+# neighbouring readings that triggers refinement, and the per-route lookup cap
+AQI_SAMPLE_SPACING_KM = config('AQI_SAMPLE_SPACING_KM', default=2.0, cast=float)
+AQI_REFINE_THRESHOLD = config('AQI_REFINE_THRESHOLD', default=25.0, cast=float)
+AQI_LOOKUP_BUDGET = config('AQI_LOOKUP_BUDGET', default=12, cast=int)
+
+# Default coordinate precision (decimal places) of encoded polylines in
+# compact route responses; 5 is ~1 m, 6 is ~0.1 m
+ROUTE_POLYLINE_PRECISION = config('ROUTE_POLYLINE_PRECISION', default=5, cast=int)
+
+# Route result cache: origin/destination snap cell size (degrees, ~220 m),
+# entry lifetime, and lifetime of geocoding results
+ROUTE_CACHE_CELL_DEG = config('ROUTE_CACHE_CELL_DEG', default=0.002, cast=float)
+ROUTE_CACHE_TTL = config('ROUTE_CACHE_TTL', default=3600, cast=int)
+GEOCODE_CACHE_TTL = config('GEOCODE_CACHE_TTL', default=7 * 24 * 3600, cast=int)
+
+# Bounding box of the service area: (min_lat, min_lng, max_lat, max_lng)
+SERVICE_AREA_BBOX = (22.40, 88.20, 22.75, 88.50)
+
+# Route cache pre-warming from RouteHistory: number of OD clusters, local
+# time zone for hour-of-day mining, upstream call budget per run and the
+# minimum spacing (seconds) between warmed routes. Peak runs are scheduled
+# externally, e.g. cron: 30 7,17 * * * manage.py prewarm_route_cache --upcoming
+ROUTE_PREWARM_ON_SNAPSHOT = config('ROUTE_PREWARM_ON_SNAPSHOT', default=False, cast=bool)
+PREWARM_TOP_N = config('PREWARM_TOP_N', default=20, cast=int)
+PREWARM_TIME_ZONE = 'Asia/Kolkata'
+PREWARM_UPSTREAM_BUDGET = config('PREWARM_UPSTREAM_BUDGET', default=300, cast=int)
+PREWARM_MIN_INTERVAL = config('PREWARM_MIN_INTERVAL', default=1.0, cast=float)
+
+# Latest station snapshot readings older than this (seconds) are ignored
+AQI_SNAPSHOT_MAX_AGE = config('AQI_SNAPSHOT_MAX_AGE', default=3 * 3600, cast=int)
+
+# Zone-to-zone exposure matrix: grid over SERVICE_AREA_BBOX (rows, cols),
+# road circuity over straight-line distance, average speed, and the artifact
+# store holding the memory-mapped tables
+ZONE_GRID_SHAPE = (20, 20)
+ZONE_CIRCUITY = 1.3
+ZONE_SPEED_KMPH = config('ZONE_SPEED_KMPH', default=20.0, cast=float)
+ZONE_MATRIX_DIR = BASE_DIR / 'artifacts' / 'zone_matrix'
+ZONE_MATRIX_REBUILD_ON_SNAPSHOT = config('ZONE_MATRIX_REBUILD_ON_SNAPSHOT', default=True, cast=bool)
+
+# Many-to-many exposure matrix: most sources (and destinations) per request,
+# and the largest sources x destinations block sent in one ORS matrix call
+EXPOSURE_MATRIX_MAX_LOCATIONS = config('EXPOSURE_MATRIX_MAX_LOCATIONS', default=100, cast=int)
+ORS_MATRIX_MAX_ELEMENTS = config('ORS_MATRIX_MAX_ELEMENTS', default=3500, cast=int)
+
+# Multi-stop routes: most stops per request, how the stop-to-stop matrix is
+# computed ('zone' or 'ors'), and the ORS directions waypoint limit
+MULTI_STOP_MAX_STOPS = config('MULTI_STOP_MAX_STOPS', default=50, cast=int)
+MULTI_STOP_MATRIX_MODE = config('MULTI_STOP_MATRIX_MODE', default='zone')
+ORS_MAX_WAYPOINTS = config('ORS_MAX_WAYPOINTS', default=50, cast=int)
+
+# Time-dependent routing: hours of forecast layers kept in memory, the local
+# clock they follow, relative AQI by local hour (Kolkata: night and morning
+# peaks, mid-afternoon low), and the departure-time granularity of cached routes
+AQI_FORECAST_HOURS = config('AQI_FORECAST_HOURS', default=24, cast=int)
+AQI_FORECAST_TIME_ZONE = PREWARM_TIME_ZONE
+AQI_DIURNAL_PROFILE = (
+    1.20, 1.18, 1.15, 1.12, 1.10, 1.10, 1.12, 1.16, 1.18, 1.12, 1.02, 0.92,
+    0.84, 0.78, 0.74, 0.74, 0.78, 0.86, 0.98, 1.08, 1.14, 1.18, 1.20, 1.21,
+)
+ROUTE_CACHE_DEPARTURE_SLOT = config('ROUTE_CACHE_DEPARTURE_SLOT', default=900, cast=int)
+
+# Most departure slots scored by one departure-window request
+DEPARTURE_WINDOW_MAX_SLOTS = config('DEPARTURE_WINDOW_MAX_SLOTS', default=96, cast=int)
+
+# AQI model used for sample points whose WAQI reading is missing or older
+# than AQI_READING_MAX_AGE (seconds). Feature defaults are the training means.
+# A model published to AQI_MODEL_STORE_DIR (train_aqi_model --install,
+# export_aqi_model --publish) is served first, then the shipped .npz
+# artifact (manage.py export_aqi_model), then the pickles.
+AQI_MODEL_STORE_DIR = BASE_DIR / 'artifacts' / 'served_aqi_model'
+AQI_MODEL_ARTIFACT_PATH = BASE_DIR / 'training' / 'aqi_model.npz'
+AQI_MODEL_PATH = BASE_DIR / 'training' / 'aqi_prediction_model.pkl'
+AQI_SCALER_PATH = BASE_DIR / 'training' / 'feature_scaler.pkl'
+# Load the model in the startup warm-up rather than on first use
+AQI_MODEL_PRELOAD = config('AQI_MODEL_PRELOAD', default=True, cast=bool)
+AQI_READING_MAX_AGE = config('AQI_READING_MAX_AGE', default=3 * 3600, cast=int)
+AQI_MODEL_FEATURE_DEFAULTS = {
+    'pm25': 150.0, 'pm10': 200.0, 'no2': 80.0, 'co': 15.0, 'o3': 60.0,
+    'temperature': 28.0, 'humidity': 60.0, 'wind_speed': 8.0,
+}
+
+# Hour-of-week climatology from the AQIReading history: fallback AQI where no
+# live reading or snapshot station covers a point, and the hourly shape of
+# forecast layers. Days of history used, fewest readings for a station's
+# hour-of-week bin to count, and the artifact store holding the arrays.
+# Rebuilt nightly, e.g. cron: 15 2 * * * manage.py build_climatology
+CLIMATOLOGY_DAYS = config('CLIMATOLOGY_DAYS', default=365, cast=int)
+CLIMATOLOGY_MIN_SAMPLES = config('CLIMATOLOGY_MIN_SAMPLES', default=3, cast=int)
+CLIMATOLOGY_DIR = BASE_DIR / 'artifacts' / 'climatology'
+
+# Versioned artifact stores (zone matrix, climatology, served AQI model):
+# every worker memory-maps the current version read-only, so the data is in
+# memory once per host. Publishing swaps a `current` symlink; workers check
+# it at most every ARTIFACT_RELOAD_INTERVAL seconds and switch without a
+# restart. The newest ARTIFACT_KEEP_VERSIONS versions are kept on disk.
+ARTIFACT_RELOAD_INTERVAL = config('ARTIFACT_RELOAD_INTERVAL', default=1.0, cast=float)
+ARTIFACT_KEEP_VERSIONS = config('ARTIFACT_KEEP_VERSIONS', default=3, cast=int)
+
+# Logging goes through a queue drained by a background thread, so request
+# threads never block on stderr. Stage timings and upstream call counts are
+# exposed separately at /metrics.
+LOG_LEVEL = config('LOG_LEVEL', default='INFO')
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'plain': {'format': '%(asctime)s %(levelname)s %(name)s: %(message)s'},
+    },
+    'handlers': {
+        'queue': {
+            'class': 'route_optimizer.log_queue.QueueLogHandler',
+            'formatter': 'plain',
+        },
+    },
+    'root': {'handlers': ['queue'], 'level': 'WARNING'},
+    'loggers': {
+        'django': {'handlers': ['queue'], 'level': 'INFO', 'propagate': False},
+        'route_optimizer': {'handlers': ['queue'], 'level': LOG_LEVEL, 'propagate': False},
+    },
+}
+
+# Request profiling (off by default; the middleware then removes itself).
+# Staff profile a request with the header or ?profile=1; a fraction of all
+# requests can also be sampled. 'sampling' stores collapsed stacks for flame
+# graphs (a sample every REQUEST_PROFILING_INTERVAL seconds), 'cprofile' a
+# deterministic pstats table. Slowest requests are listed in the admin.
+REQUEST_PROFILING_ENABLED = config('REQUEST_PROFILING_ENABLED', default=False, cast=bool)
+REQUEST_PROFILING_HEADER = 'X-Profile'
+REQUEST_PROFILING_SAMPLE_RATE = config('REQUEST_PROFILING_SAMPLE_RATE', default=0.0, cast=float)
+REQUEST_PROFILING_PROFILER = config('REQUEST_PROFILING_PROFILER', default='sampling')
+REQUEST_PROFILING_INTERVAL = config('REQUEST_PROFILING_INTERVAL', default=0.005, cast=float)
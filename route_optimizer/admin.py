@@ -1,5 +1,8 @@
 from django.contrib import admin
-from .models import Location, RouteHistory
+from django.http import HttpResponse
+from django.urls import path, reverse
+from django.utils.html import format_html
+from .models import AQIReading, Location, RequestProfile, RouteHistory
 
 @admin.register(Location)
 class LocationAdmin(admin.ModelAdmin):
@@ -15,3 +18,41 @@ class RouteHistoryAdmin(admin.ModelAdmin):
     search_fields = ['source_name', 'destination_name']
     ordering = ['-created_at']
     readonly_fields = ['created_at']
+
+@admin.register(AQIReading)
+class AQIReadingAdmin(admin.ModelAdmin):
+    list_display = ['station_name', 'aqi', 'pm25', 'pm10', 'observed_at']
+    search_fields = ['station_name']
+    list_filter = ['observed_at']
+    ordering = ['-observed_at']
+
+@admin.register(RequestProfile)
+class RequestProfileAdmin(admin.ModelAdmin):
+    """Profiled requests, slowest first; profiles download as text for flame graph tools"""
+    list_display = ['path', 'method', 'duration_ms', 'status_code', 'profiler', 'trigger', 'username', 'created_at']
+    list_filter = ['profiler', 'trigger', 'path', 'created_at']
+    search_fields = ['path', 'query', 'body']
+    ordering = ['-duration_ms']
+    readonly_fields = ['method', 'path', 'query', 'body', 'status_code', 'duration_ms', 'profiler',
+                       'trigger', 'username', 'created_at', 'download', 'profile']
+
+    def has_add_permission(self, request):
+        return False
+
+    def get_urls(self):
+        return [
+            path('<int:pk>/download/', self.admin_site.admin_view(self.download_view),
+                 name='route_optimizer_requestprofile_download'),
+        ] + super().get_urls()
+
+    def download_view(self, request, pk):
+        profile = self.get_object(request, pk)
+        response = HttpResponse(profile.profile, content_type='text/plain; charset=utf-8')
+        suffix = 'folded' if profile.profiler == 'sampling' else 'txt'
+        response['Content-Disposition'] = f'attachment; filename="profile-{pk}.{suffix}"'
+        return response
+
+    @admin.display(description='Download')
+    def download(self, obj):
+        return format_html('<a href="{}">profile-{}</a>',
+                           reverse('admin:route_optimizer_requestprofile_download', args=[obj.pk]), obj.pk)
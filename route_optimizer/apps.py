@@ -4,3 +4,14 @@ from django.apps import AppConfig
 class RouteOptimizerConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'route_optimizer'
+
+    def ready(self):
+        from django.conf import settings
+        from . import signals  # noqa: F401  (connects signal receivers)
+
+        if settings.STARTUP_WARMUP:
+            # Load modules, artifacts and clients once per serving process
+            # instead of on its first requests; CLI commands skip this
+            from .warmup import is_serving_process, start_warmup
+            if is_serving_process():
+                start_warmup(background=not settings.STARTUP_WARMUP_BLOCKING)
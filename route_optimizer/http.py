@@ -0,0 +1,27 @@
+import json
+from django.http import HttpResponse
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+
+def dumps(data) -> bytes:
+    """
+    Serialize to compact JSON bytes, using orjson when it is installed
+    """
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(data, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+class FastJsonResponse(HttpResponse):
+    """
+    JsonResponse replacement for large payloads: no indentation or spacing,
+    and orjson's encoder when available
+    """
+
+    def __init__(self, data, **kwargs):
+        kwargs.setdefault('content_type', 'application/json')
+        super().__init__(content=dumps(data), **kwargs)
@@ -0,0 +1,38 @@
+"""
+Non-blocking logging: request threads only put records on a queue, and a
+single background thread writes them out.
+"""
+import atexit
+import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
+
+
+class QueueLogHandler(QueueHandler):
+    """
+    Hands formatted records to a background listener writing to stderr
+    (or `stream`). When the queue is full records are dropped and counted
+    rather than blocking the request.
+    """
+
+    def __init__(self, stream=None, maxsize: int = 10000):
+        super().__init__(queue.Queue(maxsize))
+        self.dropped = 0
+        self.listener = QueueListener(self.queue, logging.StreamHandler(stream))
+        self.listener.start()
+        atexit.register(self._stop_listener)
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def _stop_listener(self):
+        # Flushes queued records; safe to call more than once
+        if self.listener._thread is not None:
+            self.listener.stop()
+
+    def close(self):
+        self._stop_listener()
+        super().close()
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from route_optimizer.services.climatology import ClimatologyBuilder
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the hour-of-week AQI climatology from the ingested reading history (run nightly)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None,
+                            help='Days of history to aggregate (default: CLIMATOLOGY_DAYS)')
+        parser.add_argument('--chunk-size', type=int, default=10000,
+                            help='Readings fetched per database round trip')
+
+    def handle(self, *args, **options):
+        builder = ClimatologyBuilder(days=options['days'], chunk_size=options['chunk_size'])
+        meta = builder.build_and_save()
+        grid = meta['grid']
+        self.stdout.write(self.style.SUCCESS(
+            f"Built {grid['rows']}x{grid['cols']} hour-of-week climatology for {', '.join(meta['fields'])} "
+            f"from {meta['readings']} readings at {meta['stations']} stations in {meta['build_seconds']}s "
+            f"(version {meta['version']})"
+        ))
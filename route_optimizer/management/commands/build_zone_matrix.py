@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from route_optimizer.services.zone_matrix import ZoneMatrixBuilder
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the zone-to-zone distance/duration/exposure matrix from the latest AQI snapshot'
+
+    def handle(self, *args, **options):
+        builder = ZoneMatrixBuilder()
+        meta = builder.build_and_save()
+        grid = meta['grid']
+        self.stdout.write(self.style.SUCCESS(
+            f"Built {grid['rows']}x{grid['cols']} zone matrix for {', '.join(meta['priorities'])} "
+            f"from {meta['stations']} stations in {meta['build_seconds']}s (version {meta['version']})"
+        ))
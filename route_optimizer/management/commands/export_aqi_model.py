@@ -0,0 +1,37 @@
+import pickle
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from route_optimizer.services.aqi_model import export_linear_model
+
+
+class Command(BaseCommand):
+    help = 'Export the trained AQI model and scaler pickles as a NumPy coefficient artifact'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--model', default=str(settings.AQI_MODEL_PATH),
+                            help='Pickled linear model')
+        parser.add_argument('--scaler', default=str(settings.AQI_SCALER_PATH),
+                            help='Pickled StandardScaler')
+        parser.add_argument('--output', default=str(settings.AQI_MODEL_ARTIFACT_PATH),
+                            help='.npz artifact to write')
+        parser.add_argument('--publish', action='store_true',
+                            help='Also publish it as the served model (AQI_MODEL_STORE_DIR)')
+
+    def handle(self, *args, **options):
+        with open(options['model'], 'rb') as f:
+            model = pickle.load(f)
+        with open(options['scaler'], 'rb') as f:
+            scaler = pickle.load(f)
+
+        try:
+            exported = export_linear_model(model, scaler, options['output'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        version = exported.publish() if options['publish'] else None
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Exported {type(model).__name__} to {options['output']}"
+            + (f", published as version {version}" if version else '')
+        ))
@@ -0,0 +1,65 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from route_optimizer.models import AQIReading, Location
+from route_optimizer.services.air_quality_service import AirQualityService
+from route_optimizer.signals import aqi_snapshot_ingested
+
+
+class Command(BaseCommand):
+    help = 'Fetch the current AQI of every station in the service area and publish it as a new snapshot'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--detailed', action='store_true',
+                            help='Also fetch per-pollutant readings for each station (one request per station)')
+
+    def handle(self, *args, **options):
+        aqi_service = AirQualityService()
+        stations = aqi_service.get_stations_in_bounds(*settings.SERVICE_AREA_BBOX)
+        if not stations:
+            self.stderr.write('No stations returned; keeping the current snapshot')
+            return
+
+        now = timezone.now()
+        history = []
+        for station in stations:
+            defaults = {
+                'latitude': station['lat'],
+                'longitude': station['lng'],
+                'overall_aqi': station['aqi'],
+            }
+            observation = {
+                'station_name': station['name'],
+                'latitude': station['lat'],
+                'longitude': station['lng'],
+                'aqi': station['aqi'],
+                'observed_at': parse_datetime(station['time'] or '') or now,
+            }
+            if options['detailed']:
+                reading = aqi_service.get_aqi_by_coordinates(station['lat'], station['lng'])
+                if reading:
+                    defaults.update({
+                        'aqi_pm25': reading.get('pm25') or None,
+                        'aqi_pm10': reading.get('pm10') or None,
+                        'aqi_no2': reading.get('no2') or None,
+                        'aqi_co': reading.get('co') or None,
+                        'aqi_o3': reading.get('o3') or None,
+                    })
+                    # 0 marks an unreported pollutant, but is a real temperature or wind speed
+                    observation.update({field: reading.get(field) or None
+                                        for field in ('pm25', 'pm10', 'no2', 'co', 'o3')})
+                    observation.update({field: reading.get(field)
+                                        for field in ('temperature', 'humidity', 'wind_speed')})
+
+            Location.objects.update_or_create(name=station['name'], defaults=defaults)
+            history.append(AQIReading(**observation))
+
+        # Training history; a station's observation is only stored once
+        AQIReading.objects.bulk_create(history, ignore_conflicts=True)
+
+        epoch = int(time.time())
+        aqi_snapshot_ingested.send(sender=Location, epoch=epoch, stations=len(stations))
+        self.stdout.write(self.style.SUCCESS(f'Ingested {len(stations)} stations (snapshot epoch {epoch})'))
@@ -0,0 +1,44 @@
+from datetime import timedelta
+from zoneinfo import ZoneInfo
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from route_optimizer.services.route_prewarmer import RoutePrewarmer
+
+
+class Command(BaseCommand):
+    help = 'Warm the route cache for the most requested origin-destination pairs in RouteHistory'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=settings.PREWARM_TOP_N,
+                            help='Number of OD clusters to warm')
+        parser.add_argument('--hour', type=int, default=None,
+                            help='Only mine requests made at this local hour (0-23)')
+        parser.add_argument('--upcoming', action='store_true',
+                            help='Mine the local hour starting next (for runs ahead of a peak)')
+        parser.add_argument('--days', type=int, default=14,
+                            help='History window in days')
+        parser.add_argument('--budget', type=int, default=settings.PREWARM_UPSTREAM_BUDGET,
+                            help='Maximum estimated upstream (ORS + WAQI) calls')
+
+    def handle(self, *args, **options):
+        hour = options['hour']
+        if options['upcoming']:
+            local_now = timezone.now().astimezone(ZoneInfo(settings.PREWARM_TIME_ZONE))
+            hour = (local_now + timedelta(hours=1)).hour
+
+        report = RoutePrewarmer().prewarm(
+            top_n=options['top'],
+            hour=hour,
+            days=options['days'],
+            upstream_budget=options['budget']
+        )
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Warmed {report['warmed']} routes for {report['pairs']} OD pairs "
+            f"({report['already_warm']} already warm, {report['failed']} failed, "
+            f"{report['skipped_over_budget']} over budget, ~{report['upstream_calls']} upstream calls); "
+            f"coverage {report['coverage']:.1%}"
+        ))
@@ -0,0 +1,23 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from route_optimizer.warmup import run_warmup
+
+# Imports that should stay out of CLI startup (loaded by the views or the warm-up)
+HEAVY_MODULES = ('numpy', 'requests', 'openrouteservice', 'sklearn', 'pandas', 'scipy')
+
+
+class Command(BaseCommand):
+    help = 'Time each startup warm-up step in this process, and list heavy modules loaded by Django setup'
+
+    def handle(self, *args, **options):
+        preloaded = [name for name in HEAVY_MODULES if name in sys.modules]
+        self.stdout.write(f"Heavy modules loaded by setup: {', '.join(preloaded) or 'none'}")
+
+        report = run_warmup()
+        for name, step in report['steps'].items():
+            status = '' if step['ok'] else '  FAILED (see log)'
+            self.stdout.write(f"  {name:<18} {step['seconds'] * 1000:8.1f} ms{status}")
+        style = self.style.SUCCESS if all(step['ok'] for step in report['steps'].values()) else self.style.WARNING
+        self.stdout.write(style(f"Warm-up took {report['seconds'] * 1000:.0f} ms"))
@@ -0,0 +1,61 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from route_optimizer.services.model_training import AQIModelTrainer, MODEL_ALPHAS
+
+
+class Command(BaseCommand):
+    help = 'Train the AQI model on the ingested reading history and write its artifacts and metrics CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--folds', type=int, default=5, help='Cross-validation folds')
+        parser.add_argument('--test-size', type=float, default=0.2, help='Share of readings held out for testing')
+        parser.add_argument('--chunk-size', type=int, default=10000, help='Readings streamed per chunk')
+        parser.add_argument('--jobs', type=int, default=None, help='Worker processes (default: all cores)')
+        parser.add_argument('--days', type=int, default=None, help='Only use readings from the last N days')
+        parser.add_argument('--ridge-alpha', type=float, default=MODEL_ALPHAS['Ridge Regression'],
+                            help='Penalty of the ridge model on standardized features')
+        parser.add_argument('--output-dir', default=str(settings.BASE_DIR / 'artifacts' / 'aqi_model'),
+                            help='Where the model artifact and metrics CSV are written')
+        parser.add_argument('--install', action='store_true',
+                            help='Also publish the best model as the served model')
+
+    def handle(self, *args, **options):
+        if options['folds'] < 2 or not 0 < options['test_size'] < 1:
+            raise CommandError('Need at least 2 folds and a test size between 0 and 1')
+
+        trainer = AQIModelTrainer(
+            folds=options['folds'],
+            test_size=options['test_size'],
+            chunk_size=options['chunk_size'],
+            jobs=options['jobs'],
+            days=options['days'],
+            alphas={'Linear Regression': 0.0, 'Ridge Regression': options['ridge_alpha']},
+        )
+
+        started = time.time()
+        try:
+            report = trainer.train()
+        except ValueError as e:
+            raise CommandError(str(e))
+        paths = trainer.write_artifacts(report, options['output_dir'])
+
+        for row in report['metrics']:
+            # No CV score when no fold had enough readings
+            cv_r2 = 'n/a' if row['CV R² Mean'] is None else f"{row['CV R² Mean']:.4f}"
+            self.stdout.write(f"{row['Model']:<20} RMSE {row['Test RMSE']:.3f}  R² {row['Test R²']:.4f}  "
+                              f"MAE {row['Test MAE']:.3f}  CV R² {cv_r2}")
+
+        version = None
+        if options['install']:
+            # Workers switch to the new version without a restart
+            version = report['models'][report['best']].publish()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Trained on {report['rows']} readings with {trainer.jobs} workers in "
+            f"{time.time() - started:.1f}s; best {report['best']} -> {paths['model']}, "
+            f"metrics -> {paths['metrics']}"
+            + (f", published as {settings.AQI_MODEL_STORE_DIR} version {version}" if version else '')
+        ))
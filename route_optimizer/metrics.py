@@ -0,0 +1,218 @@
+"""
+In-process request metrics: time spent in each route pipeline stage and
+calls, errors and latency of every upstream API, rendered in the
+Prometheus text exposition format. Each worker process keeps its own
+registry, so scrape every worker (or aggregate by instance).
+"""
+import math
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, Dict, List, Optional, Sequence, Tuple
+
+# Seconds; spans from sub-millisecond cache hits to slow upstream calls
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _label_text(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    """Monotonic count per label combination"""
+
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(tuple(str(labels[name]) for name in self.labelnames), 0.0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f'{self.name}{_label_text(self.labelnames, key)} {value:g}' for key, value in values]
+
+
+class Histogram:
+    """Cumulative bucket counts, sum and count of observations per label combination"""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # key -> [per-bucket counts (last is +Inf)..., sum]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            row = self._values.get(key)
+            if row is None:
+                row = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            row[index] += 1
+            row[-1] += value
+
+    def count(self, **labels) -> int:
+        row = self._values.get(tuple(str(labels[name]) for name in self.labelnames))
+        return int(sum(row[:-1])) if row else 0
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = sorted((key, list(row)) for key, row in self._values.items())
+        lines = []
+        for key, row in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), row[:-1]):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else f'{bound:g}'
+                labels = _label_text(self.labelnames, key, 'le="' + le + '"')
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _label_text(self.labelnames, key)
+            lines.append(f'{self.name}_sum{labels} {row[-1]:.6f}')
+            lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+class LatencyTracker:
+    """
+    Recent call latencies per (service, operation), failures included (a
+    timeout is the slowest kind of call), for hedge delays and admission
+    """
+
+    def __init__(self, window: int = 200):
+        self.window = window
+        self._samples: Dict[Tuple[str, str], Deque[Tuple[float, float]]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, key: Tuple[str, str], seconds: float):
+        with self._lock:
+            samples = self._samples.get(key)
+            if samples is None:
+                samples = self._samples[key] = deque(maxlen=self.window)
+            samples.append((time.monotonic(), seconds))
+
+    def percentile(self, key: Tuple[str, str], q: float, min_samples: int,
+                   max_age: Optional[float] = None) -> Optional[float]:
+        """q-th percentile of the last `window` calls (only those within max_age seconds)"""
+        since = time.monotonic() - max_age if max_age is not None else -math.inf
+        with self._lock:
+            samples = [seconds for at, seconds in self._samples.get(key, ()) if at >= since]
+        if len(samples) < min_samples:
+            return None
+        # Linear interpolation between order statistics, as numpy.percentile
+        samples.sort()
+        rank = (len(samples) - 1) * q / 100
+        low = math.floor(rank)
+        high = min(low + 1, len(samples) - 1)
+        return samples[low] + (samples[high] - samples[low]) * (rank - low)
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    'route_stage_duration_seconds', 'Time spent in each route pipeline stage', ('stage',)))
+UPSTREAM_REQUESTS = REGISTRY.register(Counter(
+    'upstream_requests_total', 'Calls made to upstream APIs', ('service', 'operation')))
+UPSTREAM_ERRORS = REGISTRY.register(Counter(
+    'upstream_errors_total', 'Upstream API calls that raised or returned an error status',
+    ('service', 'operation')))
+UPSTREAM_SECONDS = REGISTRY.register(Histogram(
+    'upstream_request_duration_seconds', 'Latency of upstream API calls', ('service', 'operation')))
+# Raw recent latencies, for hedge delays and admission control
+LATENCIES = LatencyTracker()
+UPSTREAM_HEDGES = REGISTRY.register(Counter(
+    'upstream_hedged_requests_total', 'Duplicate requests sent because an upstream call was slow',
+    ('service', 'operation')))
+UPSTREAM_COALESCED = REGISTRY.register(Counter(
+    'upstream_coalesced_requests_total', 'Calls answered by an identical call already in flight',
+    ('service', 'operation')))
+UPSTREAM_QUOTA_WAIT_SECONDS = REGISTRY.register(Histogram(
+    'upstream_quota_wait_seconds', 'Time spent waiting for a shared upstream quota token',
+    ('service', 'operation')))
+UPSTREAM_QUOTA_REJECTIONS = REGISTRY.register(Counter(
+    'upstream_quota_rejections_total', 'Calls not made because no quota token came in time',
+    ('service', 'operation')))
+DEADLINE_SKIPS = REGISTRY.register(Counter(
+    'upstream_deadline_skips_total', 'Upstream calls skipped or abandoned when the request deadline ran low',
+    ('service', 'operation')))
+STARTUP_SECONDS = REGISTRY.register(Histogram(
+    'startup_step_duration_seconds', 'Time spent in each startup warm-up step', ('step',)))
+# Time requests waited before a worker picked them up (X-Request-Start), for admission
+QUEUE_WAITS = LatencyTracker()
+REQUEST_QUEUE_SECONDS = REGISTRY.register(Histogram(
+    'request_queue_duration_seconds', 'Time requests waited between the front proxy and a worker',
+    ('request_class',)))
+ADMISSION_DECISIONS = REGISTRY.register(Counter(
+    'admission_decisions_total', 'Requests by the service mode they were admitted in (or shed)',
+    ('request_class', 'mode')))
+ROUTE_CACHE_LOOKUPS = REGISTRY.register(Counter(
+    'route_cache_lookups_total', 'Whole-route cache lookups by result (hit or miss)', ('result',)))
+
+
+@contextmanager
+def span(stage: str):
+    """Time a pipeline stage (geocode, base_route, detour, aqi_fanout, ...)"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - started, stage=stage)
+
+
+@contextmanager
+def upstream_call(service: str, operation: str):
+    """Count and time one upstream call; an exception escaping it counts as an error"""
+    UPSTREAM_REQUESTS.inc(service=service, operation=operation)
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        UPSTREAM_ERRORS.inc(service=service, operation=operation)
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        UPSTREAM_SECONDS.observe(elapsed, service=service, operation=operation)
+        LATENCIES.observe((service, operation), elapsed)
@@ -0,0 +1,75 @@
+import json
+import logging
+import random
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from .profiling import profile_call
+
+logger = logging.getLogger(__name__)
+
+# Request body stored with a profile is cut to this many characters
+PROFILE_BODY_LIMIT = 10000
+
+
+class RequestProfilingMiddleware:
+    """
+    Profiles opted-in requests and stores the result as a RequestProfile.
+    Staff opt in per request with the REQUEST_PROFILING_HEADER header or
+    ?profile=1; any request is also sampled at REQUEST_PROFILING_SAMPLE_RATE.
+    Removed from the middleware chain at startup unless
+    REQUEST_PROFILING_ENABLED, so there is no per-request cost when off.
+    """
+
+    def __init__(self, get_response):
+        if not settings.REQUEST_PROFILING_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.header = 'HTTP_' + settings.REQUEST_PROFILING_HEADER.upper().replace('-', '_')
+        self.sample_rate = settings.REQUEST_PROFILING_SAMPLE_RATE
+        self.profiler = settings.REQUEST_PROFILING_PROFILER
+        self.interval = settings.REQUEST_PROFILING_INTERVAL
+
+    def __call__(self, request):
+        trigger = self._trigger(request)
+        if trigger is None:
+            return self.get_response(request)
+
+        response, elapsed, report = profile_call(lambda: self.get_response(request),
+                                                 self.profiler, self.interval)
+        self._save(request, response, elapsed, report, trigger)
+        return response
+
+    def _trigger(self, request):
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_staff and (
+                request.META.get(self.header) or request.GET.get('profile')):
+            return 'staff'
+        if self.sample_rate > 0 and random.random() < self.sample_rate:
+            return 'sample'
+        return None
+
+    def _save(self, request, response, elapsed, report, trigger):
+        from .models import RequestProfile
+
+        try:
+            body = request.body.decode('utf-8', errors='replace')[:PROFILE_BODY_LIMIT]
+        except Exception:  # body already streamed by the view
+            body = ''
+        try:
+            RequestProfile.objects.create(
+                method=request.method,
+                path=request.path,
+                query=json.dumps(request.GET.dict()),
+                body=body,
+                status_code=response.status_code,
+                duration_ms=elapsed * 1000,
+                profiler=self.profiler,
+                trigger=trigger,
+                username=request.user.get_username() if getattr(request, 'user', None) else '',
+                profile=report,
+            )
+        except Exception as e:
+            # Never fail the request because its profile could not be stored
+            logger.warning("Could not save request profile for %s: %s", request.path, e)
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('route_optimizer', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AQIReading',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('station_name', models.CharField(max_length=200)),
+                ('latitude', models.FloatField()),
+                ('longitude', models.FloatField()),
+                ('aqi', models.FloatField()),
+                ('pm25', models.FloatField(blank=True, null=True)),
+                ('pm10', models.FloatField(blank=True, null=True)),
+                ('no2', models.FloatField(blank=True, null=True)),
+                ('co', models.FloatField(blank=True, null=True)),
+                ('o3', models.FloatField(blank=True, null=True)),
+                ('temperature', models.FloatField(blank=True, null=True)),
+                ('humidity', models.FloatField(blank=True, null=True)),
+                ('wind_speed', models.FloatField(blank=True, null=True)),
+                ('observed_at', models.DateTimeField(db_index=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['-observed_at'],
+                'constraints': [models.UniqueConstraint(fields=('station_name', 'observed_at'), name='unique_station_observation')],
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('route_optimizer', '0002_aqireading'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RequestProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('method', models.CharField(max_length=10)),
+                ('path', models.CharField(max_length=500)),
+                ('query', models.TextField(blank=True)),
+                ('body', models.TextField(blank=True)),
+                ('status_code', models.PositiveSmallIntegerField()),
+                ('duration_ms', models.FloatField(db_index=True)),
+                ('profiler', models.CharField(max_length=20)),
+                ('trigger', models.CharField(choices=[('staff', 'Staff opt-in'), ('sample', 'Random sample')], max_length=10)),
+                ('username', models.CharField(blank=True, max_length=150)),
+                ('profile', models.TextField()),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'ordering': ['-duration_ms'],
+            },
+        ),
+    ]
@@ -46,3 +46,58 @@ class RouteHistory(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+
+
+class AQIReading(models.Model):
+    """Append-only history of station readings, one row per station per observation"""
+    station_name = models.CharField(max_length=200)
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+    aqi = models.FloatField()
+    pm25 = models.FloatField(null=True, blank=True)
+    pm10 = models.FloatField(null=True, blank=True)
+    no2 = models.FloatField(null=True, blank=True)
+    co = models.FloatField(null=True, blank=True)
+    o3 = models.FloatField(null=True, blank=True)
+    temperature = models.FloatField(null=True, blank=True)
+    humidity = models.FloatField(null=True, blank=True)
+    wind_speed = models.FloatField(null=True, blank=True)
+    observed_at = models.DateTimeField(db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.station_name}: {self.aqi} ({self.observed_at})"
+
+    class Meta:
+        ordering = ['-observed_at']
+        constraints = [
+            models.UniqueConstraint(fields=['station_name', 'observed_at'],
+                                    name='unique_station_observation'),
+        ]
+
+
+class RequestProfile(models.Model):
+    """Profiler output of one opted-in or sampled request, with its parameters"""
+    TRIGGER_CHOICES = [
+        ('staff', 'Staff opt-in'),
+        ('sample', 'Random sample'),
+    ]
+
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=500)
+    query = models.TextField(blank=True)
+    body = models.TextField(blank=True)
+    status_code = models.PositiveSmallIntegerField()
+    duration_ms = models.FloatField(db_index=True)
+    profiler = models.CharField(max_length=20)
+    trigger = models.CharField(max_length=10, choices=TRIGGER_CHOICES)
+    username = models.CharField(max_length=150, blank=True)
+    # Collapsed stacks (sampling) or a pstats table (cprofile)
+    profile = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"{self.method} {self.path}: {self.duration_ms:.0f} ms ({self.created_at})"
+
+    class Meta:
+        ordering = ['-duration_ms']
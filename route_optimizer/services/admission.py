@@ -0,0 +1,195 @@
+"""
+Admission control: choose how much of the pipeline each request may use.
+
+Modes, from most to least upstream work:
+  live           ORS routing with detours and live WAQI lookups along the route
+  cached         ORS routing with detours, AQI from the snapshot/climatology raster
+  shortest_only  one ORS route, AQI from the raster
+  shed           refused with 503 and Retry-After
+
+Each mode has a pressure: the worst of the request queue and, for the
+upstreams it uses, their recent p95 latency (relative to
+ADMISSION_LATENCY_TARGETS) and shared-quota backlog (relative to
+ADMISSION_QUOTA_BACKLOG); lighter modes weigh both by the share of the
+load they carry. The queue is the recent p95 time requests waited for a
+worker, from the front proxy's ADMISSION_QUEUE_HEADER timestamp (relative
+to ADMISSION_QUEUE_TARGET; off unless configured), or this process's
+in-flight requests (relative to ADMISSION_MAX_INFLIGHT) when that is
+higher. Below ADMISSION_SOFT_PRESSURE a mode always admits; between that and 1 it admits a falling share of requests, so load
+moves to the next mode gradually rather than all at once. Batch requests
+see their pressure divided by ADMISSION_BATCH_SHARE, so they degrade and
+are shed first.
+"""
+import random
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from typing import Dict, Optional
+
+from django.conf import settings
+from django.http import JsonResponse
+
+from .quota import quota_backlog
+from ..metrics import ADMISSION_DECISIONS, LATENCIES, QUEUE_WAITS, REQUEST_QUEUE_SECONDS
+
+MODES = ('live', 'cached', 'shortest_only')
+SHED = 'shed'
+
+# Upstream calls each mode makes, weighted by how much of that load it
+# carries (shortest_only makes one directions call instead of two), and how
+# much of the in-flight queue it feels
+MODE_UPSTREAMS = {
+    'live': {('waqi', 'feed'): 1.0, ('ors', 'directions'): 1.0},
+    'cached': {('ors', 'directions'): 1.0},
+    'shortest_only': {('ors', 'directions'): 0.5},
+}
+MODE_QUEUE_WEIGHT = {'live': 1.0, 'cached': 0.75, 'shortest_only': 0.5}
+
+API_KEYS = {'waqi': 'WAQI_API_KEY', 'ors': 'ORS_API_KEY', 'pelias': 'ORS_API_KEY'}
+
+# Longest plausible wait for a worker; older request-start stamps are ignored
+MAX_QUEUE_WAIT = 60.0
+
+
+def queue_wait(header: str, now: Optional[float] = None) -> Optional[float]:
+    """
+    Seconds since a request-start timestamp ('t=1700000000.123', or bare;
+    seconds, milliseconds or microseconds since the epoch), None if unparsable,
+    in the future or older than MAX_QUEUE_WAIT (clock skew or a forged header
+    rather than a queue)
+    """
+    try:
+        started = float(header.strip().removeprefix('t='))
+    except ValueError:
+        return None
+    # Heroku sends milliseconds, Apache's %t microseconds
+    if started > 1e14:
+        started /= 1e6
+    elif started > 1e11:
+        started /= 1e3
+    now = time.time() if now is None else now
+    wait = now - started
+    # A little slack for clock drift between the proxy and this host
+    if not -1.0 <= wait <= MAX_QUEUE_WAIT:
+        return None
+    return max(0.0, wait)
+
+
+class AdmissionController:
+    """
+    Per-process admission decisions (queue waits and the in-flight count
+    are per process; quota is shared)
+    """
+
+    def __init__(self):
+        self.inflight = 0
+        self._lock = threading.Lock()
+
+    def upstream_pressure(self, service: str, operation: str) -> float:
+        latency = LATENCIES.percentile((service, operation), 95, settings.ADMISSION_MIN_SAMPLES,
+                                       max_age=settings.ADMISSION_WINDOW)
+        target = settings.ADMISSION_LATENCY_TARGETS.get(service)
+        latency_pressure = latency / target if latency is not None and target else 0.0
+        backlog = quota_backlog(service, operation, getattr(settings, API_KEYS.get(service, ''), None))
+        return max(latency_pressure, backlog / settings.ADMISSION_QUOTA_BACKLOG)
+
+    def observe_queue(self, request, request_class: str):
+        """Record how long a request waited for this worker, if the proxy stamped it"""
+        if not settings.ADMISSION_QUEUE_HEADER:
+            return
+        header = request.headers.get(settings.ADMISSION_QUEUE_HEADER)
+        wait = queue_wait(header) if header else None
+        if wait is None:
+            return
+        QUEUE_WAITS.observe(('app', 'queue'), wait)
+        REQUEST_QUEUE_SECONDS.observe(wait, request_class=request_class)
+
+    def queue_pressure(self) -> float:
+        wait = QUEUE_WAITS.percentile(('app', 'queue'), 95, settings.ADMISSION_MIN_SAMPLES,
+                                      max_age=settings.ADMISSION_WINDOW)
+        return wait / settings.ADMISSION_QUEUE_TARGET if wait is not None else 0.0
+
+    def signals(self) -> Dict[str, float]:
+        """Pressure inputs: queue wait, in-flight share and each upstream's latency/quota pressure"""
+        upstreams = {upstream for calls in MODE_UPSTREAMS.values() for upstream in calls}
+        signals = {'queue': self.queue_pressure(),
+                   'inflight': self.inflight / settings.ADMISSION_MAX_INFLIGHT}
+        for service, operation in sorted(upstreams):
+            signals[f'{service}.{operation}'] = self.upstream_pressure(service, operation)
+        return signals
+
+    def pressures(self, request_class: str = 'interactive') -> Dict[str, float]:
+        signals = self.signals()
+        share = 1.0 if request_class == 'interactive' else settings.ADMISSION_BATCH_SHARE
+        return {
+            mode: max([max(signals['queue'], signals['inflight']) * MODE_QUEUE_WEIGHT[mode]]
+                      + [signals[f'{service}.{operation}'] * weight
+                         for (service, operation), weight in upstreams.items()]) / share
+            for mode, upstreams in MODE_UPSTREAMS.items()
+        }
+
+    @staticmethod
+    def admit_probability(pressure: float) -> float:
+        soft = settings.ADMISSION_SOFT_PRESSURE
+        if pressure <= soft:
+            return 1.0
+        return max(0.0, (1.0 - pressure) / (1.0 - soft))
+
+    def choose(self, request_class: str = 'interactive') -> str:
+        if not settings.ADMISSION_CONTROL_ENABLED:
+            return 'live'
+        pressures = self.pressures(request_class)
+        for mode in MODES:
+            if random.random() < self.admit_probability(pressures[mode]):
+                return mode
+        return SHED
+
+    @contextmanager
+    def admit(self, request_class: str = 'interactive'):
+        """Choose a mode and count the request as in flight while it runs (shed ones are not)"""
+        mode = self.choose(request_class)
+        ADMISSION_DECISIONS.inc(request_class=request_class, mode=mode)
+        if mode == SHED:
+            yield mode
+            return
+        with self._lock:
+            self.inflight += 1
+        try:
+            yield mode
+        finally:
+            with self._lock:
+                self.inflight -= 1
+
+
+CONTROLLER = AdmissionController()
+
+
+def admission_controlled(request_class: str = 'interactive'):
+    """
+    View decorator: admits the request in a service mode (request.service_mode),
+    answers 503 when it is shed and reports the mode in X-Service-Mode.
+    Clients can mark an interactive endpoint's request as batch with the
+    ADMISSION_CLASS_HEADER header.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            declared = request.headers.get(settings.ADMISSION_CLASS_HEADER, '').lower()
+            effective_class = 'batch' if declared == 'batch' else request_class
+            CONTROLLER.observe_queue(request, effective_class)
+            with CONTROLLER.admit(effective_class) as mode:
+                if mode == SHED:
+                    response = JsonResponse({
+                        'success': False,
+                        'error': 'The service is busy. Please retry shortly.',
+                        'service_mode': SHED
+                    }, status=503)
+                    response['Retry-After'] = str(settings.ADMISSION_RETRY_AFTER)
+                else:
+                    request.service_mode = mode
+                    response = view(request, *args, **kwargs)
+            response['X-Service-Mode'] = mode
+            return response
+        return wrapped
+    return decorator
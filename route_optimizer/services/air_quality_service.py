@@ -1,65 +1,166 @@
-import requests
+import logging
 from django.conf import settings
 from typing import Dict, List, Optional
-import time
+import json
+from concurrent.futures import wait
+import requests
+from .deadline import Deadline, DeadlineExceeded, hedged, upstream_pool
+from .http_pool import upstream_session
+from .quota import coalesced, throttle
+from ..metrics import UPSTREAM_ERRORS, upstream_call
+
+logger = logging.getLogger(__name__)
 
 class AirQualityService:
-    """Service to fetch air quality data from WAQI API"""
-    
-    BASE_URL = "https://api.waqi.info"
+    """
+    Service to fetch air quality data from WAQI API.
+    With a deadline, every call's timeout is capped by the request's
+    remaining time and calls that cannot fit are skipped (None / []).
+    """
     
-    def __init__(self):
+    def __init__(self, deadline: Optional[Deadline] = None):
         self.api_key = settings.WAQI_API_KEY
+        self.base_url = settings.WAQI_BASE_URL.rstrip('/')
+        self.deadline = deadline
+    
+    def _get_json(self, url: str, params: Dict, operation: str) -> Dict:
+        """
+        GET a WAQI endpoint within the deadline and the shared quota, joining
+        an identical call already in flight; hedged when HEDGE_ENABLED
+        """
+        # Skip before queueing for quota when no call could fit any more
+        self._timeout(operation)
+        
+        def call():
+            throttle('waqi', operation, self.api_key, self.deadline)
+            # Capped after the quota wait, which can use most of the time left
+            timeout = self._timeout(operation)
+            with upstream_call('waqi', operation):
+                response = upstream_session('waqi').get(url, params=params, timeout=timeout)
+                response.raise_for_status()
+                return response.json()
+        
+        key = url + json.dumps({k: v for k, v in params.items() if k != 'token'}, sort_keys=True)
+        return coalesced(key, lambda: hedged(call, 'waqi', operation, self.deadline),
+                         'waqi', operation, self.deadline,
+                         budget_errors=(DeadlineExceeded, requests.exceptions.Timeout))
+    
+    def _timeout(self, operation: str) -> float:
+        """WAQI_TIMEOUT capped by the time left; skips the call when too little is"""
+        if self.deadline is None:
+            return settings.WAQI_TIMEOUT
+        try:
+            return self.deadline.timeout(settings.WAQI_TIMEOUT)
+        except DeadlineExceeded:
+            self.deadline.skip('waqi', operation)
+            raise
     
     def get_aqi_by_coordinates(self, lat: float, lng: float) -> Optional[Dict]:
         """
         Get AQI data for specific coordinates
         """
-        url = f"{self.BASE_URL}/feed/geo:{lat};{lng}/"
+        url = f"{self.base_url}/feed/geo:{lat};{lng}/"
         params = {'token': self.api_key}
         
         try:
-            response = requests.get(url, params=params, timeout=10)
-            response.raise_for_status()
-            data = response.json()
+            data = self._get_json(url, params, 'feed')
             
             if data.get('status') == 'ok':
                 return self._parse_aqi_data(data['data'])
+            UPSTREAM_ERRORS.inc(service='waqi', operation='feed')
+            return None
+        except DeadlineExceeded:
             return None
         except Exception as e:
-            print(f"Error fetching AQI data: {e}")
+            logger.warning("Error fetching AQI data: %s", e)
             return None
     
     def get_aqi_by_city(self, city_name: str) -> Optional[Dict]:
         """
         Get AQI data for specific city
         """
-        url = f"{self.BASE_URL}/feed/{city_name}/"
+        url = f"{self.base_url}/feed/{city_name}/"
         params = {'token': self.api_key}
         
         try:
-            response = requests.get(url, params=params, timeout=10)
-            response.raise_for_status()
-            data = response.json()
+            data = self._get_json(url, params, 'feed')
             
             if data.get('status') == 'ok':
                 return self._parse_aqi_data(data['data'])
+            UPSTREAM_ERRORS.inc(service='waqi', operation='feed')
+            return None
+        except DeadlineExceeded:
             return None
         except Exception as e:
-            print(f"Error fetching AQI data: {e}")
+            logger.warning("Error fetching AQI data: %s", e)
             return None
     
+    def get_stations_in_bounds(self, min_lat: float, min_lng: float,
+                               max_lat: float, max_lng: float) -> List[Dict]:
+        """
+        Get the current AQI of every station inside a bounding box (one request)
+        """
+        url = f"{self.base_url}/map/bounds/"
+        params = {'token': self.api_key, 'latlng': f"{min_lat},{min_lng},{max_lat},{max_lng}"}
+        
+        try:
+            data = self._get_json(url, params, 'bounds')
+            
+            if data.get('status') != 'ok':
+                UPSTREAM_ERRORS.inc(service='waqi', operation='bounds')
+                return []
+            
+            stations = []
+            for station in data.get('data', []):
+                try:
+                    aqi = float(station.get('aqi'))
+                except (TypeError, ValueError):
+                    continue  # '-' means the station is not reporting
+                stations.append({
+                    'uid': station.get('uid'),
+                    'aqi': aqi,
+                    'lat': station.get('lat'),
+                    'lng': station.get('lon'),
+                    'name': station.get('station', {}).get('name', 'Unknown'),
+                    'time': station.get('station', {}).get('time', ''),
+                })
+            return stations
+        except DeadlineExceeded:
+            return []
+        except Exception as e:
+            logger.warning("Error fetching stations in bounds: %s", e)
+            return []
+    
     def get_multiple_aqi_for_route(self, coordinates: List[tuple]) -> List[Dict]:
         """
         Get AQI data for multiple coordinates along a route
         """
-        aqi_data = []
-        for lat, lng in coordinates:
-            data = self.get_aqi_by_coordinates(lat, lng)
-            if data:
-                aqi_data.append(data)
-            time.sleep(0.1)  # Rate limiting
+        return [data for data in self.get_aqi_for_points(coordinates) if data]
+    
+    def get_aqi_for_points(self, coordinates: List[tuple]) -> List[Optional[Dict]]:
+        """
+        Get AQI data for each (lat, lng) point, keeping None for failed lookups
+        so results stay aligned with the input. Lookups overlap, paced by
+        the shared WAQI quota; lookups that cannot start or finish before
+        the deadline are left as None for the caller's fallback sources.
+        """
+        pool = upstream_pool('fanout')
+        futures = {}
+        for i, (lat, lng) in enumerate(coordinates):
+            if self.deadline is not None and self.deadline.remaining() < settings.UPSTREAM_MIN_TIMEOUT:
+                self.deadline.skip('waqi', 'feed', len(coordinates) - i)
+                break
+            futures[pool.submit(self.get_aqi_by_coordinates, lat, lng)] = i
+        
+        done, pending = wait(futures, timeout=self.deadline.wait_time() if self.deadline is not None else None)
+        if pending:
+            for future in pending:
+                future.cancel()
+            self.deadline.skip('waqi', 'feed', len(pending))
         
+        aqi_data = [None] * len(coordinates)
+        for future in done:
+            aqi_data[futures[future]] = future.result()
         return aqi_data
     
     def _parse_aqi_data(self, data: Dict) -> Dict:
@@ -75,12 +176,18 @@ class AirQualityService:
             'no2': iaqi.get('no2', {}).get('v', 0),
             'co': iaqi.get('co', {}).get('v', 0),
             'o3': iaqi.get('o3', {}).get('v', 0),
+            # Meteorology, used as model features; None when not reported,
+            # since 0 is a real temperature or wind speed
+            'temperature': iaqi.get('t', {}).get('v'),
+            'humidity': iaqi.get('h', {}).get('v'),
+            'wind_speed': iaqi.get('w', {}).get('v'),
             'location': {
                 'lat': data.get('city', {}).get('geo', [0, 0])[0],
                 'lng': data.get('city', {}).get('geo', [0, 0])[1],
                 'name': data.get('city', {}).get('name', 'Unknown')
             },
             'time': data.get('time', {}).get('s', ''),
+            'observed_at': data.get('time', {}).get('iso', ''),
         }
     
     def calculate_weighted_aqi(self, aqi_data: Dict) -> float:
@@ -0,0 +1,108 @@
+import threading
+import time
+from typing import Optional
+from zoneinfo import ZoneInfo
+
+import numpy as np
+from django.conf import settings
+
+from .aqi_snapshot import SnapshotAQISource
+from .climatology import Climatology, hour_of_week
+from .exposure_service import DEFAULT_AQI
+from .route_cache import RouteCache
+from .zoning import ZoneGrid
+
+_current = {'key': None, 'layers': None}
+_current_lock = threading.Lock()
+
+
+class HourlyAQILayers:
+    """
+    In-memory AQI forecast: one zone-grid layer per hour from the current
+    hour onwards, built from the station snapshot and the hour-of-week
+    climatology (or the diurnal profile before one has been built).
+    Values are linear in time between layers, so a later arrival never
+    sees an earlier forecast and FIFO holds on every segment.
+    """
+
+    def __init__(self, aqi_source: Optional[SnapshotAQISource] = None,
+                 grid: Optional[ZoneGrid] = None, reference: Optional[float] = None,
+                 hours: Optional[int] = None):
+        self.aqi_source = aqi_source or SnapshotAQISource.current()
+        self.grid = grid or ZoneGrid()
+        self.reference = time.time() if reference is None else reference
+        self.hours = hours or settings.AQI_FORECAST_HOURS
+        self.start = self.reference - self.reference % 3600
+        self.local_tz = ZoneInfo(settings.AQI_FORECAST_TIME_ZONE)
+        self.climatology = Climatology.current()
+        self.layers = self._build()
+        self._reference_values = self._interpolate(np.arange(self.grid.size),
+                                                   np.full(self.grid.size, self.reference))
+
+    @classmethod
+    def current(cls) -> 'HourlyAQILayers':
+        """Shared layers for the current snapshot epoch, rebuilt every hour"""
+        key = (RouteCache().snapshot_epoch(), int(time.time() // 3600))
+        with _current_lock:
+            if _current['key'] != key:
+                _current['key'] = key
+                _current['layers'] = cls()
+            return _current['layers']
+
+    def _build(self) -> np.ndarray:
+        """(hours, zones) forecast, current AQI scaled along the relative hourly profile"""
+        centroids = self.grid.centroids()
+        now = self.aqi_source.lookup(centroids[:, 0], centroids[:, 1])
+        missing = np.isnan(now)
+        if missing.any() and self.climatology is not None:
+            now[missing] = self.climatology.lookup(centroids[missing, 0], centroids[missing, 1],
+                                                   self.reference)
+        now[np.isnan(now)] = DEFAULT_AQI
+
+        times = self.start + 3600.0 * np.arange(self.hours)
+        return (now[None, :] * self.relative_profile(times)).astype(np.float32)
+
+    def relative_profile(self, times: np.ndarray) -> np.ndarray:
+        """
+        (len(times), zones) AQI relative to the first time: the zone's
+        hour-of-week climatology where it has been built, else the diurnal profile
+        """
+        profile = self.hour_profile()
+        hours = hour_of_week(times, self.local_tz) % 24
+        relative = profile[hours] / profile[hours[0]]
+        if self.climatology is None:
+            return relative
+
+        centroids = self.grid.centroids()
+        n, zones = len(times), self.grid.size
+        typical = self.climatology.lookup(np.tile(centroids[:, 0], n), np.tile(centroids[:, 1], n),
+                                          np.repeat(times, zones)).reshape(n, zones)
+        known = (typical > 0).all(axis=0)
+        relative[:, known] = typical[:, known] / typical[0, known]
+        return relative
+
+    def hour_profile(self) -> np.ndarray:
+        """(24, zones) relative AQI by local hour of day"""
+        profile = np.asarray(settings.AQI_DIURNAL_PROFILE, dtype=float)
+        return np.repeat(profile[:, None], self.grid.size, axis=1)
+
+    def _interpolate(self, zones: np.ndarray, times: np.ndarray) -> np.ndarray:
+        position = np.clip((np.asarray(times, dtype=float) - self.start) / 3600, 0, self.hours - 1)
+        lower = position.astype(int)
+        upper = np.minimum(lower + 1, self.hours - 1)
+        fraction = position - lower
+        return self.layers[lower, zones] * (1 - fraction) + self.layers[upper, zones] * fraction
+
+    def lookup(self, lats: np.ndarray, lngs: np.ndarray, times: np.ndarray) -> np.ndarray:
+        """Forecast AQI at each position and epoch time"""
+        return self._interpolate(self.grid.zone_of(lats, lngs), times)
+
+    def factors(self, lats: np.ndarray, lngs: np.ndarray, times: np.ndarray) -> np.ndarray:
+        """
+        Forecast AQI at each time relative to now, for scaling current
+        readings along a route to the time each stretch is driven
+        """
+        zones = self.grid.zone_of(lats, lngs)
+        current = self._reference_values[zones]
+        return np.divide(self._interpolate(zones, times), current,
+                         out=np.ones(len(zones)), where=current > 0)
@@ -0,0 +1,267 @@
+import logging
+import pickle
+import threading
+import time
+import warnings
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+import numpy as np
+from django.conf import settings
+
+from .aqi_snapshot import SnapshotAQISource
+from .artifact_store import ArtifactStore, ArtifactVersion, LiveArtifact
+from .exposure_service import reading_value
+
+# Model inputs, in the column order the notebook trained on
+FEATURES = ('pm25', 'pm10', 'no2', 'co', 'o3',
+            'temperature', 'humidity', 'wind_speed', 'hour', 'day_of_week')
+POLLUTANTS = FEATURES[:5]
+WEATHER = FEATURES[5:8]
+
+logger = logging.getLogger(__name__)
+
+_instance = {'service': None}
+_instance_lock = threading.Lock()
+
+
+class LinearAQIModel:
+    """
+    Pure-NumPy standardize-then-linear predictor, loaded from the flat
+    coefficient artifact written by export_linear_model (no scikit-learn)
+    """
+
+    def __init__(self, mean: np.ndarray, scale: np.ndarray,
+                 coef: np.ndarray, intercept: float):
+        self.mean = np.asarray(mean, dtype=float)
+        self.scale = np.asarray(scale, dtype=float)
+        self.coef = np.asarray(coef, dtype=float)
+        self.intercept = float(intercept)
+
+    @classmethod
+    def load(cls, path) -> 'LinearAQIModel':
+        with np.load(path) as artifact:
+            features = tuple(str(name) for name in artifact['features'])
+            if features != FEATURES:
+                raise ValueError(f"Model features {features} do not match {FEATURES}")
+            return cls(artifact['mean'], artifact['scale'], artifact['coef'],
+                       artifact['intercept'])
+
+    @classmethod
+    def from_artifact(cls, artifact: ArtifactVersion) -> 'LinearAQIModel':
+        """Load a version published to the model artifact store"""
+        features = tuple(artifact.meta['features'])
+        if features != FEATURES:
+            raise ValueError(f"Model features {features} do not match {FEATURES}")
+        return cls(artifact['mean'], artifact['scale'], artifact['coef'], artifact['intercept'])
+
+    def predict(self, features: np.ndarray) -> np.ndarray:
+        # Same operations, in the same order, as StandardScaler + LinearRegression
+        return ((features - self.mean) / self.scale) @ self.coef + self.intercept
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            np.savez(f, features=np.array(FEATURES), mean=self.mean, scale=self.scale,
+                     coef=self.coef, intercept=np.float64(self.intercept))
+
+    def publish(self, directory=None) -> str:
+        """Publish as the served model (AQI_MODEL_STORE_DIR); workers switch to it without a restart"""
+        store = ArtifactStore(directory or settings.AQI_MODEL_STORE_DIR)
+        return store.publish({'mean': self.mean, 'scale': self.scale, 'coef': self.coef,
+                              'intercept': np.float64(self.intercept)},
+                             {'features': list(FEATURES), 'published_at': int(time.time())})
+
+
+def export_linear_model(model, scaler, path) -> LinearAQIModel:
+    """
+    Write a fitted linear regressor (coef_/intercept_) and its StandardScaler
+    as an .npz coefficient artifact
+    """
+    if not hasattr(model, 'coef_') or np.ndim(model.coef_) != 1:
+        raise ValueError(f"{type(model).__name__} is not a single-output linear model")
+    mean = scaler.mean_ if scaler.with_mean else np.zeros(len(FEATURES))
+    scale = scaler.scale_ if scaler.with_std else np.ones(len(FEATURES))
+
+    exported = LinearAQIModel(mean, scale, model.coef_, model.intercept_)
+    exported.save(path)
+    return exported
+
+
+def fill_feature_defaults(features: np.ndarray) -> np.ndarray:
+    """
+    Last fill step for pollutant and weather columns, shared by serving and
+    training: values still missing become AQI_MODEL_FEATURE_DEFAULTS.
+    Pollutants are missing when NaN or not positive (WAQI's placeholder);
+    weather only when NaN, since a calm wind or a cold night reads 0 or
+    below. Modifies and returns `features`.
+    """
+    defaults = settings.AQI_MODEL_FEATURE_DEFAULTS
+    for col, field in enumerate(POLLUTANTS + WEATHER):
+        column = features[:, col]
+        missing = np.isnan(column)
+        if field in POLLUTANTS:
+            missing |= column <= 0
+        column[missing] = defaults[field]
+    return features
+
+
+# Model published to AQI_MODEL_STORE_DIR, if any
+_published_model = LiveArtifact(LinearAQIModel.from_artifact)
+
+
+class AQIModelService:
+    """
+    In-process AQI model (scaler + regressor trained in training/) used to
+    fill sample points whose WAQI reading is missing or stale. All points
+    of a batch are predicted in one vectorized call. Uses the published
+    model when one is given, else the exported coefficient artifact when
+    present, else the scikit-learn pickles.
+    """
+
+    def __init__(self, artifact_path=None, model_path=None, scaler_path=None,
+                 published: Optional[LinearAQIModel] = None):
+        self.local_tz = ZoneInfo(settings.AQI_FORECAST_TIME_ZONE)
+        self.model = None
+        self.scaler = None
+        self.linear = None
+        self.published = published
+        if published is not None:
+            self.linear = published
+            return
+
+        # The exported coefficients avoid importing scikit-learn at all
+        artifact_path = artifact_path or settings.AQI_MODEL_ARTIFACT_PATH
+        try:
+            self.linear = LinearAQIModel.load(artifact_path)
+            return
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning("Could not load AQI model artifact %s: %s", artifact_path, e)
+
+        try:
+            with open(model_path or settings.AQI_MODEL_PATH, 'rb') as f:
+                self.model = pickle.load(f)
+            with open(scaler_path or settings.AQI_SCALER_PATH, 'rb') as f:
+                self.scaler = pickle.load(f)
+        except Exception as e:  # missing artifact or scikit-learn not installed
+            logger.warning("AQI model unavailable: %s", e)
+            self.model = self.scaler = None
+
+    @classmethod
+    def instance(cls) -> 'AQIModelService':
+        """
+        Process-wide service, loaded on first use (or at startup) and
+        reloaded when a new model version is published
+        """
+        published = _published_model.get(settings.AQI_MODEL_STORE_DIR)
+        service = _instance['service']
+        if service is None or service.published is not published:
+            with _instance_lock:
+                if _instance['service'] is None or _instance['service'].published is not published:
+                    _instance['service'] = cls(published=published)
+        return _instance['service']
+
+    @property
+    def available(self) -> bool:
+        return self.linear is not None or (self.model is not None and self.scaler is not None)
+
+    def predict(self, features: np.ndarray) -> np.ndarray:
+        """AQI for an (n, len(FEATURES)) feature matrix"""
+        features = np.asarray(features, dtype=float).reshape(-1, len(FEATURES))
+        if len(features) == 0:
+            return np.zeros(0)
+        if self.linear is not None:
+            predicted = self.linear.predict(features)
+        else:
+            with warnings.catch_warnings():
+                # The scaler was fitted on a DataFrame; columns are in FEATURES order
+                warnings.simplefilter('ignore', UserWarning)
+                predicted = self.model.predict(self.scaler.transform(features))
+        return np.clip(predicted, 0.0, 500.0)
+
+    def fill_readings(self, points: List[Tuple[float, float]],
+                      readings: List[Optional[Dict]],
+                      now: Optional[float] = None) -> List[Optional[Dict]]:
+        """
+        Replace missing, unreported ('-') and stale readings for (lat, lng)
+        points with model estimates. Every reading returned carries 'source'
+        ('waqi' or 'model') and 'confidence' ('high', 'medium' or 'low').
+        """
+        now = time.time() if now is None else now
+        filled = [dict(reading, source='waqi', confidence='high') if reading else None
+                  for reading in readings]
+
+        targets = [i for i, reading in enumerate(readings) if self._needs_model(reading, now)]
+        if not targets or not self.available:
+            return filled
+
+        features, measured = self._features([points[i] for i in targets],
+                                            [readings[i] for i in targets], readings, now)
+        predicted = self.predict(features)
+
+        for row, i in enumerate(targets):
+            lat, lng = points[i]
+            estimate = {field: round(float(features[row, col]), 1)
+                        for col, field in enumerate(POLLUTANTS + WEATHER)}
+            estimate.update({
+                'aqi': round(float(predicted[row])),
+                'location': {'lat': lat, 'lng': lng, 'name': 'Model estimate'},
+                'time': '',
+                'source': 'model',
+                # Estimates from real pollutant inputs beat ones from training defaults
+                'confidence': 'medium' if measured[row] else 'low',
+            })
+            if readings[i]:
+                estimate['measured_aqi'] = readings[i].get('aqi')
+                estimate['observed_at'] = readings[i].get('observed_at', '')
+            filled[i] = estimate
+        return filled
+
+    def _needs_model(self, reading: Optional[Dict], now: float) -> bool:
+        if not reading or np.isnan(reading_value(reading)):
+            return True
+        observed_at = reading.get('observed_at')
+        if not observed_at:
+            return False
+        try:
+            observed = datetime.fromisoformat(observed_at).timestamp()
+        except ValueError:
+            return False
+        return now - observed > settings.AQI_READING_MAX_AGE
+
+    def _features(self, points: List[Tuple[float, float]], readings: List[Optional[Dict]],
+                  batch: List[Optional[Dict]], now: float) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Feature rows for the points to predict. Pollutants come from the
+        point's own (stale) reading, else the station snapshot, else the
+        training defaults; weather from the batch's readings.
+        Returns: (features, whether pm25 and pm10 came from real data)
+        """
+        n = len(points)
+        features = np.full((n, len(FEATURES)), np.nan)
+        for col, field in enumerate(POLLUTANTS + WEATHER):
+            features[:, col] = [reading_value(reading or {}, field, positive=field in POLLUTANTS)
+                                for reading in readings]
+
+        lats = np.array([p[0] for p in points], dtype=float)
+        lngs = np.array([p[1] for p in points], dtype=float)
+        snapshot = SnapshotAQISource.current()
+        for col, field in enumerate(POLLUTANTS):
+            missing = np.isnan(features[:, col])
+            if missing.any():
+                features[missing, col] = snapshot.lookup(lats[missing], lngs[missing], field)
+        measured = ~np.isnan(features[:, 0]) & ~np.isnan(features[:, 1])
+
+        for col, field in enumerate(WEATHER, start=len(POLLUTANTS)):
+            values = np.array([reading_value(reading or {}, field, positive=False) for reading in batch])
+            fallback = np.nanmean(values) if (~np.isnan(values)).any() else np.nan
+            features[np.isnan(features[:, col]), col] = fallback
+
+        fill_feature_defaults(features)
+
+        local = datetime.fromtimestamp(now, self.local_tz)
+        features[:, FEATURES.index('hour')] = local.hour
+        features[:, FEATURES.index('day_of_week')] = local.weekday()
+        return features, measured
@@ -0,0 +1,98 @@
+import threading
+from datetime import timedelta
+from typing import Dict, Optional
+
+import numpy as np
+from django.conf import settings
+from django.utils import timezone
+
+from .route_cache import RouteCache
+
+# Reading field -> Location column
+SNAPSHOT_FIELDS = {
+    'aqi': 'overall_aqi',
+    'pm25': 'aqi_pm25',
+    'pm10': 'aqi_pm10',
+    'no2': 'aqi_no2',
+    'co': 'aqi_co',
+    'o3': 'aqi_o3',
+}
+
+_current = {'epoch': None, 'source': None}
+_current_lock = threading.Lock()
+
+
+class SnapshotAQISource:
+    """
+    AQI lookup against the latest ingested station snapshot (Location rows),
+    interpolated by inverse distance weighting. No network access.
+    """
+
+    def __init__(self, max_age: Optional[timedelta] = None, power: float = 2.0):
+        self.max_age = max_age or timedelta(seconds=settings.AQI_SNAPSHOT_MAX_AGE)
+        self.power = power
+        self._arrays = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def current(cls) -> 'SnapshotAQISource':
+        """Shared instance for the current snapshot epoch"""
+        epoch = RouteCache().snapshot_epoch()
+        with _current_lock:
+            if _current['epoch'] != epoch:
+                _current['epoch'] = epoch
+                _current['source'] = cls()
+            return _current['source']
+
+    @property
+    def arrays(self) -> Dict[str, np.ndarray]:
+        """Station coordinates and per-field values, loaded on first use"""
+        if self._arrays is None:
+            with self._lock:
+                if self._arrays is None:
+                    self._arrays = self._load()
+        return self._arrays
+
+    def _load(self) -> Dict[str, np.ndarray]:
+        from ..models import Location
+
+        columns = ['latitude', 'longitude'] + list(SNAPSHOT_FIELDS.values())
+        rows = list(
+            Location.objects.filter(last_updated__gte=timezone.now() - self.max_age)
+            .values_list(*columns)
+        )
+        data = np.array(rows, dtype=float).reshape(-1, len(columns))  # None -> nan
+
+        arrays = {'lats': data[:, 0], 'lngs': data[:, 1]}
+        for offset, field in enumerate(SNAPSHOT_FIELDS, start=2):
+            values = data[:, offset]
+            values[values <= 0] = np.nan
+            arrays[field] = values
+        return arrays
+
+    @property
+    def station_count(self) -> int:
+        return len(self.arrays['lats'])
+
+    def lookup(self, lats: np.ndarray, lngs: np.ndarray, field: str = 'aqi') -> np.ndarray:
+        """IDW-interpolated value at each position, NaN if no station reports it"""
+        result = np.full(len(lats), np.nan)
+        arrays = self.arrays
+        if field not in arrays or len(lats) == 0:
+            return result
+
+        values = arrays[field]
+        valid = ~np.isnan(values)
+        if not valid.any():
+            return result
+
+        lats = np.asarray(lats, dtype=float)
+        lngs = np.asarray(lngs, dtype=float)
+        kx = np.cos(np.radians(float(lats.mean())))
+        dx = (lngs[:, None] - arrays['lngs'][valid][None, :]) * kx
+        dy = lats[:, None] - arrays['lats'][valid][None, :]
+        sq_dist = dx * dx + dy * dy
+
+        # Positions on top of a station take its value exactly
+        weights = 1.0 / np.maximum(sq_dist, 1e-12) ** (self.power / 2)
+        return (weights @ values[valid]) / weights.sum(axis=1)
@@ -0,0 +1,165 @@
+"""
+Versioned, read-only NumPy artifacts shared by every worker process.
+
+Each artifact (zone matrix, climatology, served AQI model) lives in its own
+directory:
+
+    versions/<version>/meta.json, <array>.npy ...   immutable once written
+    current -> versions/<version>                    swapped atomically
+
+A publish writes a new version directory under a temporary name, renames
+it into place and then replaces the `current` symlink, so readers see
+either the old or the new version, never a mix. Readers memory-map the
+.npy files read-only, so all workers share one copy of the data in the
+page cache. LiveArtifact re-reads the symlink at most every
+ARTIFACT_RELOAD_INTERVAL seconds and reopens the artifact when it moved,
+so workers pick up new versions without a restart. Old versions are
+pruned down to ARTIFACT_KEEP_VERSIONS; a worker still mapping a pruned
+version keeps reading it until it reopens (unlinked files stay valid).
+
+A directory holding meta.json and .npy files directly (the layout before
+versioning) is read as version 'legacy'.
+"""
+import json
+import os
+import secrets
+import shutil
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Dict, Generic, List, Optional, TypeVar
+
+import numpy as np
+from django.conf import settings
+
+T = TypeVar('T')
+
+LEGACY_VERSION = 'legacy'
+
+# Bumped by every publish in this process, so its own readers reload at once
+_publishes = {'count': 0}
+
+
+class ArtifactVersion:
+    """One published version: meta plus memory-mapped arrays"""
+
+    def __init__(self, directory: Path, version: str):
+        self.directory = Path(directory)
+        self.version = version
+        self.meta = json.loads((self.directory / 'meta.json').read_text())
+        self.arrays: Dict[str, np.ndarray] = {
+            path.stem: np.load(path, mmap_mode='r')
+            for path in sorted(self.directory.glob('*.npy'))
+        }
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.arrays[name]
+
+
+class ArtifactStore:
+    """Versions of one artifact under `directory`"""
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+
+    @property
+    def _versions_dir(self) -> Path:
+        return self.directory / 'versions'
+
+    @property
+    def _current_link(self) -> Path:
+        return self.directory / 'current'
+
+    def current_version(self) -> Optional[str]:
+        """Version `current` points at (or 'legacy'); None if nothing was published"""
+        try:
+            return os.path.basename(os.readlink(self._current_link))
+        except FileNotFoundError:
+            pass
+        except OSError:  # not a symlink
+            return None
+        return LEGACY_VERSION if (self.directory / 'meta.json').exists() else None
+
+    def versions(self) -> List[str]:
+        """Published versions, oldest first"""
+        if not self._versions_dir.is_dir():
+            return []
+        return sorted(path.name for path in self._versions_dir.iterdir()
+                      if path.is_dir() and not path.name.startswith('.'))
+
+    def open(self, version: Optional[str] = None) -> Optional[ArtifactVersion]:
+        """Map a version (the current one by default); None if nothing was published"""
+        version = version or self.current_version()
+        if version is None:
+            return None
+        if version == LEGACY_VERSION:
+            return ArtifactVersion(self.directory, version)
+        return ArtifactVersion(self._versions_dir / version, version)
+
+    def publish(self, arrays: Dict[str, np.ndarray], meta: Dict) -> str:
+        """Write a new version and make it current; returns its name"""
+        version = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S.%fZ') + '-' + secrets.token_hex(3)
+        self._versions_dir.mkdir(parents=True, exist_ok=True)
+        staging = self._versions_dir / f'.{version}.tmp'
+        staging.mkdir()
+        try:
+            for name, array in arrays.items():
+                with open(staging / f'{name}.npy', 'wb') as f:
+                    np.save(f, np.asarray(array))
+                    f.flush()
+                    os.fsync(f.fileno())
+            (staging / 'meta.json').write_text(json.dumps(dict(meta, version=version)))
+            os.rename(staging, self._versions_dir / version)
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+
+        link = self.directory / f'.current.{version}.tmp'
+        os.symlink(os.path.join('versions', version), link)
+        os.replace(link, self._current_link)
+        _publishes['count'] += 1
+        self.prune()
+        return version
+
+    def prune(self, keep: Optional[int] = None):
+        """Delete all but the newest `keep` versions (never the current one)"""
+        keep = max(1, keep or settings.ARTIFACT_KEEP_VERSIONS)
+        current = self.current_version()
+        for version in self.versions()[:-keep]:
+            if version != current:
+                shutil.rmtree(self._versions_dir / version, ignore_errors=True)
+
+
+class LiveArtifact(Generic[T]):
+    """
+    Process-wide object built by `factory` from the current version of a
+    store, rebuilt when a new version is published. get() returns None
+    while nothing has been published.
+    """
+
+    def __init__(self, factory: Callable[[ArtifactVersion], T]):
+        self.factory = factory
+        self._lock = threading.Lock()
+        self._key = None  # (directory, version)
+        self._value: Optional[T] = None
+        self._checked_at = -float('inf')
+        self._publishes = None
+
+    def get(self, directory) -> Optional[T]:
+        directory = Path(directory)
+        now = time.monotonic()
+        if (self._key is not None and self._key[0] == directory and self._publishes == _publishes['count']
+                and now - self._checked_at < settings.ARTIFACT_RELOAD_INTERVAL):
+            return self._value
+
+        with self._lock:
+            store = ArtifactStore(directory)
+            version = store.current_version()
+            if (directory, version) != self._key:
+                artifact = store.open(version) if version is not None else None
+                self._value = self.factory(artifact) if artifact is not None else None
+                self._key = (directory, version)
+            self._checked_at = now
+            self._publishes = _publishes['count']
+            return self._value
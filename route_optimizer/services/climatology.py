@@ -0,0 +1,218 @@
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Optional
+from zoneinfo import ZoneInfo
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Avg
+from django.db.models.functions import ExtractHour, ExtractIsoWeekDay
+from django.utils import timezone
+
+from .aqi_snapshot import SNAPSHOT_FIELDS
+from .artifact_store import ArtifactStore, ArtifactVersion, LiveArtifact
+from .zoning import ZoneGrid
+
+HOURS_PER_WEEK = 7 * 24
+CLIMATOLOGY_FIELDS = tuple(SNAPSHOT_FIELDS)
+CLIMATOLOGY_STATS = ('mean', 'p50', 'p90')
+_PERCENTILES = {'p50': 0.5, 'p90': 0.9}
+
+# Histogram used for streaming percentiles: 0-500 in 2.5-unit bins
+_BIN_WIDTH = 2.5
+_BINS = 200
+
+
+def hour_of_week(times, local_tz: ZoneInfo) -> np.ndarray:
+    """Local hour of week (Monday 00:00 = 0) of epoch times"""
+    times = np.atleast_1d(np.asarray(times, dtype=float))
+    # Local offsets are whole quarter hours (Kolkata is +05:30) and only change
+    # at DST transitions, so convert the distinct quarter hours
+    quarters = np.floor(times / 900)
+    unique, inverse = np.unique(quarters, return_inverse=True)
+    local = [datetime.fromtimestamp(q * 900, local_tz) for q in unique]
+    values = np.array([dt.weekday() * 24 + dt.hour for dt in local], dtype=int)
+    return values[inverse]
+
+
+class ClimatologyBuilder:
+    """
+    Hour-of-week x zone climatology (mean, median and 90th percentile of
+    each pollutant) from the ingested AQIReading history. Readings are
+    streamed into per-station histograms, then spread over the zone grid
+    by inverse distance weighting.
+    """
+
+    def __init__(self, grid: Optional[ZoneGrid] = None, days: Optional[int] = None,
+                 chunk_size: int = 10000, min_samples: Optional[int] = None,
+                 power: float = 2.0):
+        self.grid = grid or ZoneGrid()
+        self.since = timezone.now() - timedelta(days=days or settings.CLIMATOLOGY_DAYS)
+        self.chunk_size = chunk_size
+        self.min_samples = min_samples or settings.CLIMATOLOGY_MIN_SAMPLES
+        self.power = power
+        self.local_tz = ZoneInfo(settings.AQI_FORECAST_TIME_ZONE)
+
+    def build(self) -> Dict:
+        """
+        Returns: {'values': (fields, stats, 168, zones) float16 array,
+                  'readings': rows used, 'stations': station count}
+        """
+        from ..models import AQIReading
+
+        queryset = AQIReading.objects.filter(observed_at__gte=self.since)
+        stations = list(queryset.values('station_name')
+                        .annotate(lat=Avg('latitude'), lng=Avg('longitude'))
+                        .order_by('station_name'))
+        index = {station['station_name']: i for i, station in enumerate(stations)}
+        cells = len(stations) * HOURS_PER_WEEK
+
+        counts = np.zeros((len(CLIMATOLOGY_FIELDS), cells, _BINS), dtype=np.int64)
+        sums = np.zeros((len(CLIMATOLOGY_FIELDS), cells))
+        readings = 0
+
+        columns = ('station_name', 'local_hour', 'iso_weekday') + CLIMATOLOGY_FIELDS
+        rows = (
+            queryset
+            .annotate(local_hour=ExtractHour('observed_at', tzinfo=self.local_tz),
+                      iso_weekday=ExtractIsoWeekDay('observed_at', tzinfo=self.local_tz))
+            .values_list(*columns)
+            .iterator(chunk_size=self.chunk_size)
+        )
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) == self.chunk_size:
+                readings += self._accumulate(chunk, index, counts, sums)
+                chunk = []
+        if chunk:
+            readings += self._accumulate(chunk, index, counts, sums)
+
+        station_stats = self._station_stats(counts, sums)  # (fields, stats, stations, 168)
+        values = self._spread(station_stats, stations)
+        return {'values': values.astype(np.float16), 'readings': readings, 'stations': len(stations)}
+
+    def _accumulate(self, chunk, index, counts, sums) -> int:
+        stations = np.array([index[row[0]] for row in chunk])
+        data = np.array([row[1:] for row in chunk], dtype=float)  # None -> nan
+        cell = stations * HOURS_PER_WEEK + (data[:, 1].astype(int) - 1) * 24 + data[:, 0].astype(int)
+
+        cells = counts.shape[1]
+        for f in range(len(CLIMATOLOGY_FIELDS)):
+            values = data[:, 2 + f]
+            valid = values > 0  # nan and WAQI's 0 placeholders are not readings
+            bins = np.minimum((values[valid] / _BIN_WIDTH).astype(int), _BINS - 1)
+            counts[f] += np.bincount(cell[valid] * _BINS + bins,
+                                     minlength=cells * _BINS).reshape(cells, _BINS)
+            sums[f] += np.bincount(cell[valid], weights=values[valid], minlength=cells)
+        return len(chunk)
+
+    def _station_stats(self, counts: np.ndarray, sums: np.ndarray) -> np.ndarray:
+        totals = counts.sum(axis=2)
+        totals[totals < self.min_samples] = 0  # too few readings to describe the bin
+        stats = np.full((len(CLIMATOLOGY_FIELDS), len(CLIMATOLOGY_STATS), counts.shape[1]), np.nan)
+        stats[:, 0] = np.divide(sums, totals, out=np.full(sums.shape, np.nan), where=totals > 0)
+
+        cumulative = counts.cumsum(axis=2)
+        for s, name in enumerate(CLIMATOLOGY_STATS[1:], start=1):
+            target = totals * _PERCENTILES[name]
+            first_bin = (cumulative < target[..., None]).sum(axis=2)
+            stats[:, s] = np.where(totals > 0, (first_bin + 0.5) * _BIN_WIDTH, np.nan)
+        return stats.reshape(len(CLIMATOLOGY_FIELDS), len(CLIMATOLOGY_STATS), -1, HOURS_PER_WEEK)
+
+    def _spread(self, station_stats: np.ndarray, stations) -> np.ndarray:
+        """IDW from stations to zone centroids, per hour of week, over stations with data"""
+        shape = station_stats.shape[:2] + (HOURS_PER_WEEK, self.grid.size)
+        if not stations:
+            return np.full(shape, np.nan)
+
+        centroids = self.grid.centroids()
+        lats = np.array([s['lat'] for s in stations], dtype=float)
+        lngs = np.array([s['lng'] for s in stations], dtype=float)
+        kx = np.cos(np.radians(float(centroids[:, 0].mean())))
+        sq_dist = (((centroids[:, 1, None] - lngs[None, :]) * kx) ** 2
+                   + (centroids[:, 0, None] - lats[None, :]) ** 2)
+        weights = 1.0 / np.maximum(sq_dist, 1e-12) ** (self.power / 2)  # (zones, stations)
+
+        station_stats = np.swapaxes(station_stats, -1, -2)  # (..., 168, stations)
+        present = ~np.isnan(station_stats)
+        numerator = np.where(present, station_stats, 0.0) @ weights.T  # (..., 168, zones)
+        denominator = present.astype(float) @ weights.T
+        return np.divide(numerator, denominator, out=np.full(shape, np.nan), where=denominator > 0)
+
+    def build_and_save(self, directory: Optional[Path] = None) -> Dict:
+        """
+        Build and publish a new version of the climatology artifact;
+        workers switch to it on their next lookup
+        """
+        started = time.time()
+        result = self.build()
+        meta = {
+            'grid': self.grid.to_dict(),
+            'fields': list(CLIMATOLOGY_FIELDS),
+            'stats': list(CLIMATOLOGY_STATS),
+            'time_zone': settings.AQI_FORECAST_TIME_ZONE,
+            'built_at': int(time.time()),
+            'build_seconds': round(time.time() - started, 2),
+            'readings': result['readings'],
+            'stations': result['stations'],
+        }
+        meta['version'] = ArtifactStore(directory or settings.CLIMATOLOGY_DIR).publish(
+            {'climatology': result['values']}, meta)
+        return meta
+
+
+class Climatology:
+    """
+    Read-only, memory-mapped view of one version of the climatology
+    """
+
+    def __init__(self, artifact: ArtifactVersion):
+        self.version = artifact.version
+        self.meta = artifact.meta
+        self.grid = ZoneGrid(tuple(self.meta['grid']['bbox']),
+                             (self.meta['grid']['rows'], self.meta['grid']['cols']))
+        self.fields = self.meta['fields']
+        self.stats = self.meta['stats']
+        self.local_tz = ZoneInfo(self.meta['time_zone'])
+        self.values = artifact['climatology']
+
+    @classmethod
+    def current(cls, directory: Optional[Path] = None) -> Optional['Climatology']:
+        """Current version, reopened when a new one is published; None if never built"""
+        return _current.get(directory or settings.CLIMATOLOGY_DIR)
+
+    def lookup(self, lats: np.ndarray, lngs: np.ndarray, times, field: str = 'aqi',
+               stat: str = 'mean') -> np.ndarray:
+        """Climatological value at each position and epoch time, NaN where unknown"""
+        lats = np.asarray(lats, dtype=float)
+        if field not in self.fields or stat not in self.stats or len(lats) == 0:
+            return np.full(len(lats), np.nan)
+
+        zones = self.grid.zone_of(lats, lngs)
+        hours = np.broadcast_to(hour_of_week(times, self.local_tz), zones.shape)
+        table = self.values[self.fields.index(field), self.stats.index(stat)]
+        return table[hours, zones].astype(float)
+
+
+_current = LiveArtifact(Climatology)
+
+
+class ClimatologyAQISource:
+    """
+    AQI lookup from the hour-of-week climatology at a fixed time (now by
+    default). No network or database access, so it always answers.
+    """
+
+    def __init__(self, at: Optional[float] = None, stat: str = 'mean',
+                 climatology: Optional[Climatology] = None):
+        self.at = at
+        self.stat = stat
+        self.climatology = climatology or Climatology.current()
+
+    def lookup(self, lats: np.ndarray, lngs: np.ndarray, field: str = 'aqi') -> np.ndarray:
+        if self.climatology is None:
+            return np.full(len(lats), np.nan)
+        at = time.time() if self.at is None else self.at
+        return self.climatology.lookup(lats, lngs, at, field, self.stat)
@@ -0,0 +1,132 @@
+"""
+Per-request time budgets for upstream calls, and hedged calls.
+
+A Deadline is created once per request and passed down to every service
+call; each call's timeout is capped by what is left of it, and fan-outs
+stop starting (and stop waiting for) lookups once it runs low. Hedging
+sends a duplicate of a slow call after the operation's recent p95 (by
+default) and uses whichever answer arrives first.
+"""
+import math
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Optional, TypeVar
+
+from django.conf import settings
+
+from ..metrics import DEADLINE_SKIPS, LATENCIES, UPSTREAM_HEDGES
+
+T = TypeVar('T')
+
+
+class DeadlineExceeded(Exception):
+    """Not enough of the request's time budget is left to start a call"""
+
+
+class Deadline:
+    """
+    Absolute time by which a request must have its upstream answers.
+    seconds=None (or <= 0) means unbounded. `skipped` counts the calls
+    skipped or abandoned so far; a result computed while it rose is
+    partial. `cut_short` means anything in the request was.
+    """
+
+    def __init__(self, seconds: Optional[float] = None):
+        self.expires_at = time.monotonic() + seconds if seconds and seconds > 0 else math.inf
+        self.skipped = 0
+
+    @property
+    def cut_short(self) -> bool:
+        return self.skipped > 0
+
+    @classmethod
+    def for_request(cls) -> 'Deadline':
+        return cls(settings.REQUEST_DEADLINE)
+
+    def remaining(self) -> float:
+        return self.expires_at - time.monotonic()
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def wait_time(self) -> Optional[float]:
+        """Seconds left for concurrent.futures.wait (None when unbounded)"""
+        return None if self.expires_at == math.inf else max(self.remaining(), 0.0)
+
+    def timeout(self, default: float, reserve: float = 0.0) -> float:
+        """
+        Timeout for one call: default, capped by the time left after keeping
+        `reserve` seconds for work after the call. Raises DeadlineExceeded
+        when less than UPSTREAM_MIN_TIMEOUT would be left.
+        """
+        left = self.remaining() - reserve
+        if left < settings.UPSTREAM_MIN_TIMEOUT:
+            raise DeadlineExceeded(f'{max(left, 0.0):.2f}s left of the request deadline')
+        return min(default, left)
+
+    def skip(self, service: str, operation: str, count: int = 1):
+        """Record calls that were not made (or not waited for) for lack of time"""
+        self.skipped += count
+        DEADLINE_SKIPS.inc(count, service=service, operation=operation)
+
+
+_pools: Dict[str, ThreadPoolExecutor] = {}
+_pools_lock = threading.Lock()
+
+
+def upstream_pool(name: str) -> ThreadPoolExecutor:
+    """
+    Shared per-process thread pool. Fan-out and hedging use separate pools,
+    so a hedged call made from a fan-out task never waits behind its caller.
+    """
+    with _pools_lock:
+        pool = _pools.get(name)
+        if pool is None:
+            pool = _pools[name] = ThreadPoolExecutor(settings.UPSTREAM_POOL_SIZE,
+                                                     thread_name_prefix=f'upstream-{name}')
+        return pool
+
+
+def hedged(call: Callable[[], T], service: str, operation: str,
+           deadline: Optional[Deadline] = None) -> T:
+    """
+    Run call(); if it has not returned after the operation's
+    HEDGE_PERCENTILE latency, start a duplicate and return the first
+    successful answer. Without HEDGE_ENABLED, or before HEDGE_MIN_SAMPLES
+    calls have been timed, call() simply runs inline. Only use for
+    idempotent reads.
+    """
+    key = (service, operation)
+    delay = None
+    if settings.HEDGE_ENABLED:
+        delay = LATENCIES.percentile(key, settings.HEDGE_PERCENTILE, settings.HEDGE_MIN_SAMPLES)
+
+    if delay is None:
+        return call()
+
+    pool = upstream_pool('hedge')
+    futures = [pool.submit(call)]
+    done, _ = wait(futures, timeout=max(delay, settings.HEDGE_MIN_DELAY))
+    if not done and (deadline is None or deadline.remaining() > settings.UPSTREAM_MIN_TIMEOUT):
+        UPSTREAM_HEDGES.inc(service=service, operation=operation)
+        futures.append(pool.submit(call))
+
+    pending = set(futures)
+    error = None
+    while pending:
+        timeout = deadline.wait_time() if deadline is not None else None
+        done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+        if not done:
+            break
+        for future in done:
+            if future.exception() is None:
+                for other in pending:
+                    other.cancel()
+                return future.result()
+            error = future.exception()
+    if error is not None:
+        raise error
+    deadline.skip(service, operation)
+    raise DeadlineExceeded(f'{service} {operation} did not answer before the request deadline')
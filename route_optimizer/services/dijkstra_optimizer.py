@@ -511,20 +511,49 @@
 
 
 import heapq
+import logging
 import numpy as np
+from django.conf import settings
 from typing import Dict, List, Tuple, Optional
 from .air_quality_service import AirQualityService
 from .routing_service import RoutingService
+from .exposure_service import ExposureService
+from .aqi_snapshot import SnapshotAQISource
+from .climatology import ClimatologyAQISource
+from .deadline import Deadline
+from .route_cache import RouteCache, pollutant_type_for
+from .exposure_matrix import ExposureMatrixService
+from .aqi_forecast import HourlyAQILayers
+from .aqi_model import AQIModelService
+from .stop_ordering import OBJECTIVE_WEIGHTS, blended_cost, order_stops
+from ..metrics import span
+
+logger = logging.getLogger(__name__)
 
 
 class DijkstraOptimizer:
     """
-    Optimized route finder using different routing strategies
+    Optimized route finder using different routing strategies.
+    With a deadline, upstream calls share the request's time budget; AQI
+    lookups that do not fit are filled from the fallback sources and the
+    result is marked partial (and not cached).
+    The service mode (see services.admission) limits the upstream work:
+    'cached' scores routes on the snapshot/climatology raster without live
+    WAQI lookups, 'shortest_only' also skips the detour. Degraded results
+    are served from the route cache when present but never cached.
     """
     
-    def __init__(self):
-        self.aqi_service = AirQualityService()
-        self.routing_service = RoutingService()
+    def __init__(self, deadline: Optional[Deadline] = None, mode: str = 'live'):
+        self.deadline = deadline
+        self.mode = mode
+        self.aqi_service = AirQualityService(deadline)
+        self.routing_service = RoutingService(deadline)
+        # Route readings first, then the station snapshot for uncovered stretches,
+        # then the hour-of-week climatology where no station is near
+        self.exposure_service = ExposureService(sources=[SnapshotAQISource.current(),
+                                                         ClimatologyAQISource()])
+        self.route_cache = RouteCache()
+        self.aqi_model = AQIModelService.instance()
     
     # def find_optimal_route(self, start_lat: float, start_lng: float,
     #                       end_lat: float, end_lng: float,
@@ -667,49 +696,69 @@ class DijkstraOptimizer:
                       end_lat: float, end_lng: float,
                       priority: str = 'balanced',
                       pollutant_type: str = None,
-                      num_waypoints: int = 10) -> Dict:
+                      num_waypoints: int = 10,
+                      use_cache: bool = True,
+                      departure_time: Optional[float] = None) -> Dict:
+        """
+        Find optimal route based on priority, served from the route cache
+        when the same OD cells were routed against the current AQI snapshot.
+        With a departure_time (epoch seconds) every segment is costed with
+        the forecast AQI at the time it is reached.
+        """
+        if not use_cache:
+            return self._compute_optimal_route(start_lat, start_lng, end_lat, end_lng,
+                                               priority, pollutant_type, num_waypoints,
+                                               departure_time)
+        
+        cache_key = self.route_cache.make_key(start_lat, start_lng, end_lat, end_lng,
+                                              priority, pollutant_type, departure_time)
+        cached = self.route_cache.get(cache_key)
+        if cached is not None:
+            logger.debug("%s route served from cache", priority)
+            # Entries are shared across a departure slot; the times are this caller's
+            cached['departure_time'] = departure_time
+            cached['arrival_time'] = departure_time + cached['duration'] * 60 if departure_time is not None else None
+            return cached
+        
+        result = self._compute_optimal_route(start_lat, start_lng, end_lat, end_lng,
+                                             priority, pollutant_type, num_waypoints,
+                                             departure_time)
+        if result and not result['partial'] and self.mode == 'live':
+            self.route_cache.set(cache_key, result)
+        return result
+    
+    def _compute_optimal_route(self, start_lat: float, start_lng: float,
+                               end_lat: float, end_lng: float,
+                               priority: str = 'balanced',
+                               pollutant_type: str = None,
+                               num_waypoints: int = 10,
+                               departure_time: Optional[float] = None) -> Dict:
         """
         Find optimal route based on priority using different routing strategies
         """
         
-        print(f"\n   🔍 Finding {priority.upper()} route...")
+        logger.debug("Finding %s route", priority)
+        skipped_before = self._skipped()
         
         # Get base route
-        base_route = self.routing_service.get_route(
-            (start_lng, start_lat),
-            (end_lng, end_lat)
-        )
+        with span('base_route'):
+            base_route = self.routing_service.get_route(
+                (start_lng, start_lat),
+                (end_lng, end_lat)
+            )
         
         if not base_route:
-            print("   ✗ Could not get base route")
+            logger.warning("Could not get base route")
             return None
         
-        # For shortest priority - return direct route
-        if priority == 'shortest':
-            print("   → Using DIRECT shortest path")
-            sampled_points = self.routing_service.sample_route_points(
-                base_route['coordinates'],
-                num_samples=8
-            )
-            aqi_data_list = self.aqi_service.get_multiple_aqi_for_route(sampled_points)
-            avg_aqi = np.mean([data['aqi'] for data in aqi_data_list if data.get('aqi', 0) > 0]) if aqi_data_list else 100
+        # For shortest priority (or when detours are off) - return direct route
+        if priority == 'shortest' or self.mode == 'shortest_only':
+            sampled_points, aqi_data_list = self._sample_route_aqi(base_route)
             
-            return {
-                'distance': base_route['distance'],
-                'duration': base_route['duration'],
-                'average_aqi': float(avg_aqi),
-                'aqi_data': aqi_data_list,
-                'geometry': base_route['geometry'],
-                'coordinates': base_route['coordinates'],
-                'sampled_points': sampled_points,
-                'optimal_path_indices': list(range(len(sampled_points))),
-                'dijkstra_cost': base_route['distance'],
-                'priority': priority
-            }
+            return self._build_route_result(base_route, sampled_points, aqi_data_list, priority,
+                                            departure_time, skipped_before)
         
         # For other priorities, calculate different detours
-        print(f"   → Generating alternative route for {priority}...")
-        
         mid_lat = (start_lat + end_lat) / 2
         mid_lng = (start_lng + end_lng) / 2
         bearing = self._calculate_bearing(start_lat, start_lng, end_lat, end_lng)
@@ -762,7 +811,7 @@ class DijkstraOptimizer:
         
         config = detour_configs.get(priority, detour_configs['balanced'])
         
-        print(f"   → {config['description']}: {config['distance']:.1f}km at {config['angle']}°")
+        logger.debug("%s: %.1fkm at %s°", config['description'], config['distance'], config['angle'])
         
         # Calculate detour angle based on side
         if config['side'] == 'right':
@@ -777,49 +826,174 @@ class DijkstraOptimizer:
             detour_bearing
         )
         
-        print(f"   → Trying waypoint at ({waypoint_lat:.4f}, {waypoint_lng:.4f})...")
-        
         # Try the detour route
         alternative_route = None
         try:
-            route = self.routing_service.get_route_via_waypoint(
-                (start_lng, start_lat),
-                (waypoint_lng, waypoint_lat),
-                (end_lng, end_lat)
-            )
+            with span('detour'):
+                route = self.routing_service.get_route_via_waypoint(
+                    (start_lng, start_lat),
+                    (waypoint_lng, waypoint_lat),
+                    (end_lng, end_lat)
+                )
             if route and route['distance'] > base_route['distance'] * 1.05:  # At least 5% longer
-                print(f"   ✓ Detour successful: {route['distance']:.2f}km vs {base_route['distance']:.2f}km direct")
+                logger.debug("Detour via (%.4f, %.4f): %.2fkm vs %.2fkm direct",
+                             waypoint_lat, waypoint_lng, route['distance'], base_route['distance'])
                 alternative_route = route
             else:
-                print(f"   ⚠ Detour too similar, using direct route")
+                logger.debug("Detour too similar, using direct route")
         except Exception as e:
-            print(f"   ⚠ Detour failed: {e}")
+            logger.warning("Detour failed: %s", e)
         
         # Use alternative route if found, otherwise use base route
         final_route = alternative_route if alternative_route else base_route
+        if alternative_route and departure_time is not None:
+            final_route = self._pick_by_forecast(base_route, alternative_route, priority, departure_time)
         
         # Sample and get AQI data
-        sampled_points = self.routing_service.sample_route_points(
-            final_route['coordinates'],
-            num_samples=12
+        sampled_points, aqi_data_list = self._sample_route_aqi(final_route)
+        result = self._build_route_result(final_route, sampled_points, aqi_data_list, priority,
+                                          departure_time, skipped_before)
+        
+        logger.debug("Route AQI %.1f, exposure %.0f AQI·min", result['average_aqi'], result['exposure'])
+        
+        return result
+    
+    def find_multi_stop_route(self, start_lat: float, start_lng: float,
+                              stops: List[Tuple[float, float]],
+                              end_lat: float, end_lng: float,
+                              objective: str = 'balanced',
+                              exposure_weight: Optional[float] = None,
+                              priority: str = 'balanced') -> Optional[Dict]:
+        """
+        Visit an unordered set of (lat, lng) stops between start and end.
+        The order is solved against the stop-to-stop exposure matrix with a
+        distance/exposure objective, then the ordered stops are routed.
+        Exposure is scored against the AQI snapshot, without per-route WAQI calls.
+        """
+        if exposure_weight is None:
+            if objective not in OBJECTIVE_WEIGHTS:
+                raise ValueError(f"objective must be one of {', '.join(OBJECTIVE_WEIGHTS)}")
+            exposure_weight = OBJECTIVE_WEIGHTS[objective]
+        if not 0.0 <= exposure_weight <= 1.0:
+            raise ValueError('exposure_weight must be between 0 and 1')
+        
+        logger.debug("Ordering %d stops (%.0f%% exposure)", len(stops), exposure_weight * 100)
+        
+        skipped_before = self._skipped()
+        points = [(start_lat, start_lng)] + list(stops) + [(end_lat, end_lng)]
+        matrices = ExposureMatrixService().compute(points, points,
+                                                   mode=settings.MULTI_STOP_MATRIX_MODE)
+        if matrices is None:
+            logger.warning("Could not get stop matrix")
+            return None
+        
+        cost = blended_cost(matrices['distance'], matrices['exposure'], exposure_weight)
+        order = order_stops(cost, start=0, end=len(points) - 1)
+        
+        route = self.routing_service.get_multi_stop_route(
+            [(points[i][1], points[i][0]) for i in order]
         )
+        if not route:
+            logger.warning("Could not route through stops")
+            return None
         
-        aqi_data_list = self.aqi_service.get_multiple_aqi_for_route(sampled_points)
-        avg_aqi = np.mean([data['aqi'] for data in aqi_data_list if data.get('aqi', 0) > 0]) if aqi_data_list else 100
+        result = self._build_route_result(route, [], [], priority, skipped_before=skipped_before)
+        # Positions in the caller's stop list, in visit order
+        result['stop_order'] = [i - 1 for i in order[1:-1]]
+        result['stops'] = [{'lat': points[i][0], 'lng': points[i][1]} for i in order[1:-1]]
+        result['legs'] = route['legs']
         
-        print(f"   ✓ Route AQI: {avg_aqi:.1f}\n")
+        logger.debug("%d stops: %.2fkm, exposure %.0f AQI·min", len(stops), result['distance'], result['exposure'])
+        
+        return result
+    
+    def _sample_route_aqi(self, route: Dict) -> Tuple[List[Tuple[float, float]], List[Dict]]:
+        """
+        Adaptively sample a route and fetch AQI within the per-request lookup budget
+        (nothing outside live mode; scoring then uses the raster sources)
+        """
+        if self.mode != 'live':
+            return [], []
+        with span('aqi_fanout'):
+            return self.routing_service.adaptive_sample_route_points(
+                route['coordinates'],
+                self._fetch_aqi,
+                spacing_km=settings.AQI_SAMPLE_SPACING_KM,
+                aqi_threshold=settings.AQI_REFINE_THRESHOLD,
+                max_lookups=settings.AQI_LOOKUP_BUDGET
+            )
+    
+    def _pick_by_forecast(self, base_route: Dict, detour_route: Dict,
+                          priority: str, departure_time: float) -> Dict:
+        """
+        Choose between the direct and detour routes by forecast exposure
+        over the trip, scored against the snapshot (no extra WAQI calls)
+        """
+        with span('scoring'):
+            forecast = HourlyAQILayers.current()
+            base = self.exposure_service.integrate_route(base_route, departure=departure_time,
+                                                         forecast=forecast)['exposure']
+            detour = self.exposure_service.integrate_route(detour_route, departure=departure_time,
+                                                           forecast=forecast)['exposure']
+        
+        if priority == 'balanced':
+            # Same 60/40 split as the search weights, relative to the direct route
+            detour_cost = 0.6 * detour_route['distance'] / base_route['distance'] + 0.4 * detour / base if base > 0 else 1.0
+            use_detour = detour_cost < 1.0
+        else:
+            use_detour = detour < base
+        
+        logger.debug("Forecast exposure: direct %.0f, detour %.0f AQI·min", base, detour)
+        return detour_route if use_detour else base_route
+    
+    def _fetch_aqi(self, points: List[Tuple[float, float]]) -> List[Optional[Dict]]:
+        """WAQI readings for a batch of points, with model estimates for missing or stale ones"""
+        return self.aqi_model.fill_readings(points, self.aqi_service.get_aqi_for_points(points))
+    
+    def _skipped(self) -> int:
+        """Upstream calls skipped so far for the request deadline"""
+        return self.deadline.skipped if self.deadline is not None else 0
+    
+    def _build_route_result(self, route: Dict, sampled_points: List[Tuple[float, float]],
+                            aqi_data_list: List[Dict], priority: str,
+                            departure_time: Optional[float] = None,
+                            skipped_before: int = 0) -> Dict:
+        """
+        Score a route over its full polyline and assemble the optimizer result.
+        average_aqi is duration-weighted, so dense vertex clusters don't skew it.
+        It is partial when calls were skipped since skipped_before, the count
+        when this route's computation started.
+        """
+        with span('scoring'):
+            forecast = HourlyAQILayers.current() if departure_time is not None else None
+            exposure = self.exposure_service.integrate_route(route, aqi_data_list,
+                                                             departure=departure_time,
+                                                             forecast=forecast)
+        profile = exposure['profile']
         
         return {
-            'distance': final_route['distance'],
-            'duration': final_route['duration'],
-            'average_aqi': float(avg_aqi),
+            'distance': route['distance'],
+            'duration': route['duration'],
+            'average_aqi': exposure['average_aqi'],
+            'exposure': exposure['exposure'],
+            'peak_aqi': exposure['peak_aqi'],
+            'exposure_profile': {
+                'distance_km': profile['distance_km'].tolist(),
+                'duration_min': profile['duration_min'].tolist(),
+                'aqi': profile['aqi'].tolist()
+            },
             'aqi_data': aqi_data_list,
-            'geometry': final_route['geometry'],
-            'coordinates': final_route['coordinates'],
+            'geometry': route['geometry'],
+            'coordinates': route['coordinates'],
             'sampled_points': sampled_points,
             'optimal_path_indices': list(range(len(sampled_points))),
-            'dijkstra_cost': final_route['distance'],
-            'priority': priority
+            'dijkstra_cost': route['distance'],
+            'priority': priority,
+            'departure_time': departure_time,
+            'arrival_time': departure_time + route['duration'] * 60 if departure_time is not None else None,
+            # Some of this route's calls were skipped or abandoned for the request deadline
+            'partial': self._skipped() > skipped_before,
+            'service_mode': self.mode
         }
 
 
@@ -863,6 +1037,38 @@ class DijkstraOptimizer:
         
         return new_lat, new_lon
     
+    def departure_window(self, start_lat: float, start_lng: float,
+                         end_lat: float, end_lng: float,
+                         departures: List[float],
+                         priorities: Optional[List[str]] = None) -> Dict:
+        """
+        Forecast exposure of each priority's route for every departure
+        (epoch seconds). Routes are found once and only exposure is
+        recomputed per departure.
+        Returns: {priority: {'route': optimizer result, 'exposure': (D,) array}}
+        """
+        priorities = priorities or ['shortest', 'balanced', 'cleanest']
+        forecast = HourlyAQILayers.current()
+        departures = np.asarray(departures, dtype=float)
+        
+        results = {}
+        for priority in priorities:
+            # Keyed like find_route, so pollutant priorities share its cache entries
+            route = self.find_optimal_route(start_lat, start_lng, end_lat, end_lng, priority=priority,
+                                            pollutant_type=pollutant_type_for(priority))
+            if not route:
+                results[priority] = None
+                continue
+            profile = route['exposure_profile']
+            results[priority] = {
+                'route': route,
+                'exposure': self.exposure_service.exposure_by_departure(
+                    route['coordinates'], profile['duration_min'], profile['aqi'],
+                    departures, forecast
+                )
+            }
+        return results
+    
     def compare_routes(self, start_lat: float, start_lng: float,
                       end_lat: float, end_lng: float) -> Dict:
         """
@@ -0,0 +1,142 @@
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+from django.conf import settings
+
+from .aqi_snapshot import SnapshotAQISource
+from .climatology import ClimatologyAQISource
+from .exposure_service import ExposureService
+from .geo_utils import haversine_km
+from .graph_search import accumulate_along_tree, dijkstra
+from .routing_service import RoutingService
+from .zone_matrix import ZONE_PRIORITIES, ZoneMatrixBuilder, edge_weight
+
+MATRIX_MODES = ('zone', 'ors')
+
+
+class ExposureMatrixService:
+    """
+    Many-to-many distance (km), duration (min) and exposure (AQI·min)
+    matrices between sources and destinations, scored against the latest
+    AQI snapshot (and climatology) without any per-pair WAQI calls.
+
+    'zone' mode runs one graph search per source over the zone graph;
+    'ors' mode uses road distances and durations from the ORS matrix API.
+    """
+
+    def __init__(self, aqi_source: Optional[SnapshotAQISource] = None,
+                 routing_service: Optional[RoutingService] = None):
+        self.aqi_source = aqi_source or SnapshotAQISource.current()
+        self.exposure_service = ExposureService(sources=[self.aqi_source, ClimatologyAQISource()])
+        self._routing_service = routing_service
+
+    @property
+    def routing_service(self) -> RoutingService:
+        if self._routing_service is None:
+            self._routing_service = RoutingService()
+        return self._routing_service
+
+    def compute(self, sources: Sequence[Tuple[float, float]],
+                destinations: Sequence[Tuple[float, float]],
+                mode: str = 'zone', priority: str = 'shortest') -> Optional[Dict[str, np.ndarray]]:
+        """
+        sources, destinations: (lat, lng) points
+        Returns: {'distance' | 'duration' | 'exposure': N x M arrays}, inf where
+        a pair could not be routed; None if the ORS matrix call failed
+        """
+        if mode not in MATRIX_MODES:
+            raise ValueError(f"mode must be one of {', '.join(MATRIX_MODES)}")
+        if priority not in ZONE_PRIORITIES:
+            raise ValueError(f"priority must be one of {', '.join(ZONE_PRIORITIES)}")
+
+        sources = np.asarray(sources, dtype=float).reshape(-1, 2)
+        destinations = np.asarray(destinations, dtype=float).reshape(-1, 2)
+        if mode == 'ors':
+            return self._ors_matrices(sources, destinations)
+        return self._zone_matrices(sources, destinations, priority)
+
+    def _zone_matrices(self, sources: np.ndarray, destinations: np.ndarray,
+                       priority: str) -> Dict[str, np.ndarray]:
+        builder = ZoneMatrixBuilder(aqi_source=self.aqi_source)
+        grid = builder.grid
+        zone_aqi = builder.zone_aqi()
+        graph, distance, duration, edge_aqi = builder.zone_graph(zone_aqi)
+        weights = edge_weight(distance, edge_aqi, priority)
+        edge_exposure = duration * edge_aqi
+
+        source_zones = grid.zone_of(sources[:, 0], sources[:, 1])
+        dest_zones = grid.zone_of(destinations[:, 0], destinations[:, 1])
+
+        # Centroid-to-centroid totals, one search per distinct source zone
+        unique_sources, source_rows = np.unique(source_zones, return_inverse=True)
+        targets = np.unique(dest_zones).tolist()
+        between = np.empty((3, len(unique_sources), len(destinations)))
+        for row, zone in enumerate(unique_sources.tolist()):
+            _, pred_edge, order = dijkstra(graph, zone, weights, targets=targets)
+            totals = accumulate_along_tree(graph, pred_edge, order,
+                                           [distance, duration, edge_exposure])
+            between[:, row] = totals[:, dest_zones]
+        between = between[:, source_rows]
+
+        # Access and egress legs between each point and its zone centroid
+        centroids = grid.centroids()
+        access = self._leg(sources, centroids[source_zones], zone_aqi[source_zones])
+        egress = self._leg(destinations, centroids[dest_zones], zone_aqi[dest_zones])
+        matrices = {
+            name: between[i] + access[i][:, None] + egress[i][None, :]
+            for i, name in enumerate(('distance', 'duration', 'exposure'))
+        }
+
+        # Points sharing a zone travel directly
+        same_zone = source_zones[:, None] == dest_zones[None, :]
+        if same_zone.any():
+            direct_km = self.exposure_service.straight_line_km(sources, destinations) * settings.ZONE_CIRCUITY
+            direct_min = direct_km / settings.ZONE_SPEED_KMPH * 60
+            direct_exposure = self.exposure_service.score_pairs(sources, destinations, direct_min, samples=4)
+            for name, direct in (('distance', direct_km), ('duration', direct_min),
+                                 ('exposure', direct_exposure)):
+                matrices[name] = np.where(same_zone, direct, matrices[name])
+
+        return matrices
+
+    def _leg(self, points: np.ndarray, centroids: np.ndarray,
+             zone_aqi: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(distance, duration, exposure) of the road legs between points and centroids"""
+        lengths = haversine_km(points[:, 0], points[:, 1],
+                               centroids[:, 0], centroids[:, 1]) * settings.ZONE_CIRCUITY
+        durations = lengths / settings.ZONE_SPEED_KMPH * 60
+        return lengths, durations, durations * zone_aqi
+
+    def _ors_matrices(self, sources: np.ndarray,
+                      destinations: np.ndarray) -> Optional[Dict[str, np.ndarray]]:
+        n, m = len(sources), len(destinations)
+        distances = np.full((n, m), np.inf)
+        durations = np.full((n, m), np.inf)
+
+        # Keep every request within the ORS matrix element limit
+        max_elements = settings.ORS_MATRIX_MAX_ELEMENTS
+        cols = min(m, max_elements)
+        rows = max(1, max_elements // cols)
+        for row_start in range(0, n, rows):
+            block_sources = sources[row_start:row_start + rows]
+            for col_start in range(0, m, cols):
+                block_dests = destinations[col_start:col_start + cols]
+                locations = [(lng, lat) for lat, lng in np.vstack([block_sources, block_dests]).tolist()]
+                result = self.routing_service.get_distance_matrix(
+                    locations,
+                    sources=list(range(len(block_sources))),
+                    destinations=list(range(len(block_sources), len(locations)))
+                )
+                if result is None:
+                    return None
+                block = (slice(row_start, row_start + len(block_sources)),
+                         slice(col_start, col_start + len(block_dests)))
+                distances[block] = result['distances']
+                durations[block] = result['durations']
+
+        distances[np.isnan(distances)] = np.inf
+        durations[np.isnan(durations)] = np.inf
+        exposure = self.exposure_service.score_pairs(sources, destinations,
+                                                     np.where(np.isinf(durations), 0.0, durations))
+        exposure[np.isinf(durations)] = np.inf
+        return {'distance': distances, 'duration': durations, 'exposure': exposure}
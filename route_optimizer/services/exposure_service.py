@@ -0,0 +1,248 @@
+import numpy as np
+from typing import Dict, List, Optional, Sequence
+
+from .geo_utils import as_coordinate_array, haversine_km, segment_lengths_km
+
+DEFAULT_AQI = 100.0
+
+
+def reading_value(reading: Dict, field: str = 'aqi', positive: bool = True) -> float:
+    """
+    Numeric value of a parsed AQI reading field (WAQI reports '-' for
+    unavailable values). Returns NaN when the value is missing, or with
+    positive (AQI and pollutants, where 0 is a placeholder) not above zero.
+    """
+    try:
+        value = float(reading.get(field))
+    except (TypeError, ValueError):
+        return np.nan
+    return value if value > 0 or not positive else np.nan
+
+
+class ReadingsAQISource:
+    """
+    AQI lookup against readings already fetched for a route.
+    Each position takes the value of its nearest reporting station.
+    """
+
+    def __init__(self, aqi_data: Optional[List[Dict]]):
+        readings = []
+        for data in aqi_data or []:
+            location = (data or {}).get('location') or {}
+            lat, lng = location.get('lat'), location.get('lng')
+            if lat and lng:
+                readings.append((float(lat), float(lng), data))
+
+        self.lats = np.array([r[0] for r in readings], dtype=float)
+        self.lngs = np.array([r[1] for r in readings], dtype=float)
+        self.readings = [r[2] for r in readings]
+
+    def lookup(self, lats: np.ndarray, lngs: np.ndarray, field: str = 'aqi') -> np.ndarray:
+        """AQI at each position, NaN where no station reports the field"""
+        result = np.full(len(lats), np.nan)
+        if not self.readings or len(lats) == 0:
+            return result
+
+        values = np.array([reading_value(r, field) for r in self.readings])
+        valid = ~np.isnan(values)
+        if not valid.any():
+            return result
+
+        # Squared planar distance is enough to rank stations within a city.
+        # Stations are few, so sweep them instead of building an N x K matrix.
+        lats = np.ascontiguousarray(lats, dtype=float)
+        lngs = np.ascontiguousarray(lngs, dtype=float)
+        kx2 = np.cos(np.radians(float(lats.mean()))) ** 2
+        best = np.full(len(lats), np.inf)
+        for lat, lng, value in zip(self.lats[valid], self.lngs[valid], values[valid]):
+            sq_dist = (lngs - lng) ** 2 * kx2 + (lats - lat) ** 2
+            closer = sq_dist < best
+            best[closer] = sq_dist[closer]
+            result[closer] = value
+
+        return result
+
+
+class ExposureService:
+    """
+    Length- and duration-weighted exposure integration over a full route polyline
+    """
+
+    def __init__(self, sources: Optional[Sequence] = None, default_aqi: float = DEFAULT_AQI):
+        # Sources are consulted in order, so list the fastest first
+        self.sources = list(sources or [])
+        self.default_aqi = default_aqi
+
+    def lookup_aqi(self, lats: np.ndarray, lngs: np.ndarray, field: str = 'aqi',
+                   sources: Optional[Sequence] = None) -> np.ndarray:
+        """
+        AQI at each position from the first source that has a value for it
+        """
+        values = np.full(len(lats), np.nan)
+        for source in (self.sources if sources is None else sources):
+            missing = np.isnan(values)
+            if not missing.any():
+                break
+            values[missing] = source.lookup(lats[missing], lngs[missing], field)
+
+        values[np.isnan(values)] = self.default_aqi
+        return values
+
+    def segment_durations(self, lengths: np.ndarray, duration_min: float,
+                          steps: Optional[List[Dict]] = None) -> np.ndarray:
+        """
+        Travel time (minutes) of every segment.
+        Uses per-step ORS durations where available so slow stretches get
+        more time; anything not covered by steps shares the remainder by length.
+        """
+        total_length = lengths.sum()
+        if total_length <= 0:
+            return np.zeros_like(lengths)
+
+        durations = np.full(len(lengths), np.nan)
+        if steps:
+            way_points = np.array([s.get('way_points', [0, 0])[:2] for s in steps], dtype=int)
+            step_minutes = np.array([s.get('duration', 0) for s in steps], dtype=float) / 60
+            starts = np.clip(way_points[:, 0], 0, len(lengths))
+            ends = np.clip(way_points[:, 1], 0, len(lengths))
+
+            cumulative = np.concatenate(([0.0], np.cumsum(lengths)))
+            step_lengths = cumulative[ends] - cumulative[starts]
+            minutes_per_km = np.divide(step_minutes, step_lengths,
+                                       out=np.zeros_like(step_minutes),
+                                       where=step_lengths > 0)
+
+            covered = np.zeros(len(lengths) + 1, dtype=int)
+            np.add.at(covered, starts, 1)
+            np.add.at(covered, ends, -1)
+            covered = np.cumsum(covered[:-1]) > 0
+
+            step_of_segment = np.searchsorted(starts, np.arange(len(lengths)), side='right') - 1
+            step_of_segment = np.clip(step_of_segment, 0, len(steps) - 1)
+            durations[covered] = lengths[covered] * minutes_per_km[step_of_segment[covered]]
+
+        uncovered = np.isnan(durations)
+        if uncovered.any():
+            known = durations[~uncovered].sum()
+            remainder = duration_min - known
+            uncovered_length = lengths[uncovered].sum()
+            if remainder > 0 and uncovered_length > 0:
+                durations[uncovered] = lengths[uncovered] * remainder / uncovered_length
+            else:
+                durations[uncovered] = lengths[uncovered] * duration_min / total_length
+
+        # Keep the per-segment times consistent with the route total
+        if duration_min > 0 and durations.sum() > 0:
+            durations *= duration_min / durations.sum()
+
+        return durations
+
+    def integrate_route(self, route: Dict, aqi_data: Optional[List[Dict]] = None,
+                        field: str = 'aqi', departure: Optional[float] = None,
+                        forecast=None) -> Dict:
+        """
+        Integrated exposure (AQI·min), peak-segment AQI and per-segment
+        profile for a parsed route.
+        With a departure (epoch seconds) and forecast layers, each segment's
+        AQI is scaled to the forecast at the time it is reached.
+        """
+        coords = as_coordinate_array(route['coordinates'])
+        sources = [ReadingsAQISource(aqi_data)] + self.sources if aqi_data else self.sources
+
+        if len(coords) < 2:
+            aqi = self.lookup_aqi(coords[:, 1], coords[:, 0], field, sources)
+            peak = float(aqi.max()) if len(aqi) else self.default_aqi
+            return {
+                'exposure': 0.0,
+                'peak_aqi': peak,
+                'average_aqi': peak,
+                'profile': {
+                    'distance_km': np.zeros(0),
+                    'duration_min': np.zeros(0),
+                    'aqi': np.zeros(0),
+                    'arrival': None,
+                }
+            }
+
+        lengths = segment_lengths_km(coords)
+        durations = self.segment_durations(lengths, float(route.get('duration') or 0),
+                                           route.get('steps'))
+
+        midpoints = (coords[:-1] + coords[1:]) / 2
+        aqi = self.lookup_aqi(midpoints[:, 1], midpoints[:, 0], field, sources)
+        arrival = None
+        if departure is not None and forecast is not None:
+            # Time each segment midpoint is reached; durations are non-negative,
+            # so arrivals are monotone along the route (FIFO)
+            arrival = departure + (np.cumsum(durations) - durations / 2) * 60
+            aqi = aqi * forecast.factors(midpoints[:, 1], midpoints[:, 0], arrival)
+
+        total_duration = durations.sum()
+        exposure = float(np.dot(aqi, durations))
+        if total_duration > 0:
+            average = exposure / total_duration
+        elif lengths.sum() > 0:
+            average = float(np.dot(aqi, lengths) / lengths.sum())
+        else:
+            average = float(aqi.mean())
+
+        return {
+            'exposure': exposure,
+            'peak_aqi': float(aqi.max()),
+            'average_aqi': float(average),
+            'profile': {
+                'distance_km': lengths,
+                'duration_min': durations,
+                'aqi': aqi,
+                'arrival': arrival,
+            }
+        }
+
+    def exposure_by_departure(self, coordinates, durations: np.ndarray, aqi: np.ndarray,
+                              departures: np.ndarray, forecast) -> np.ndarray:
+        """
+        Exposure (AQI·min) of one route for each departure (epoch seconds),
+        from its per-segment durations and current AQI. The geometry is
+        shared, so all departures are scored in a single vectorized pass.
+        """
+        coords = as_coordinate_array(coordinates)
+        durations = np.asarray(durations, dtype=float)
+        aqi = np.asarray(aqi, dtype=float)
+        departures = np.asarray(departures, dtype=float)
+        if len(coords) < 2:
+            return np.zeros(len(departures))
+
+        midpoints = (coords[:-1] + coords[1:]) / 2
+        offsets = (np.cumsum(durations) - durations / 2) * 60
+        arrivals = departures[:, None] + offsets[None, :]
+        factors = forecast.factors(np.tile(midpoints[:, 1], len(departures)),
+                                   np.tile(midpoints[:, 0], len(departures)),
+                                   arrivals.ravel()).reshape(arrivals.shape)
+        return factors @ (aqi * durations)
+
+    def score_pairs(self, origins: np.ndarray, destinations: np.ndarray,
+                    durations: np.ndarray, samples: int = 16,
+                    field: str = 'aqi') -> np.ndarray:
+        """
+        Batched exposure (AQI·min) for every origin x destination pair when
+        only trip durations are known (e.g. from a distance matrix): AQI is
+        averaged over points sampled on the straight line between the two.
+        origins (N, 2) and destinations (M, 2) are (lat, lng); durations is N x M.
+        """
+        origins = np.asarray(origins, dtype=float).reshape(-1, 2)
+        destinations = np.asarray(destinations, dtype=float).reshape(-1, 2)
+        t = (np.arange(samples) + 0.5) / samples
+
+        # (N, M, samples) sample positions
+        lats = origins[:, None, None, 0] + (destinations[None, :, None, 0] - origins[:, None, None, 0]) * t
+        lngs = origins[:, None, None, 1] + (destinations[None, :, None, 1] - origins[:, None, None, 1]) * t
+
+        aqi = self.lookup_aqi(lats.ravel(), lngs.ravel(), field).reshape(lats.shape)
+        return aqi.mean(axis=2) * np.asarray(durations, dtype=float)
+
+    def straight_line_km(self, origins: np.ndarray, destinations: np.ndarray) -> np.ndarray:
+        """N x M great-circle distances between (lat, lng) points"""
+        origins = np.asarray(origins, dtype=float).reshape(-1, 2)
+        destinations = np.asarray(destinations, dtype=float).reshape(-1, 2)
+        return haversine_km(origins[:, None, 0], origins[:, None, 1],
+                            destinations[None, :, 0], destinations[None, :, 1])
@@ -0,0 +1,72 @@
+import itertools
+from typing import Sequence
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def as_coordinate_array(coordinates: Sequence[Sequence[float]]) -> np.ndarray:
+    """
+    Convert a polyline ([[lng, lat], ...]) to an (N, 2) float array
+    """
+    if isinstance(coordinates, np.ndarray):
+        return coordinates.astype(float, copy=False).reshape(-1, 2)
+
+    if not len(coordinates):
+        return np.zeros((0, 2))
+
+    # ORS polylines are 2D unless elevation was requested
+    if len(coordinates[0]) == 2:
+        points = itertools.chain.from_iterable(coordinates)
+    else:
+        points = itertools.chain.from_iterable(coord[:2] for coord in coordinates)
+
+    flat = np.fromiter(points, dtype=float, count=2 * len(coordinates))
+    return flat.reshape(-1, 2)
+
+
+def haversine_km(lat1, lng1, lat2, lng2) -> np.ndarray:
+    """Vectorized great-circle distance in kilometres"""
+    lat1 = np.radians(lat1)
+    lat2 = np.radians(lat2)
+    dlat = lat2 - lat1
+    dlng = np.radians(np.asarray(lng2) - np.asarray(lng1))
+
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlng / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def segment_lengths_km(coords: np.ndarray) -> np.ndarray:
+    """Length of every segment of an (N, 2) [lng, lat] polyline"""
+    return haversine_km(coords[:-1, 1], coords[:-1, 0], coords[1:, 1], coords[1:, 0])
+
+
+def cumulative_distance_km(coords: np.ndarray) -> np.ndarray:
+    """Distance from the first vertex to every vertex, starting at 0"""
+    cumulative = np.zeros(len(coords))
+    if len(coords) > 1:
+        np.cumsum(segment_lengths_km(coords), out=cumulative[1:])
+    return cumulative
+
+
+def local_xy_km(lats, lngs, ref_lat: float) -> np.ndarray:
+    """
+    Project lat/lng onto a local equirectangular plane (km).
+    Accurate to well under 1% across a city-sized area.
+    """
+    kx = np.radians(1.0) * EARTH_RADIUS_KM * np.cos(np.radians(ref_lat))
+    ky = np.radians(1.0) * EARTH_RADIUS_KM
+    return np.stack([np.asarray(lngs) * kx, np.asarray(lats) * ky], axis=-1)
+
+
+
+def interpolate_along(coords: np.ndarray, cumulative: np.ndarray,
+                      targets_km) -> np.ndarray:
+    """
+    Points ([lng, lat]) located at the given distances along a polyline
+    """
+    targets_km = np.clip(np.asarray(targets_km, dtype=float), 0.0, cumulative[-1])
+    lngs = np.interp(targets_km, cumulative, coords[:, 0])
+    lats = np.interp(targets_km, cumulative, coords[:, 1])
+    return np.stack([lngs, lats], axis=-1)
@@ -0,0 +1,358 @@
+import heapq
+import numpy as np
+from typing import Optional, Sequence, Tuple
+
+
+class CSRGraph:
+    """
+    Directed graph in compressed sparse row form: the out-edges of node u
+    are indices[indptr[u]:indptr[u + 1]], with matching per-edge arrays.
+    """
+
+    def __init__(self, num_nodes: int, sources: np.ndarray, targets: np.ndarray):
+        order = np.argsort(sources, kind='stable')
+        self.num_nodes = num_nodes
+        self.edge_order = order  # maps CSR edge position -> input edge index
+        self.indices = np.asarray(targets)[order]
+        self.indptr = np.zeros(num_nodes + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sources, minlength=num_nodes), out=self.indptr[1:])
+
+    def edge_values(self, values: np.ndarray) -> np.ndarray:
+        """Reorder per-edge values given in input edge order to CSR order"""
+        return np.asarray(values)[self.edge_order]
+
+
+def dijkstra(graph: CSRGraph, source: int, weights: np.ndarray,
+             targets: Optional[Sequence[int]] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    One-to-many Dijkstra over CSR-ordered edge weights.
+    Stops early once every node in targets is settled.
+    Returns: (cost to each node, predecessor edge position or -1,
+              nodes in the order they were settled)
+    """
+    indptr = graph.indptr.tolist()
+    indices = graph.indices.tolist()
+    weights = weights.tolist()
+    best = [np.inf] * graph.num_nodes
+    best[source] = 0.0
+    pred_edge = [-1] * graph.num_nodes
+    settled = [False] * graph.num_nodes
+    order = []
+    remaining = set(targets) if targets is not None else None
+
+    heap = [(0.0, source)]
+    while heap:
+        dist, node = heapq.heappop(heap)
+        if settled[node]:
+            continue
+        settled[node] = True
+        order.append(node)
+        if remaining is not None:
+            remaining.discard(node)
+            if not remaining:
+                break
+
+        for edge in range(indptr[node], indptr[node + 1]):
+            neighbour = indices[edge]
+            candidate = dist + weights[edge]
+            if candidate < best[neighbour]:
+                best[neighbour] = candidate
+                pred_edge[neighbour] = edge
+                heapq.heappush(heap, (candidate, neighbour))
+
+    # Costs of nodes that were reached but not settled are not final
+    cost = np.full(graph.num_nodes, np.inf)
+    order = np.array(order, dtype=np.int64)
+    cost[order] = np.array(best)[order]
+    return cost, np.array(pred_edge, dtype=np.int64), order
+
+
+def accumulate_along_tree(graph: CSRGraph, pred_edge: np.ndarray, order: np.ndarray,
+                          edge_values: Sequence[np.ndarray]) -> np.ndarray:
+    """
+    Sum secondary per-edge values (CSR order) along a shortest-path tree.
+    Returns an array of shape (len(edge_values), num_nodes); unreached nodes are inf.
+    """
+    edge_values = [np.asarray(values, dtype=float).tolist() for values in edge_values]
+    totals = [[np.inf] * graph.num_nodes for _ in edge_values]
+    if len(order) == 0:
+        return np.array(totals).reshape(len(edge_values), graph.num_nodes)
+
+    for total in totals:
+        total[order[0]] = 0.0
+
+    # Parent of every settled node, found from its predecessor edge
+    edges = pred_edge[order[1:]]
+    parents = np.searchsorted(graph.indptr, edges, side='right') - 1
+    for node, parent, edge in zip(order[1:].tolist(), parents.tolist(), edges.tolist()):
+        for total, values in zip(totals, edge_values):
+            total[node] = total[parent] + values[edge]
+    return np.array(totals)
+
+
+def reverse_graph(graph: CSRGraph) -> CSRGraph:
+    """
+    Graph with every edge reversed. Its edge_values() reorders per-edge
+    values given in the forward graph's CSR order.
+    """
+    owners = np.repeat(np.arange(graph.num_nodes), np.diff(graph.indptr))
+    return CSRGraph(graph.num_nodes, graph.indices, owners)
+
+
+def bidirectional_dijkstra(graph: CSRGraph, backward: CSRGraph, source: int, target: int,
+                           weights: np.ndarray, backward_weights: np.ndarray) -> Tuple[float, list, int]:
+    """
+    Point-to-point Dijkstra searching from both ends at once.
+    backward is reverse_graph(graph), backward_weights the same weights in its order.
+    Returns: (cost, path nodes from source to target, nodes settled); inf and [] if unreachable
+    """
+    # Otherwise a cycle through source would meet itself before the empty path
+    if source == target:
+        return 0.0, [source], 0
+
+    sides = []
+    for g, w, start in ((graph, weights, source), (backward, backward_weights, target)):
+        best = {start: 0.0}
+        sides.append({'indptr': g.indptr.tolist(), 'indices': g.indices.tolist(), 'weights': w.tolist(),
+                      'best': best, 'parent': {start: -1}, 'settled': set(), 'heap': [(0.0, start)]})
+
+    mu, meeting, settled = np.inf, -1, 0
+    forward, backward_side = sides
+    while forward['heap'] and backward_side['heap']:
+        if forward['heap'][0][0] + backward_side['heap'][0][0] >= mu:
+            break
+        side, other = (forward, backward_side) if forward['heap'][0][0] <= backward_side['heap'][0][0] \
+            else (backward_side, forward)
+        dist, node = heapq.heappop(side['heap'])
+        if node in side['settled']:
+            continue
+        side['settled'].add(node)
+        settled += 1
+
+        indptr, indices, w, best = side['indptr'], side['indices'], side['weights'], side['best']
+        for edge in range(indptr[node], indptr[node + 1]):
+            neighbour = indices[edge]
+            candidate = dist + w[edge]
+            if candidate < best.get(neighbour, np.inf):
+                best[neighbour] = candidate
+                side['parent'][neighbour] = node
+                heapq.heappush(side['heap'], (candidate, neighbour))
+            if neighbour in other['best'] and candidate + other['best'][neighbour] < mu:
+                mu, meeting = candidate + other['best'][neighbour], neighbour
+
+    if meeting == -1:
+        return np.inf, [], settled
+
+    path = []
+    node = meeting
+    while node != -1:
+        path.append(node)
+        node = forward['parent'][node]
+    path.reverse()
+    node = backward_side['parent'][meeting]
+    while node != -1:
+        path.append(node)
+        node = backward_side['parent'][node]
+    return float(mu), path, settled
+
+
+def astar(graph: CSRGraph, source: int, target: int, weights: np.ndarray,
+          potential: np.ndarray) -> Tuple[float, list, int]:
+    """
+    Point-to-point A*. potential[u] must never exceed the true cost from u
+    to target (e.g. straight-line distance at the best cost per km).
+    Returns: (cost, path nodes from source to target, nodes settled)
+    """
+    indptr = graph.indptr.tolist()
+    indices = graph.indices.tolist()
+    weights = weights.tolist()
+    potential = np.asarray(potential, dtype=float).tolist()
+    best = {source: 0.0}
+    parent = {source: -1}
+    closed = set()
+
+    heap = [(potential[source], 0.0, source)]
+    while heap:
+        _, dist, node = heapq.heappop(heap)
+        if node in closed:
+            continue
+        closed.add(node)
+        if node == target:
+            path = [node]
+            while parent[node] != -1:
+                node = parent[node]
+                path.append(node)
+            return dist, path[::-1], len(closed)
+
+        for edge in range(indptr[node], indptr[node + 1]):
+            neighbour = indices[edge]
+            candidate = dist + weights[edge]
+            if candidate < best.get(neighbour, np.inf):
+                best[neighbour] = candidate
+                parent[neighbour] = node
+                heapq.heappush(heap, (candidate + potential[neighbour], candidate, neighbour))
+    return np.inf, [], len(closed)
+
+
+class ContractionHierarchy:
+    """
+    Contraction hierarchy over fixed edge weights. Nodes are contracted in
+    lazily updated edge-difference order, adding shortcuts wherever a
+    bounded witness search finds no path avoiding the contracted node.
+    Queries are bidirectional searches along upward edges only.
+    """
+
+    def __init__(self, graph: CSRGraph, weights: np.ndarray, witness_settle_limit: int = 60):
+        self.num_nodes = graph.num_nodes
+        self.witness_settle_limit = witness_settle_limit
+        self._contract(graph, np.asarray(weights, dtype=float))
+
+    def _contract(self, graph: CSRGraph, weights: np.ndarray):
+        n = graph.num_nodes
+        out_adj = [dict() for _ in range(n)]
+        in_adj = [dict() for _ in range(n)]
+        owners = np.repeat(np.arange(n), np.diff(graph.indptr)).tolist()
+        for u, v, w in zip(owners, graph.indices.tolist(), weights.tolist()):
+            if u != v and w < out_adj[u].get(v, np.inf):
+                out_adj[u][v] = w
+                in_adj[v][u] = w
+
+        self.middle = {}  # shortcut (u, w) -> contracted node it bypasses
+        contracted = [False] * n
+        depth = [0] * n
+        rank = [0] * n
+        up_out, up_in = [None] * n, [None] * n
+
+        def shortcuts(v):
+            added = []
+            for u, w_uv in in_adj[v].items():
+                if not out_adj[v]:
+                    break
+                limit = max(w_uv + w_vw for w_vw in out_adj[v].values())
+                witness = self._witness(out_adj, u, v, limit)
+                for x, w_vx in out_adj[v].items():
+                    if x != u and witness.get(x, np.inf) > w_uv + w_vx:
+                        added.append((u, x, w_uv + w_vx))
+            return added
+
+        def priority(v):
+            return (len(shortcuts(v)) - len(in_adj[v]) - len(out_adj[v])) + depth[v]
+
+        heap = [(priority(v), v) for v in range(n)]
+        heapq.heapify(heap)
+        next_rank = 0
+        while heap:
+            _, v = heapq.heappop(heap)
+            if contracted[v]:
+                continue
+            current = priority(v)
+            if heap and current > heap[0][0]:
+                heapq.heappush(heap, (current, v))
+                continue
+
+            for u, x, w in shortcuts(v):
+                if w < out_adj[u].get(x, np.inf):
+                    out_adj[u][x] = w
+                    in_adj[x][u] = w
+                    self.middle[(u, x)] = v
+            contracted[v] = True
+            rank[v] = next_rank
+            next_rank += 1
+            # Remaining edges of v all lead to higher-ranked nodes
+            up_out[v] = list(out_adj[v].items())
+            up_in[v] = list(in_adj[v].items())
+            for x in out_adj[v]:
+                del in_adj[x][v]
+                depth[x] = max(depth[x], depth[v] + 1)
+            for u in in_adj[v]:
+                del out_adj[u][v]
+                depth[u] = max(depth[u], depth[v] + 1)
+            out_adj[v], in_adj[v] = {}, {}
+
+        self.rank = np.array(rank, dtype=np.int64)
+        self.up_out = [dict(edges) for edges in up_out]
+        self.up_in = [dict(edges) for edges in up_in]
+        self.num_shortcuts = len(self.middle)
+
+    def _witness(self, out_adj, source: int, skip: int, limit: float) -> dict:
+        best = {source: 0.0}
+        heap = [(0.0, source)]
+        settled = 0
+        while heap and settled < self.witness_settle_limit:
+            dist, node = heapq.heappop(heap)
+            if dist > limit:
+                break
+            if dist > best[node]:
+                continue
+            settled += 1
+            for neighbour, w in out_adj[node].items():
+                if neighbour == skip:
+                    continue
+                candidate = dist + w
+                if candidate < best.get(neighbour, np.inf):
+                    best[neighbour] = candidate
+                    heapq.heappush(heap, (candidate, neighbour))
+        return best
+
+    def query(self, source: int, target: int) -> Tuple[float, list, int]:
+        """Returns: (cost, path nodes from source to target, nodes settled)"""
+        adjacency = (self.up_out, self.up_in)
+        best = ({source: 0.0}, {target: 0.0})
+        parent = ({source: -1}, {target: -1})
+        heaps = ([(0.0, source)], [(0.0, target)])
+        done = (set(), set())
+        mu, meeting, settled = np.inf, -1, 0
+
+        while heaps[0] or heaps[1]:
+            # Each direction stops once its frontier cannot improve the best meeting
+            active = [d for d in (0, 1) if heaps[d] and heaps[d][0][0] < mu]
+            if not active:
+                break
+            d = min(active, key=lambda side: heaps[side][0][0])
+            dist, node = heapq.heappop(heaps[d])
+            if node in done[d]:
+                continue
+            done[d].add(node)
+            settled += 1
+            if node in best[1 - d] and dist + best[1 - d][node] < mu:
+                mu, meeting = dist + best[1 - d][node], node
+            for neighbour, w in adjacency[d][node].items():
+                candidate = dist + w
+                if candidate < best[d].get(neighbour, np.inf):
+                    best[d][neighbour] = candidate
+                    parent[d][neighbour] = node
+                    heapq.heappush(heaps[d], (candidate, neighbour))
+
+        if meeting == -1:
+            return np.inf, [], settled
+
+        up_path = []
+        node = meeting
+        while node != -1:
+            up_path.append(node)
+            node = parent[0][node]
+        up_path.reverse()
+        node = parent[1][meeting]
+        while node != -1:
+            up_path.append(node)
+            node = parent[1][node]
+        return float(mu), self._unpack(up_path), settled
+
+    def _unpack(self, path: list) -> list:
+        """Replace shortcut edges by the original nodes they bypass"""
+        result = [path[0]]
+        stack = [(u, w) for u, w in zip(path[:-1], path[1:])][::-1]
+        while stack:
+            u, w = stack.pop()
+            middle = self.middle.get((u, w))
+            if middle is None:
+                result.append(w)
+            else:
+                stack.append((middle, w))
+                stack.append((u, middle))
+        return result
+
+    def nbytes(self) -> int:
+        """Approximate size of the upward graph: one (node, weight) pair per edge plus shortcut table"""
+        edges = sum(len(edges) for edges in self.up_out) + sum(len(edges) for edges in self.up_in)
+        return edges * 16 + self.num_shortcuts * 24 + self.rank.nbytes
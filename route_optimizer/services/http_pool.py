@@ -0,0 +1,26 @@
+"""
+Shared HTTP sessions for upstream APIs, one per service and process, so
+calls reuse pooled keep-alive connections instead of opening a new TLS
+connection each time. Headers and credentials are passed per request.
+"""
+import threading
+from typing import Dict
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+_sessions: Dict[str, requests.Session] = {}
+_sessions_lock = threading.Lock()
+
+
+def upstream_session(name: str) -> requests.Session:
+    """Session for one upstream ('ors', 'waqi'), pooling up to UPSTREAM_POOL_SIZE connections per host"""
+    with _sessions_lock:
+        session = _sessions.get(name)
+        if session is None:
+            session = _sessions[name] = requests.Session()
+            adapter = HTTPAdapter(pool_maxsize=settings.UPSTREAM_POOL_SIZE)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+        return session
@@ -0,0 +1,244 @@
+import csv
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+import numpy as np
+from django.conf import settings
+from django.db import connections
+from django.db.models import Max, Min
+from django.db.models.functions import ExtractHour, ExtractIsoWeekDay
+from django.utils import timezone
+
+from ..models import AQIReading
+from .aqi_model import FEATURES, POLLUTANTS, WEATHER, LinearAQIModel, fill_feature_defaults
+
+# Ridge penalty per model on standardized features (0 is ordinary least squares)
+MODEL_ALPHAS = {
+    'Linear Regression': 0.0,
+    'Ridge Regression': 1.0,
+}
+METRICS_COLUMNS = ['Model', 'Test RMSE', 'Test R²', 'Test MAE', 'CV R² Mean']
+
+# Sufficient statistics use z = [features..., 1, aqi]
+_ONE = len(FEATURES)
+_TARGET = len(FEATURES) + 1
+
+
+def row_groups(ids: np.ndarray, folds: int, test_size: float) -> np.ndarray:
+    """
+    Stable split of readings by id: group `folds` is the test set, groups
+    0..folds-1 are the cross-validation folds of the training set
+    """
+    # splitmix64 finalizer, so consecutive ids spread evenly
+    z = ids.astype(np.uint64) + np.uint64(0x9E3779B97F4A7C15)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    z = z ^ (z >> np.uint64(31))
+    u = (z >> np.uint64(11)).astype(float) / float(1 << 53)
+
+    groups = np.minimum(((u - test_size) / (1 - test_size) * folds).astype(int), folds - 1)
+    groups[u < test_size] = folds
+    return groups
+
+
+def fit_from_stats(stats: np.ndarray, alpha: float = 0.0) -> LinearAQIModel:
+    """
+    Standardized (ridge) regression from accumulated z'z, the same model
+    StandardScaler + LinearRegression would fit on those rows
+    """
+    n = stats[_ONE, _ONE]
+    mean = stats[:_ONE, _ONE] / n
+    mean_y = stats[_ONE, _TARGET] / n
+    scatter = stats[:_ONE, :_ONE] - n * np.outer(mean, mean)
+    cross = stats[:_ONE, _TARGET] - n * mean * mean_y
+
+    scale = np.sqrt(np.maximum(np.diag(scatter) / n, 0.0))
+    scale[scale == 0] = 1.0  # constant features, as StandardScaler does
+
+    a = scatter / np.outer(scale, scale) + alpha * np.eye(_ONE)
+    b = cross / scale
+    coef = np.linalg.lstsq(a, b, rcond=None)[0]
+    return LinearAQIModel(mean, scale, coef, mean_y)
+
+
+def squared_errors_from_stats(model: LinearAQIModel, stats: np.ndarray) -> Tuple[float, float]:
+    """(sum of squared errors, total sum of squares) of a model over the rows in stats"""
+    raw = model.coef / model.scale
+    theta = np.append(raw, model.intercept - raw @ model.mean)
+    a = stats[:_TARGET, :_TARGET]
+    b = stats[:_TARGET, _TARGET]
+    yy = stats[_TARGET, _TARGET]
+    n = stats[_ONE, _ONE]
+    sse = float(theta @ a @ theta - 2 * theta @ b + yy)
+    sst = float(yy - stats[_ONE, _TARGET] ** 2 / n)
+    return max(sse, 0.0), sst
+
+
+class AQIModelTrainer:
+    """
+    Trains the AQI model on the ingested AQIReading history without ever
+    holding it in memory: readings are streamed in chunks into per-fold
+    normal-equation statistics, id ranges in parallel worker processes.
+    Every cross-validation fit then comes from the statistics alone.
+    """
+
+    def __init__(self, folds: int = 5, test_size: float = 0.2, chunk_size: int = 10000,
+                 jobs: Optional[int] = None, days: Optional[int] = None,
+                 alphas: Optional[Dict[str, float]] = None):
+        self.folds = folds
+        self.test_size = test_size
+        self.chunk_size = chunk_size
+        self.jobs = jobs or os.cpu_count() or 1
+        self.since = timezone.now() - timedelta(days=days) if days else None
+        self.alphas = alphas or MODEL_ALPHAS
+        self.local_tz = ZoneInfo(settings.AQI_FORECAST_TIME_ZONE)
+
+    def train(self) -> Dict:
+        """
+        Returns: {'rows': n, 'metrics': [one row per model], 'models': {name: LinearAQIModel},
+                  'best': model name with the highest test R²}
+        """
+        ranges = self._id_ranges()
+        stats = sum(self._map(_accumulate_range, ranges), np.zeros((self.folds + 1, _TARGET + 1, _TARGET + 1)))
+        rows = int(stats[:, _ONE, _ONE].sum())
+        if stats[self.folds, _ONE, _ONE] < 2 or stats[:self.folds, _ONE, _ONE].sum() <= len(FEATURES):
+            raise ValueError(f'Not enough readings to train ({rows})')
+
+        train_stats = stats[:self.folds].sum(axis=0)
+        test_stats = stats[self.folds]
+
+        models = {}
+        metrics = []
+        for name, alpha in self.alphas.items():
+            model = fit_from_stats(train_stats, alpha)
+            models[name] = model
+
+            cv_r2 = []
+            for fold in range(self.folds):
+                if stats[fold, _ONE, _ONE] < 2:
+                    continue
+                fold_model = fit_from_stats(train_stats - stats[fold], alpha)
+                sse, sst = squared_errors_from_stats(fold_model, stats[fold])
+                cv_r2.append(1 - sse / sst if sst > 0 else 0.0)
+
+            sse, sst = squared_errors_from_stats(model, test_stats)
+            metrics.append({
+                'Model': name,
+                'Test RMSE': float(np.sqrt(sse / test_stats[_ONE, _ONE])),
+                'Test R²': 1 - sse / sst if sst > 0 else 0.0,
+                'Test MAE': None,
+                'CV R² Mean': float(np.mean(cv_r2)) if cv_r2 else None,
+            })
+
+        # Absolute errors don't reduce to sufficient statistics: one more pass
+        abs_errors = sum(self._map(_absolute_errors_range, ranges, list(models.values())),
+                         np.zeros(len(models)))
+        for row, total in zip(metrics, abs_errors):
+            row['Test MAE'] = float(total / test_stats[_ONE, _ONE])
+
+        best = max(metrics, key=lambda row: row['Test R²'])['Model']
+        return {'rows': rows, 'metrics': metrics, 'models': models, 'best': best}
+
+    def write_artifacts(self, report: Dict, output_dir: Path) -> Dict[str, Path]:
+        """Best model as an .npz coefficient artifact plus the model comparison CSV"""
+        output_dir = Path(output_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+
+        model_path = output_dir / 'aqi_model.npz'
+        report['models'][report['best']].save(model_path)
+
+        metrics_path = output_dir / 'model_comparison_results.csv'
+        with open(metrics_path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=METRICS_COLUMNS)
+            writer.writeheader()
+            writer.writerows(report['metrics'])
+        return {'model': model_path, 'metrics': metrics_path}
+
+    def _queryset(self):
+        queryset = AQIReading.objects.all()
+        if self.since is not None:
+            queryset = queryset.filter(observed_at__gte=self.since)
+        return queryset
+
+    def _id_ranges(self) -> List[Tuple[int, int]]:
+        bounds = self._queryset().aggregate(low=Min('id'), high=Max('id'))
+        if bounds['low'] is None:
+            return []
+        edges = np.linspace(bounds['low'], bounds['high'] + 1, self.jobs + 1).astype(int)
+        return [(int(lo), int(hi)) for lo, hi in zip(edges[:-1], edges[1:]) if hi > lo]
+
+    def _map(self, function, ranges, *args):
+        tasks = [(self, id_range) + args for id_range in ranges]
+        if self.jobs == 1 or len(tasks) <= 1:
+            return [function(*task) for task in tasks]
+
+        # Forked workers inherit Django's setup but must open their own connections
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=self.jobs,
+                                 mp_context=multiprocessing.get_context('fork')) as pool:
+            return list(pool.map(function, *zip(*tasks)))
+
+    def iter_chunks(self, id_range: Tuple[int, int]) -> Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        """(ids, features, aqi) arrays for readings in [low, high), chunk_size rows at a time"""
+        columns = ('id',) + POLLUTANTS + WEATHER + ('local_hour', 'iso_weekday', 'aqi')
+        queryset = (
+            self._queryset()
+            .filter(id__gte=id_range[0], id__lt=id_range[1])
+            .annotate(local_hour=ExtractHour('observed_at', tzinfo=self.local_tz),
+                      iso_weekday=ExtractIsoWeekDay('observed_at', tzinfo=self.local_tz))
+            .order_by('id')
+            .values_list(*columns)
+        )
+
+        chunk = []
+        for row in queryset.iterator(chunk_size=self.chunk_size):
+            chunk.append(row)
+            if len(chunk) == self.chunk_size:
+                yield self._to_arrays(chunk)
+                chunk = []
+        if chunk:
+            yield self._to_arrays(chunk)
+
+    def _to_arrays(self, rows: List[tuple]):
+        data = np.array(rows, dtype=float)  # None -> nan
+        ids = data[:, 0].astype(np.int64)
+        features = data[:, 1:1 + len(FEATURES)]
+        target = data[:, -1]
+
+        # Missing inputs get the serving path's last fallback, the feature
+        # defaults. Serving first tries the station snapshot (pollutants) and
+        # the request's other readings (weather), which have no per-row
+        # equivalent in the history, so a reading missing a feature is
+        # trained on defaults where serving would often use a nearby value.
+        fill_feature_defaults(features)
+        features[:, -1] -= 1  # ISO weekday 1-7 -> datetime.weekday() 0-6
+        return ids, features, target
+
+
+def _accumulate_range(trainer: AQIModelTrainer, id_range: Tuple[int, int]) -> np.ndarray:
+    """Per-group z'z over one id range: (folds + 1, len(z), len(z))"""
+    stats = np.zeros((trainer.folds + 1, _TARGET + 1, _TARGET + 1))
+    for ids, features, target in trainer.iter_chunks(id_range):
+        keep = target > 0
+        z = np.column_stack([features[keep], np.ones(keep.sum()), target[keep]])
+        groups = row_groups(ids[keep], trainer.folds, trainer.test_size)
+        for group in range(trainer.folds + 1):
+            rows = z[groups == group]
+            stats[group] += rows.T @ rows
+    return stats
+
+
+def _absolute_errors_range(trainer: AQIModelTrainer, id_range: Tuple[int, int],
+                           models: List[LinearAQIModel]) -> np.ndarray:
+    """Sum of absolute test-set errors of each model over one id range"""
+    totals = np.zeros(len(models))
+    for ids, features, target in trainer.iter_chunks(id_range):
+        test = (target > 0) & (row_groups(ids, trainer.folds, trainer.test_size) == trainer.folds)
+        for i, model in enumerate(models):
+            totals[i] += np.abs(model.predict(features[test]) - target[test]).sum()
+    return totals
@@ -0,0 +1,65 @@
+import numpy as np
+from typing import List, Sequence
+
+from .geo_utils import as_coordinate_array
+
+# Google's format works on 5-bit chunks; 7 chunks cover any lat/lng delta
+# up to precision 7
+_MAX_CHUNKS = 7
+
+
+def encode_polyline(coordinates: Sequence[Sequence[float]], precision: int = 5) -> str:
+    """
+    Encode a [lng, lat] polyline with Google's encoded polyline algorithm.
+    The encoded string stores (lat, lng) pairs, as the format expects.
+    """
+    coords = as_coordinate_array(coordinates)
+    if len(coords) == 0:
+        return ''
+
+    factor = 10 ** precision
+    # Round half away from zero like the reference implementation
+    scaled = coords[:, ::-1] * factor
+    scaled = (np.sign(scaled) * np.floor(np.abs(scaled) + 0.5)).astype(np.int64)
+    deltas = np.diff(scaled, axis=0, prepend=np.zeros((1, 2), dtype=np.int64)).ravel()
+
+    # Zigzag-encode so small negative deltas stay short
+    values = np.where(deltas < 0, ~(deltas << 1), deltas << 1).astype(np.uint64)
+
+    shifts = np.arange(_MAX_CHUNKS, dtype=np.uint64) * np.uint64(5)
+    chunks = (values[:, None] >> shifts[None, :]) & np.uint64(0x1f)
+
+    bit_lengths = np.zeros(len(values), dtype=np.int64)
+    nonzero = values > 0
+    bit_lengths[nonzero] = np.floor(np.log2(values[nonzero].astype(np.float64))).astype(np.int64) + 1
+    num_chunks = np.maximum(1, -(-bit_lengths // 5))
+
+    columns = np.arange(_MAX_CHUNKS)[None, :]
+    keep = columns < num_chunks[:, None]
+    continuation = columns < (num_chunks - 1)[:, None]
+
+    chars = (chunks | np.where(continuation, 0x20, 0).astype(np.uint64)) + np.uint64(63)
+    return chars[keep].astype(np.uint8).tobytes().decode('ascii')
+
+
+def decode_polyline(encoded: str, precision: int = 5) -> List[List[float]]:
+    """
+    Decode a Google encoded polyline back to [lng, lat] pairs
+    """
+    if not encoded:
+        return []
+
+    data = np.frombuffer(encoded.encode('ascii'), dtype=np.uint8).astype(np.int64) - 63
+    ends = np.flatnonzero(data < 0x20)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+
+    values = np.zeros(len(ends), dtype=np.int64)
+    for i in range(_MAX_CHUNKS):
+        position = starts + i
+        active = position <= ends
+        values[active] |= (data[position[active]] & 0x1f) << (5 * i)
+
+    deltas = np.where(values & 1, ~(values >> 1), values >> 1)
+    latlng = np.cumsum(deltas.reshape(-1, 2), axis=0) / 10 ** precision
+
+    return latlng[:, ::-1].tolist()
@@ -0,0 +1,247 @@
+"""
+Upstream quota shared by every worker process on a host, and coalescing of
+identical in-flight calls.
+
+Quotas are token buckets in one sqlite file, one bucket per upstream
+(service or service.operation, as configured in UPSTREAM_RATE_LIMITS) and
+API key. A caller that finds the bucket empty reserves the next token and
+sleeps until it is due, so waiters are served in arrival order across
+processes. Single-flight coalescing is per process: concurrent identical
+requests (same WAQI feed, same ORS directions body) wait for the first
+one's answer instead of spending quota on duplicates. A caller with more
+time left than the first one repeats a call that ran out of the first
+caller's deadline.
+"""
+import hashlib
+import logging
+import math
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple, TypeVar
+
+from django.conf import settings
+
+from .deadline import Deadline, DeadlineExceeded
+from ..metrics import UPSTREAM_COALESCED, UPSTREAM_QUOTA_REJECTIONS, UPSTREAM_QUOTA_WAIT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+
+class QuotaExhausted(Exception):
+    """No upstream quota token is available within the allowed wait"""
+
+
+class QuotaLimiter:
+    """Token buckets (rate per second, burst) in a sqlite file shared between processes"""
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=OFF')  # losing bucket state in a crash is harmless
+            connection.execute('CREATE TABLE IF NOT EXISTS buckets '
+                               '(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)')
+            self._local.connection = connection
+        return connection
+
+    def reserve(self, key: str, rate: float, burst: float, max_wait: float) -> Optional[float]:
+        """
+        Take a token from bucket `key`, refilled at `rate` per second up to
+        `burst`. Returns the seconds to wait before using it (0 when one was
+        available), or None, taking nothing, when that would exceed max_wait.
+        """
+        connection = self._connection()
+        now = time.time()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = connection.execute('SELECT tokens, updated FROM buckets WHERE key = ?', (key,)).fetchone()
+            tokens = burst if row is None else min(burst, row[0] + max(0.0, now - row[1]) * rate)
+            wait = 0.0 if tokens >= 1 else (1 - tokens) / rate
+            if wait > max_wait:
+                connection.execute('ROLLBACK')
+                return None
+            # Tokens go negative while callers are queued for future refills
+            connection.execute('INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)',
+                               (key, tokens - 1, now))
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        return wait
+
+    def tokens(self, key: str, rate: float, burst: float) -> float:
+        """Tokens in bucket `key` now, without taking any (negative while callers are queued)"""
+        row = self._connection().execute('SELECT tokens, updated FROM buckets WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return burst
+        return min(burst, row[0] + max(0.0, time.time() - row[1]) * rate)
+
+    def acquire(self, key: str, rate: float, burst: float, max_wait: float) -> bool:
+        wait = self.reserve(key, rate, burst, max_wait)
+        if wait is None:
+            return False
+        if wait > 0:
+            time.sleep(wait)
+        return True
+
+
+_limiter: Optional[QuotaLimiter] = None
+_limiter_lock = threading.Lock()
+
+
+def limiter() -> QuotaLimiter:
+    global _limiter
+    with _limiter_lock:
+        if _limiter is None or _limiter.path != str(settings.UPSTREAM_RATE_LIMIT_DB):
+            _limiter = QuotaLimiter(settings.UPSTREAM_RATE_LIMIT_DB)
+        return _limiter
+
+
+def rate_limit_for(service: str, operation: str) -> Optional[Tuple[str, float, float]]:
+    """(bucket name, rate per second, burst) configured for an upstream call, if any"""
+    limits = settings.UPSTREAM_RATE_LIMITS
+    for name in (f'{service}.{operation}', service):
+        if name in limits:
+            rate, burst = limits[name]
+            return name, float(rate), float(burst)
+    return None
+
+
+def _bucket_key(name: str, api_key: Optional[str]) -> str:
+    return f"{name}:{hashlib.sha1(str(api_key or '').encode()).hexdigest()[:10]}"
+
+
+def quota_backlog(service: str, operation: str, api_key: Optional[str]) -> float:
+    """
+    Seconds a new call would wait for a quota token right now (0 when
+    tokens are available, or when the upstream is not rate limited)
+    """
+    limit = rate_limit_for(service, operation) if settings.UPSTREAM_RATE_LIMIT_ENABLED else None
+    if limit is None:
+        return 0.0
+    name, rate, burst = limit
+    try:
+        tokens = limiter().tokens(_bucket_key(name, api_key), rate, burst)
+    except sqlite3.Error:
+        return 0.0
+    return max(0.0, 1 - tokens) / rate
+
+
+def throttle(service: str, operation: str, api_key: Optional[str], deadline: Optional[Deadline] = None):
+    """
+    Wait for a quota token before one upstream call. Waits at most
+    UPSTREAM_RATE_LIMIT_MAX_WAIT, or what the deadline leaves; raises
+    QuotaExhausted (DeadlineExceeded when the deadline is the limit).
+    If the quota file cannot be used the call is let through.
+    """
+    if not settings.UPSTREAM_RATE_LIMIT_ENABLED:
+        return
+    limit = rate_limit_for(service, operation)
+    if limit is None:
+        return
+    name, rate, burst = limit
+    max_wait = settings.UPSTREAM_RATE_LIMIT_MAX_WAIT
+    bounded_by_deadline = deadline is not None and deadline.remaining() - settings.UPSTREAM_MIN_TIMEOUT < max_wait
+    if bounded_by_deadline:
+        max_wait = max(0.0, deadline.remaining() - settings.UPSTREAM_MIN_TIMEOUT)
+
+    started = time.perf_counter()
+    try:
+        acquired = limiter().acquire(_bucket_key(name, api_key), rate, burst, max_wait)
+    except sqlite3.Error as e:
+        logger.warning("Upstream quota file unavailable, not rate limiting: %s", e)
+        return
+    UPSTREAM_QUOTA_WAIT_SECONDS.observe(time.perf_counter() - started, service=service, operation=operation)
+    if acquired:
+        return
+    UPSTREAM_QUOTA_REJECTIONS.inc(service=service, operation=operation)
+    if bounded_by_deadline:
+        deadline.skip(service, operation)
+        raise DeadlineExceeded(f'No {name} quota before the request deadline')
+    raise QuotaExhausted(f'No {name} quota within {max_wait:.0f}s')
+
+
+class _SharedDeadlineExceeded(DeadlineExceeded):
+    """The shared call ran out of a deadline no earlier than the waiting caller's"""
+
+
+class SingleFlight:
+    """Concurrent calls with the same key share the first caller's execution"""
+
+    def __init__(self):
+        self._calls: Dict[str, Tuple[Future, float]] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: str, function: Callable[[], T], deadline: Optional[Deadline] = None,
+           budget_errors: Tuple[type, ...] = (DeadlineExceeded,)) -> Tuple[T, bool]:
+        """
+        Returns (result, shared); shared is True when another caller made
+        the call. Waiting callers give up at their deadline (FutureTimeout).
+        The call runs under the first caller's deadline: when it fails with
+        one of `budget_errors` (deadline or timeout), a waiting caller with
+        a later deadline makes the call again under its own.
+        """
+        expires_at = deadline.expires_at if deadline is not None else math.inf
+        with self._lock:
+            flight = self._calls.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._calls[key] = (Future(), expires_at)
+        future, leader_expires_at = flight
+        if not leader:
+            try:
+                return future.result(deadline.wait_time() if deadline is not None else None), True
+            except budget_errors as e:
+                if expires_at <= leader_expires_at:
+                    if isinstance(e, DeadlineExceeded):
+                        raise _SharedDeadlineExceeded(str(e)) from e
+                    raise
+            # Identical retries by other waiters share this one
+            return self.do(key, function, deadline, budget_errors)
+
+        try:
+            result = function()
+        except BaseException as e:
+            # Forget the call first, so waiters that retry start a new one
+            self._forget(key)
+            future.set_exception(e)
+            raise
+        self._forget(key)
+        future.set_result(result)
+        return result, False
+
+    def _forget(self, key: str):
+        with self._lock:
+            del self._calls[key]
+
+
+SINGLE_FLIGHT = SingleFlight()
+
+
+def coalesced(key: str, function: Callable[[], T], service: str, operation: str,
+              deadline: Optional[Deadline] = None,
+              budget_errors: Tuple[type, ...] = (DeadlineExceeded,)) -> T:
+    """
+    Run function() unless an identical call is already in flight, then
+    share its answer. function() must apply this caller's deadline, since
+    it is called again when the shared call ran out of a shorter one.
+    """
+    try:
+        result, shared = SINGLE_FLIGHT.do(f'{service}.{operation} {key}', function, deadline, budget_errors)
+    except (FutureTimeout, _SharedDeadlineExceeded):
+        deadline.skip(service, operation)
+        raise DeadlineExceeded(f'Shared {service} {operation} call did not answer before the request deadline')
+    if shared:
+        UPSTREAM_COALESCED.inc(service=service, operation=operation)
+    return result
@@ -0,0 +1,85 @@
+import time
+from django.conf import settings
+from django.core.cache import cache
+from typing import Dict, Optional
+
+from ..metrics import ROUTE_CACHE_LOOKUPS
+
+EPOCH_KEY = 'route_cache:aqi_snapshot_epoch'
+
+# Pollutant priorities offered by the map, which sends them as pollutant_type
+# too (map.js); find_route keys its cache on both
+POLLUTANT_PRIORITIES = ['pm25', 'pm10', 'co', 'o3', 'so2']
+
+
+def pollutant_type_for(priority: str) -> Optional[str]:
+    """pollutant_type the map sends along with a priority"""
+    return priority if priority in POLLUTANT_PRIORITIES else None
+
+
+class RouteCache:
+    """
+    Whole-result cache for optimized routes.
+    Keys combine snapped origin/destination cells, priority, pollutant type,
+    departure slot and the AQI snapshot epoch, so ingesting a new snapshot
+    (which bumps the epoch) invalidates every cached route at once. Entries
+    and epoch live in the shared CACHES backend, so they are the same for
+    every worker and management command; hit/miss counts are per process.
+    """
+
+    def __init__(self, backend=None):
+        self.cache = backend or cache
+        self.cell_deg = settings.ROUTE_CACHE_CELL_DEG
+        self.ttl = settings.ROUTE_CACHE_TTL
+
+    def snap(self, lat: float, lng: float) -> str:
+        """Grid cell id of a coordinate"""
+        return f"{round(lat / self.cell_deg)}:{round(lng / self.cell_deg)}"
+
+    def snapshot_epoch(self) -> int:
+        """
+        Epoch of the current AQI snapshot. Falls back to the current hour
+        when no snapshot has been ingested, so entries still roll over hourly.
+        """
+        epoch = self.cache.get(EPOCH_KEY)
+        if epoch is None:
+            return int(time.time() // 3600)
+        return epoch
+
+    def set_snapshot_epoch(self, epoch: Optional[int] = None):
+        """Record a newly ingested snapshot, invalidating all cached routes"""
+        if epoch is None:
+            epoch = int(time.time())
+        self.cache.set(EPOCH_KEY, epoch, None)
+
+    def make_key(self, start_lat: float, start_lng: float,
+                 end_lat: float, end_lng: float,
+                 priority: str, pollutant_type: Optional[str] = None,
+                 departure: Optional[float] = None) -> str:
+        # Time-dependent routes are shared within a departure slot
+        slot = int(departure // settings.ROUTE_CACHE_DEPARTURE_SLOT) if departure is not None else '-'
+        return (f"route:{self.snapshot_epoch()}:{self.snap(start_lat, start_lng)}:"
+                f"{self.snap(end_lat, end_lng)}:{priority}:{pollutant_type or '-'}:{slot}")
+
+    def get(self, key: str) -> Optional[Dict]:
+        result = self.cache.get(key)
+        ROUTE_CACHE_LOOKUPS.inc(result='hit' if result is not None else 'miss')
+        return result
+
+    def set(self, key: str, result: Dict):
+        self.cache.set(key, result, self.ttl)
+
+    def stats(self) -> Dict:
+        """
+        Hit/miss counts of this worker process since it started (scrape
+        route_cache_lookups_total from every worker's /metrics for the total)
+        """
+        hits = int(ROUTE_CACHE_LOOKUPS.value(result='hit'))
+        misses = int(ROUTE_CACHE_LOOKUPS.value(result='miss'))
+        lookups = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': round(hits / lookups, 4) if lookups else 0.0,
+            'snapshot_epoch': self.snapshot_epoch(),
+        }
@@ -0,0 +1,174 @@
+import time
+from collections import Counter
+from datetime import timedelta
+from typing import Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+from django.conf import settings
+from django.db.models.functions import ExtractHour
+from django.utils import timezone
+
+from ..models import RouteHistory
+from .dijkstra_optimizer import DijkstraOptimizer
+from .route_cache import POLLUTANT_PRIORITIES, pollutant_type_for
+
+PRIORITIES = [choice for choice, _ in RouteHistory.PRIORITY_CHOICES] + POLLUTANT_PRIORITIES
+
+
+class RoutePrewarmer:
+    """
+    Recompute routes for the busiest origin-destination clusters in
+    RouteHistory so the first request after an AQI refresh is a cache hit.
+    Routes are keyed exactly as find_route keys them and written to the
+    shared cache, so the server workers see them.
+    """
+
+    def __init__(self, optimizer: Optional[DijkstraOptimizer] = None):
+        self.optimizer = optimizer or DijkstraOptimizer()
+        self.route_cache = self.optimizer.route_cache
+        self.local_tz = ZoneInfo(settings.PREWARM_TIME_ZONE)
+
+    def hot_od_pairs(self, top_n: int = 20, hour: Optional[int] = None,
+                     days: int = 14) -> List[Dict]:
+        """
+        Most requested OD clusters (snapped cache cells) in the last `days`,
+        optionally only for requests made at a local hour of day
+        """
+        history = self._history(hour, days)
+
+        counts = Counter()
+        priority_counts = {}
+        representative = {}
+        for row in history:
+            cells = self._cells(row)
+            counts[cells] += 1
+            priority_counts.setdefault(cells, Counter())[row['priority']] += 1
+            representative.setdefault(cells, row)
+
+        return [
+            {
+                'source_lat': representative[cells]['source_lat'],
+                'source_lng': representative[cells]['source_lng'],
+                'dest_lat': representative[cells]['destination_lat'],
+                'dest_lng': representative[cells]['destination_lng'],
+                'requests': count,
+                'priorities': dict(priority_counts[cells]),
+            }
+            for cells, count in counts.most_common(top_n)
+        ]
+
+    def warm_order(self, pairs: List[Dict], priorities: List[str]) -> List[Tuple[Dict, str]]:
+        """
+        (pair, priority) routes in the order the budget is spent on them:
+        combinations requested in the window, most requested first; then
+        the route priorities never requested for a pair, hottest pair first;
+        then the pollutant priorities the same way
+        """
+        ranked = []
+        for rank, pair in enumerate(pairs):
+            for position, priority in enumerate(priorities):
+                requests = pair.get('priorities', {}).get(priority, 0)
+                ranked.append(((requests == 0, -requests, priority in POLLUTANT_PRIORITIES, rank, position),
+                               pair, priority))
+        ranked.sort(key=lambda item: item[0])
+        return [(pair, priority) for _, pair, priority in ranked]
+
+    def prewarm(self, top_n: int = 20, hour: Optional[int] = None, days: int = 14,
+                priorities: Optional[List[str]] = None,
+                upstream_budget: Optional[int] = None,
+                min_interval: Optional[float] = None) -> Dict:
+        """
+        Warm the route cache for the hot OD pairs, every priority, in
+        warm_order. Skips routes once the estimated upstream calls (ORS +
+        WAQI) would exceed the budget, and spaces routes at least
+        min_interval seconds apart.
+        """
+        priorities = priorities or PRIORITIES
+        upstream_budget = settings.PREWARM_UPSTREAM_BUDGET if upstream_budget is None else upstream_budget
+        min_interval = settings.PREWARM_MIN_INTERVAL if min_interval is None else min_interval
+
+        pairs = self.hot_od_pairs(top_n, hour, days)
+        report = {
+            'pairs': len(pairs),
+            'warmed': 0,
+            'already_warm': 0,
+            'failed': 0,
+            'skipped_over_budget': 0,
+            'upstream_calls': 0,
+        }
+
+        last_started = 0.0
+        for pair, priority in self.warm_order(pairs, priorities):
+            key = self.route_cache.make_key(pair['source_lat'], pair['source_lng'],
+                                            pair['dest_lat'], pair['dest_lng'], priority,
+                                            pollutant_type_for(priority))
+            if self.route_cache.cache.get(key) is not None:
+                report['already_warm'] += 1
+                continue
+
+            cost = self._estimated_calls(priority)
+            if report['upstream_calls'] + cost > upstream_budget:
+                report['skipped_over_budget'] += 1
+                continue
+
+            wait = last_started + min_interval - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            last_started = time.monotonic()
+
+            report['upstream_calls'] += cost
+            # Bypass the cache lookup so warming doesn't count as misses
+            route = self.optimizer.find_optimal_route(
+                pair['source_lat'], pair['source_lng'],
+                pair['dest_lat'], pair['dest_lng'],
+                priority=priority,
+                pollutant_type=pollutant_type_for(priority),
+                use_cache=False
+            )
+            if route:
+                self.route_cache.set(key, route)
+            report['warmed' if route else 'failed'] += 1
+
+        report['coverage'] = self.coverage(hour, days, priorities)
+        return report
+
+    def coverage(self, hour: Optional[int] = None, days: int = 14,
+                 priorities: Optional[List[str]] = None) -> float:
+        """
+        Share of historical requests (same window) that would now hit the cache
+        """
+        priorities = priorities or PRIORITIES
+        history = [row for row in self._history(hour, days) if row['priority'] in priorities]
+        if not history:
+            return 0.0
+
+        warm = {}
+        hits = 0
+        for row in history:
+            lookup = (self._cells(row), row['priority'])
+            if lookup not in warm:
+                key = self.route_cache.make_key(row['source_lat'], row['source_lng'],
+                                                row['destination_lat'], row['destination_lng'],
+                                                row['priority'], pollutant_type_for(row['priority']))
+                warm[lookup] = self.route_cache.cache.get(key) is not None
+            hits += warm[lookup]
+
+        return round(hits / len(history), 4)
+
+    def _history(self, hour: Optional[int], days: int):
+        queryset = RouteHistory.objects.filter(created_at__gte=timezone.now() - timedelta(days=days))
+        if hour is not None:
+            queryset = queryset.annotate(
+                local_hour=ExtractHour('created_at', tzinfo=self.local_tz)
+            ).filter(local_hour=hour)
+        return queryset.values('source_lat', 'source_lng', 'destination_lat',
+                               'destination_lng', 'priority').iterator()
+
+    def _cells(self, row: Dict) -> Tuple[str, str]:
+        return (self.route_cache.snap(row['source_lat'], row['source_lng']),
+                self.route_cache.snap(row['destination_lat'], row['destination_lng']))
+
+    def _estimated_calls(self, priority: str) -> int:
+        """Base route (+ detour) from ORS plus the AQI lookup budget"""
+        ors_calls = 1 if priority == 'shortest' else 2
+        return ors_calls + settings.AQI_LOOKUP_BUDGET
@@ -1,14 +1,99 @@
+import hashlib
+import json
+import logging
 import openrouteservice
 from django.conf import settings
-from typing import List, Dict, Optional, Tuple
+from django.core.cache import cache
+from typing import Callable, List, Dict, Optional, Tuple
 import numpy as np
+from .geo_utils import as_coordinate_array, cumulative_distance_km, interpolate_along
+from .exposure_service import reading_value
+from .simplification import top_vertices, vertex_importance
+from .deadline import Deadline, DeadlineExceeded, hedged
+from .http_pool import upstream_session
+from .quota import coalesced, throttle
+from ..metrics import upstream_call
+
+logger = logging.getLogger(__name__)
+
+# URL path prefix -> (upstream service, operation) for call metrics
+ORS_OPERATIONS = (
+    ('/geocode/search', ('pelias', 'search')),
+    ('/geocode/reverse', ('pelias', 'reverse')),
+    ('/v2/directions', ('ors', 'directions')),
+    ('/v2/matrix', ('ors', 'matrix')),
+    ('/v2/isochrones', ('ors', 'isochrones')),
+)
+
+
+class InstrumentedClient(openrouteservice.Client):
+    """
+    ORS client that counts and times every API call (retries included in
+    one call). Every attempt waits for the shared upstream quota, and
+    identical concurrent calls share one request. With a deadline, each
+    call's timeout is capped by the request's remaining time and retries
+    stop when it runs out; slow calls are hedged when HEDGE_ENABLED.
+    """
+    
+    def __init__(self, *args, deadline: Optional[Deadline] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        # One pooled session per process instead of a new one per client
+        self._session = upstream_session('ors')
+        self.deadline = deadline
+    
+    def request(self, url, *args, **kwargs):
+        service, operation = next((names for prefix, names in ORS_OPERATIONS if url.startswith(prefix)),
+                                  ('ors', url.strip('/').split('/')[0]))
+        if kwargs.get('retry_counter') or (len(args) > 2 and args[2]):
+            if self.deadline is not None and self.deadline.expired:
+                raise openrouteservice.exceptions.Timeout()
+            throttle(service, operation, self._key, self.deadline)
+            args, kwargs = self._bounded(service, operation, args, kwargs)
+            return super().request(url, *args, **kwargs)
+        
+        # Skip before queueing for quota when no call could fit any more
+        self._bounded(service, operation, args, kwargs)
+        
+        def call():
+            throttle(service, operation, self._key, self.deadline)
+            # Capped after the quota wait, which can use most of the time left
+            call_args, call_kwargs = self._bounded(service, operation, args, kwargs)
+            with upstream_call(service, operation):
+                return super(InstrumentedClient, self).request(url, *call_args, **call_kwargs)
+        
+        get_params = args[0] if args else kwargs.get('get_params')
+        key = url + json.dumps([get_params, kwargs.get('post_json')], sort_keys=True, default=str)
+        return coalesced(key, lambda: hedged(call, service, operation, self.deadline),
+                         service, operation, self.deadline,
+                         budget_errors=(DeadlineExceeded, openrouteservice.exceptions.Timeout))
+    
+    def _bounded(self, service: str, operation: str, args: tuple, kwargs: Dict) -> Tuple[tuple, Dict]:
+        """
+        request() arguments with the timeout capped by what is left of the
+        deadline; skips the call when too little is
+        """
+        if self.deadline is None:
+            return args, kwargs
+        try:
+            timeout = self.deadline.timeout(self._timeout)
+        except DeadlineExceeded:
+            self.deadline.skip(service, operation)
+            raise
+        if len(args) > 3:  # requests_kwargs passed positionally, as retries do
+            return args[:3] + (dict(args[3] or {}, timeout=timeout),) + args[4:], kwargs
+        return args, dict(kwargs, requests_kwargs=dict(kwargs.get('requests_kwargs') or {}, timeout=timeout))
 
 
 class RoutingService:
-    """Service to handle routing using OpenRouteService"""
+    """
+    Service to handle routing using OpenRouteService.
+    Calls made through a service built with a deadline are bounded by it.
+    """
     
-    def __init__(self):
-        self.client = openrouteservice.Client(key=settings.ORS_API_KEY)
+    def __init__(self, deadline: Optional[Deadline] = None):
+        self.client = InstrumentedClient(key=settings.ORS_API_KEY, base_url=settings.ORS_BASE_URL,
+                                         timeout=settings.ORS_TIMEOUT, retry_timeout=settings.ORS_RETRY_TIMEOUT,
+                                         deadline=deadline)
     
     def get_route(self, start_coords: Tuple[float, float], 
                   end_coords: Tuple[float, float], 
@@ -29,7 +114,7 @@ class RoutingService:
             
             return self._parse_route_data(route)
         except Exception as e:
-            print(f"Error getting route: {e}")
+            logger.warning("Error getting route: %s", e)
             return None
     
     def get_alternative_routes(self, start_coords: Tuple[float, float],
@@ -67,7 +152,7 @@ class RoutingService:
             return routes if routes else [self.get_route(start_coords, end_coords)]
             
         except Exception as e:
-            print(f"Alternative routes not available, using standard route: {e}")
+            logger.info("Alternative routes not available, using standard route: %s", e)
             # Fallback to standard route
             standard = self.get_route(start_coords, end_coords)
             return [standard] if standard else []
@@ -129,7 +214,7 @@ class RoutingService:
                 return self._parse_route_data(route)
                 
         except Exception as e:
-            print(f"Error with waypoints: {e}")
+            logger.warning("Error with waypoints: %s", e)
             # Fallback to direct route
             try:
                 route = self.client.directions(
@@ -155,24 +240,11 @@ class RoutingService:
         # Always include start and end
         selected = [coordinates[0]]
         
-        # For cleanest routes, prefer waypoints furthest from direct line
+        # For cleanest routes, prefer the vertices that shape the route most
+        # (Douglas-Peucker importance, the first of which is the vertex
+        # furthest from the direct line)
         if priority in ['cleanest', 'pm25', 'pm10', 'co', 'o3', 'so2']:
-            # Calculate deviation from direct line for each waypoint
-            start = np.array(coordinates[0])
-            end = np.array(coordinates[-1])
-            
-            deviations = []
-            for i in range(1, len(coordinates) - 1):
-                point = np.array(coordinates[i])
-                # Calculate perpendicular distance from line
-                deviation = self._point_line_distance(point, start, end)
-                deviations.append((i, deviation))
-            
-            # Sort by deviation (largest first) and select top waypoints
-            deviations.sort(key=lambda x: x[1], reverse=True)
-            selected_indices = sorted([idx for idx, _ in deviations[:max_waypoints]])
-            
-            for idx in selected_indices:
+            for idx in top_vertices(vertex_importance(coordinates), max_waypoints):
                 selected.append(coordinates[idx])
         
         # For balanced, evenly distribute waypoints
@@ -187,30 +259,6 @@ class RoutingService:
         
         return selected
     
-    def _point_line_distance(self, point: np.ndarray, 
-                            line_start: np.ndarray, 
-                            line_end: np.ndarray) -> float:
-        """Calculate perpendicular distance from point to line"""
-        # Vector from line_start to line_end
-        line_vec = line_end - line_start
-        # Vector from line_start to point
-        point_vec = point - line_start
-        
-        # Normalize line vector
-        line_len = np.linalg.norm(line_vec)
-        if line_len == 0:
-            return np.linalg.norm(point_vec)
-        
-        line_unit = line_vec / line_len
-        
-        # Project point onto line
-        projection_length = np.dot(point_vec, line_unit)
-        projection = projection_length * line_unit
-        
-        # Distance is perpendicular component
-        perpendicular = point_vec - projection
-        return np.linalg.norm(perpendicular)
-    
     def _parse_single_feature(self, feature: Dict) -> Optional[Dict]:
         """Parse a single route feature"""
         try:
@@ -226,7 +274,85 @@ class RoutingService:
                 'geometry': geometry
             }
         except Exception as e:
-            print(f"Error parsing feature: {e}")
+            logger.warning("Error parsing feature: %s", e)
+            return None
+    
+    def get_multi_stop_route(self, coordinates: List[Tuple[float, float]],
+                             profile: str = 'driving-car') -> Optional[Dict]:
+        """
+        Route through coordinates in the given order, in batches of at most
+        ORS_MAX_WAYPOINTS joined end to start.
+        coordinates: (longitude, latitude)
+        Returns: parsed route plus 'legs' (distance km, duration min per stop-to-stop leg)
+        """
+        batch = max(2, settings.ORS_MAX_WAYPOINTS)
+        combined = None
+        try:
+            for first in range(0, len(coordinates) - 1, batch - 1):
+                route = self.client.directions(
+                    coordinates=[list(c) for c in coordinates[first:first + batch]],
+                    profile=profile,
+                    format='geojson',
+                    instructions=True,
+                    elevation=False
+                )
+                feature = route['features'][0]
+                segments = feature['properties'].get('segments', [])
+                coords = feature['geometry']['coordinates']
+                
+                if combined is None:
+                    combined = {'distance': 0.0, 'duration': 0.0, 'coordinates': [], 'steps': [], 'legs': []}
+                    offset = 0
+                else:
+                    # Shared joint vertex with the previous batch
+                    offset = len(combined['coordinates']) - 1
+                    coords = coords[1:]
+                combined['coordinates'].extend(coords)
+                
+                for segment in segments:
+                    combined['legs'].append({
+                        'distance': segment.get('distance', 0) / 1000,
+                        'duration': segment.get('duration', 0) / 60,
+                    })
+                    for step in segment.get('steps', []):
+                        step = dict(step)
+                        step['way_points'] = [w + offset for w in step.get('way_points', [])]
+                        combined['steps'].append(step)
+                summary = feature['properties'].get('summary', {})
+                combined['distance'] += summary.get('distance', 0) / 1000
+                combined['duration'] += summary.get('duration', 0) / 60
+        except Exception as e:
+            logger.warning("Error getting multi-stop route: %s", e)
+            return None
+        
+        if combined is None:
+            return None
+        combined['geometry'] = {'type': 'LineString', 'coordinates': combined['coordinates']}
+        return combined
+    
+    def get_distance_matrix(self, locations: List[Tuple[float, float]],
+                            sources: List[int], destinations: List[int],
+                            profile: str = 'driving-car') -> Optional[Dict]:
+        """
+        Road distances (km) and durations (min) between locations.
+        locations: (longitude, latitude); sources/destinations index into them
+        Returns: {'distances': rows x cols, 'durations': rows x cols}, None on failure
+        """
+        try:
+            matrix = self.client.distance_matrix(
+                locations=[list(location) for location in locations],
+                profile=profile,
+                sources=sources,
+                destinations=destinations,
+                metrics=['distance', 'duration'],
+                units='km'
+            )
+            # Unroutable pairs come back as null
+            distances = np.array(matrix['distances'], dtype=float)
+            durations = np.array(matrix['durations'], dtype=float) / 60
+            return {'distances': distances, 'durations': durations}
+        except Exception as e:
+            logger.warning("Error getting distance matrix: %s", e)
             return None
     
     def get_isochrones(self, location: Tuple[float, float], 
@@ -241,7 +367,7 @@ class RoutingService:
             )
             return isochrones
         except Exception as e:
-            print(f"Error getting isochrones: {e}")
+            logger.warning("Error getting isochrones: %s", e)
             return None
     
     def geocode_address(self, address: str) -> Optional[Tuple[float, float]]:
@@ -249,25 +375,38 @@ class RoutingService:
         Convert address to coordinates using Pelias geocoding
         Returns: (longitude, latitude) or None
         """
+        cache_key = 'geocode:' + hashlib.sha1(address.strip().lower().encode('utf-8')).hexdigest()
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return tuple(cached)
+        
         try:
             result = self.client.pelias_search(text=address, focus_point=[88.3639, 22.5726])  # Kolkata focus
             if result and 'features' in result and len(result['features']) > 0:
                 coords = result['features'][0]['geometry']['coordinates']
+                cache.set(cache_key, tuple(coords), settings.GEOCODE_CACHE_TTL)
                 return tuple(coords)  # (lng, lat)
             return None
         except Exception as e:
-            print(f"Error geocoding address: {e}")
+            logger.warning("Error geocoding address: %s", e)
             return None
     
     def reverse_geocode(self, lng: float, lat: float) -> Optional[str]:
         """Convert coordinates to address"""
+        cache_key = f"reverse_geocode:{lng:.5f}:{lat:.5f}"
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
         try:
             result = self.client.pelias_reverse(point=(lng, lat))
             if result and 'features' in result and len(result['features']) > 0:
-                return result['features'][0]['properties'].get('label', 'Unknown')
+                label = result['features'][0]['properties'].get('label', 'Unknown')
+                cache.set(cache_key, label, settings.GEOCODE_CACHE_TTL)
+                return label
             return None
         except Exception as e:
-            print(f"Error reverse geocoding: {e}")
+            logger.warning("Error reverse geocoding: %s", e)
             return None
     
     def _parse_route_data(self, route_geojson: Dict) -> Dict:
@@ -292,6 +431,63 @@ class RoutingService:
         
         return [(coord[1], coord[0]) for coord in sampled]
 
+    def adaptive_sample_route_points(self, coordinates: List[List[float]],
+                                     fetch_aqi: Callable[[List[Tuple[float, float]]], List[Optional[Dict]]],
+                                     spacing_km: float = 2.0,
+                                     aqi_threshold: float = 25.0,
+                                     max_lookups: int = 12,
+                                     min_spacing_km: float = 0.5) -> Tuple[List[Tuple[float, float]], List[Dict]]:
+        """
+        Sample points by distance along a route, refining only between
+        neighbouring readings that differ by more than aqi_threshold.
+        fetch_aqi takes a batch of (lat, lng) points and returns one reading
+        (or None) per point. Stops once max_lookups points have been fetched.
+        Returns: (sampled (lat, lng) points, readings), both in route order
+        """
+        coords = as_coordinate_array(coordinates)
+        if len(coords) == 0 or max_lookups <= 0:
+            return [], []
+        
+        cumulative = cumulative_distance_km(coords)
+        total_km = cumulative[-1]
+        
+        # Initial pass: evenly spaced by distance, not by vertex index
+        initial = int(np.ceil(total_km / spacing_km)) + 1 if spacing_km > 0 else max_lookups
+        initial = min(max(1 if total_km == 0 else 2, initial), max_lookups)
+        positions = list(np.linspace(0.0, total_km, initial))
+        readings = self._fetch_at(coords, cumulative, positions, fetch_aqi)
+        
+        # Refinement: bisect the steepest AQI jumps while budget remains
+        while len(positions) < max_lookups:
+            order = np.argsort(positions)
+            candidates = []
+            for a, b in zip(order[:-1], order[1:]):
+                gap = positions[b] - positions[a]
+                jump = abs(reading_value(readings[a] or {}) - reading_value(readings[b] or {}))
+                if gap >= 2 * min_spacing_km and jump > aqi_threshold:
+                    candidates.append((jump, (positions[a] + positions[b]) / 2))
+            
+            if not candidates:
+                break
+            
+            candidates.sort(reverse=True)
+            new_positions = [pos for _, pos in candidates[:max_lookups - len(positions)]]
+            positions.extend(new_positions)
+            readings.extend(self._fetch_at(coords, cumulative, new_positions, fetch_aqi))
+        
+        order = np.argsort(positions)
+        points = interpolate_along(coords, cumulative, [positions[i] for i in order])
+        sampled = [(float(lat), float(lng)) for lng, lat in points]
+        aqi_data = [readings[i] for i in order if readings[i]]
+        
+        return sampled, aqi_data
+    
+    def _fetch_at(self, coords: np.ndarray, cumulative: np.ndarray, positions: List[float],
+                  fetch_aqi: Callable[[List[Tuple[float, float]]], List[Optional[Dict]]]) -> List[Optional[Dict]]:
+        """Fetch readings at distances (km) along the route"""
+        points = interpolate_along(coords, cumulative, positions)
+        return list(fetch_aqi([(float(lat), float(lng)) for lng, lat in points]))
+
     
     
     def get_route_via_waypoint(self, start_coords: Tuple[float, float],
@@ -317,6 +513,6 @@ class RoutingService:
             return self._parse_route_data(route)
             
         except Exception as e:
-            print(f"      Waypoint routing failed: {str(e)}")
+            logger.warning("Waypoint routing failed: %s", e)
             return None
 
@@ -0,0 +1,110 @@
+import numpy as np
+from typing import Optional, Sequence
+
+from .geo_utils import as_coordinate_array, local_xy_km
+
+# Web-mercator ground resolution at zoom 0 on the equator (metres per pixel)
+_METRES_PER_PIXEL_Z0 = 156543.03392
+
+
+def vertex_importance(coordinates: Sequence[Sequence[float]]) -> np.ndarray:
+    """
+    Douglas-Peucker importance of every vertex of a [lng, lat] polyline, in
+    metres. Keeping the vertices with importance >= tolerance gives exactly
+    the Douglas-Peucker simplification at that tolerance, so one pass serves
+    every zoom level. Endpoints are infinitely important.
+    """
+    coords = as_coordinate_array(coordinates)
+    n = len(coords)
+    importance = np.zeros(n)
+    if n == 0:
+        return importance
+
+    importance[0] = importance[-1] = np.inf
+    if n < 3:
+        return importance
+
+    xy = local_xy_km(coords[:, 1], coords[:, 0], float(coords[:, 1].mean())) * 1000
+
+    # Split every open range of one tree level in a single vectorized pass
+    firsts = np.array([0])
+    lasts = np.array([n - 1])
+    caps = np.array([np.inf])
+    while len(firsts):
+        counts = lasts - firsts - 1
+        owner = np.repeat(np.arange(len(firsts)), counts)
+        offsets = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        points = firsts[owner] + 1 + np.arange(len(owner)) - offsets[owner]
+
+        distances = _segment_distances(xy[points], xy[firsts[owner]], xy[lasts[owner]])
+        farthest = np.maximum.reduceat(distances, offsets)
+        candidates = np.where(distances == farthest[owner], points, n)
+        splits = np.minimum.reduceat(candidates, offsets)
+
+        # Cap by the parent so importance is monotone down the split tree
+        values = np.minimum(farthest, caps)
+        importance[splits] = values
+
+        firsts, lasts = np.concatenate((firsts, splits)), np.concatenate((splits, lasts))
+        caps = np.concatenate((values, values))
+        open_ranges = lasts - firsts >= 2
+        firsts, lasts, caps = firsts[open_ranges], lasts[open_ranges], caps[open_ranges]
+
+    return importance
+
+
+def _segment_distances(points: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """Distance from each point to its own segment start-end (vectorized)"""
+    segments = ends - starts
+    offsets = points - starts
+    length_sq = (segments ** 2).sum(axis=1)
+
+    t = np.divide((offsets * segments).sum(axis=1), length_sq,
+                  out=np.zeros(len(points)), where=length_sq > 0)
+    nearest = starts + np.clip(t, 0.0, 1.0)[:, None] * segments
+    return np.sqrt(((points - nearest) ** 2).sum(axis=1))
+
+
+def zoom_tolerance_m(zoom: float, latitude: float, pixel_tolerance: float = 1.0) -> float:
+    """Ground distance (metres) covered by pixel_tolerance pixels at a map zoom"""
+    return pixel_tolerance * _METRES_PER_PIXEL_Z0 * np.cos(np.radians(latitude)) / 2 ** zoom
+
+
+def simplify(coordinates: Sequence[Sequence[float]], tolerance_m: float,
+             importance: Optional[np.ndarray] = None) -> list:
+    """
+    Vertices of a [lng, lat] polyline needed at the given tolerance (metres)
+    """
+    if importance is None:
+        importance = vertex_importance(coordinates)
+    return [coordinates[i] for i in simplify_indices(importance, tolerance_m)]
+
+
+def simplify_indices(importance: np.ndarray, tolerance_m: float) -> np.ndarray:
+    """Indices of the vertices kept at the given tolerance (metres)"""
+    return np.flatnonzero(importance >= tolerance_m)
+
+
+def top_vertices(importance: np.ndarray, count: int) -> np.ndarray:
+    """
+    Indices (in route order) of the count most important interior vertices
+    """
+    interior = importance[1:-1]
+    count = min(count, len(interior))
+    if count <= 0:
+        return np.zeros(0, dtype=int)
+
+    top = np.argpartition(-interior, count - 1)[:count] + 1
+    return np.sort(top)
+
+
+def vertex_min_zoom(importance: np.ndarray, latitude: float, max_zoom: int = 19,
+                    pixel_tolerance: float = 1.0) -> np.ndarray:
+    """
+    Lowest zoom level at which each vertex is needed. A client can redraw
+    a route for any zoom by keeping the vertices with min_zoom <= zoom.
+    """
+    z0 = pixel_tolerance * _METRES_PER_PIXEL_Z0 * np.cos(np.radians(latitude))
+    with np.errstate(divide='ignore'):
+        zooms = np.ceil(np.log2(z0 / importance))
+    return np.clip(np.nan_to_num(zooms, nan=0, posinf=max_zoom, neginf=0), 0, max_zoom).astype(int)
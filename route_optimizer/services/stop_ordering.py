@@ -0,0 +1,150 @@
+import numpy as np
+from typing import List, Optional, Tuple
+
+# Share of the cost that comes from exposure rather than distance
+OBJECTIVE_WEIGHTS = {
+    'distance': 0.0,
+    'balanced': 0.5,
+    'exposure': 1.0,
+}
+
+# Stand-in cost for pairs the router could not connect
+_UNREACHABLE = 1e9
+_EPS = 1e-9
+
+
+def blended_cost(distance: np.ndarray, exposure: np.ndarray, exposure_weight: float) -> np.ndarray:
+    """
+    Pairwise cost mixing distance and exposure, each scaled by its mean
+    so the weight means the same thing on short and long tours
+    """
+    def normalized(matrix):
+        finite = np.isfinite(matrix) & ~np.eye(len(matrix), dtype=bool)
+        scale = matrix[finite].mean() if finite.any() else 1.0
+        return matrix / scale if scale > 0 else matrix
+
+    # 0 * inf is nan for unreachable pairs at weight 0 or 1; both become _UNREACHABLE
+    with np.errstate(invalid='ignore'):
+        cost = (1 - exposure_weight) * normalized(distance) + exposure_weight * normalized(exposure)
+    cost[~np.isfinite(cost)] = _UNREACHABLE
+    np.fill_diagonal(cost, 0.0)
+    return cost
+
+
+def path_cost(cost: np.ndarray, order: List[int]) -> float:
+    order = np.asarray(order)
+    return float(cost[order[:-1], order[1:]].sum())
+
+
+def order_stops(cost: np.ndarray, start: int = 0, end: Optional[int] = None,
+                max_rounds: int = 50) -> List[int]:
+    """
+    Visit order of every node in an (asymmetric) cost matrix for a path
+    from start to end, or ending anywhere when end is None.
+    Nearest insertion builds the path, then 2-opt and Or-opt moves improve
+    it until neither finds a gain.
+    """
+    cost = np.asarray(cost, dtype=float)
+    n = len(cost)
+    open_path = end is None
+    if open_path:
+        # A free dummy end node turns the open path into a fixed-end one
+        cost = np.pad(cost, ((0, 1), (0, 1)))
+        end = n
+
+    order = nearest_insertion(cost, start, end)
+    for _ in range(max_rounds):
+        order, improved_2opt = two_opt(cost, order)
+        order, improved_or = or_opt(cost, order)
+        if not (improved_2opt or improved_or):
+            break
+
+    return order[:-1] if open_path else order
+
+
+def nearest_insertion(cost: np.ndarray, start: int, end: int) -> List[int]:
+    """Grow a start..end path by inserting the node closest to it at its cheapest position"""
+    n = len(cost)
+    order = [start, end]
+    remaining = np.ones(n, dtype=bool)
+    remaining[[start, end]] = False
+
+    # Distance from the path (either direction) to every node not yet on it
+    nearest = np.minimum(np.minimum(cost[start], cost[:, start]),
+                         np.minimum(cost[end], cost[:, end]))
+    while remaining.any():
+        candidates = np.flatnonzero(remaining)
+        node = int(candidates[np.argmin(nearest[candidates])])
+
+        path = np.asarray(order)
+        added = cost[path[:-1], node] + cost[node, path[1:]] - cost[path[:-1], path[1:]]
+        position = int(np.argmin(added)) + 1
+        order.insert(position, node)
+
+        remaining[node] = False
+        nearest = np.minimum(nearest, np.minimum(cost[node], cost[:, node]))
+
+    return order
+
+
+def two_opt(cost: np.ndarray, order: List[int]) -> Tuple[List[int], bool]:
+    """
+    Best-improvement 2-opt with fixed endpoints. Segment reversal is costed
+    in both directions, so asymmetric matrices are handled exactly.
+    """
+    order = np.asarray(order)
+    improved = False
+    if len(order) < 4:
+        return order.tolist(), improved
+
+    while True:
+        forward = np.concatenate(([0.0], np.cumsum(cost[order[:-1], order[1:]])))
+        backward = np.concatenate(([0.0], np.cumsum(cost[order[1:], order[:-1]])))
+
+        # Reverse order[i..j] for 1 <= i < j <= len - 2
+        i = np.arange(1, len(order) - 1)[:, None]
+        j = np.arange(1, len(order) - 1)[None, :]
+        a, b = order[i - 1], order[j + 1]
+        delta = (cost[a, order[j]] + (backward[j] - backward[i]) + cost[order[i], b]
+                 - cost[a, order[i]] - (forward[j] - forward[i]) - cost[order[j], b])
+        delta[j <= i] = 0.0
+
+        best = np.unravel_index(np.argmin(delta), delta.shape)
+        if delta[best] >= -_EPS:
+            return order.tolist(), improved
+        first, last = best[0] + 1, best[1] + 1
+        order[first:last + 1] = order[first:last + 1][::-1]
+        improved = True
+
+
+def or_opt(cost: np.ndarray, order: List[int], max_segment: int = 3) -> Tuple[List[int], bool]:
+    """
+    Move runs of up to max_segment consecutive stops to their cheapest
+    position elsewhere in the path (endpoints stay fixed)
+    """
+    order = list(order)
+    improved = False
+    moved = True
+    while moved:
+        moved = False
+        for length in range(1, max_segment + 1):
+            for first in range(1, len(order) - length):
+                last = first + length - 1
+                segment = order[first:last + 1]
+                before, after = order[first - 1], order[last + 1]
+                removal_gain = (cost[before, segment[0]] + cost[segment[-1], after]
+                                - cost[before, after])
+
+                rest = np.asarray(order[:first] + order[last + 1:])
+                insertion = (cost[rest[:-1], segment[0]] + cost[segment[-1], rest[1:]]
+                             - cost[rest[:-1], rest[1:]])
+                position = int(np.argmin(insertion))
+                if insertion[position] < removal_gain - _EPS:
+                    rest = rest.tolist()
+                    order = rest[:position + 1] + segment + rest[position + 1:]
+                    improved = moved = True
+                    break
+            if moved:
+                break
+
+    return order, improved
@@ -0,0 +1,169 @@
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+from django.conf import settings
+
+from .aqi_snapshot import SnapshotAQISource
+from .artifact_store import ArtifactStore, ArtifactVersion, LiveArtifact
+from .climatology import ClimatologyAQISource
+from .exposure_service import DEFAULT_AQI
+from .graph_search import CSRGraph, accumulate_along_tree, dijkstra
+from .zoning import ZoneGrid
+
+ZONE_PRIORITIES = ['shortest', 'balanced', 'cleanest']
+MATRIX_NAMES = ('distance', 'duration', 'exposure')
+
+
+def edge_weight(distance: np.ndarray, aqi: np.ndarray, priority: str) -> np.ndarray:
+    """
+    Search cost of edges for a priority (distance in km, AQI 0-500 scale)
+    """
+    normalized_aqi = np.minimum(aqi / 500.0, 1.0)
+
+    if priority == 'shortest':
+        return distance
+    if priority == 'cleanest':
+        # Quadratic penalty for poor air quality
+        return 0.1 * distance + 0.9 * (normalized_aqi ** 2 * 4) * distance
+    # Balanced: 60% distance, 40% AQI
+    return 0.6 * distance + 0.4 * normalized_aqi * distance * 2
+
+
+class ZoneMatrixBuilder:
+    """
+    Computes zone x zone distance, duration and integrated exposure tables
+    for each priority by searching a graph of neighbouring zones costed
+    with the current AQI snapshot
+    """
+
+    def __init__(self, grid: Optional[ZoneGrid] = None,
+                 aqi_source: Optional[SnapshotAQISource] = None):
+        self.grid = grid or ZoneGrid()
+        self.aqi_source = aqi_source or SnapshotAQISource.current()
+
+    def zone_aqi(self) -> np.ndarray:
+        """
+        AQI at every zone centroid (climatology, then default AQI where no
+        station reports)
+        """
+        centroids = self.grid.centroids()
+        aqi = self.aqi_source.lookup(centroids[:, 0], centroids[:, 1])
+        missing = np.isnan(aqi)
+        if missing.any():
+            aqi[missing] = ClimatologyAQISource().lookup(centroids[missing, 0], centroids[missing, 1])
+        aqi[np.isnan(aqi)] = DEFAULT_AQI
+        return aqi
+
+    def zone_graph(self, aqi: Optional[np.ndarray] = None):
+        """
+        Graph of neighbouring zones with per-edge (CSR order) road distance
+        (km), duration (min) and AQI.
+        Returns: (graph, distance, duration, edge_aqi)
+        """
+        aqi = self.zone_aqi() if aqi is None else aqi
+        sources, targets, straight_km = self.grid.neighbour_edges()
+        graph = CSRGraph(self.grid.size, sources, targets)
+        distance = graph.edge_values(straight_km * settings.ZONE_CIRCUITY)
+        duration = distance / settings.ZONE_SPEED_KMPH * 60
+        # Each half of an edge is spent in one of its two zones
+        edge_aqi = graph.edge_values((aqi[sources] + aqi[targets]) / 2)
+        return graph, distance, duration, edge_aqi
+
+    def build(self, priorities: Optional[List[str]] = None) -> Dict[str, np.ndarray]:
+        """
+        Returns: {'distance' | 'duration' | 'exposure': (priorities, zones, zones) arrays,
+                  'zone_aqi': (zones,) array}
+        """
+        priorities = priorities or ZONE_PRIORITIES
+        zones = self.grid.size
+        aqi = self.zone_aqi()
+        graph, distance, duration, edge_aqi = self.zone_graph(aqi)
+        exposure = duration * edge_aqi
+
+        tables = {name: np.full((len(priorities), zones, zones), np.inf, dtype=np.float32)
+                  for name in MATRIX_NAMES}
+        for p, priority in enumerate(priorities):
+            weights = edge_weight(distance, edge_aqi, priority)
+            for origin in range(zones):
+                _, pred_edge, order = dijkstra(graph, origin, weights)
+                totals = accumulate_along_tree(graph, pred_edge, order, [distance, duration, exposure])
+                for name, total in zip(MATRIX_NAMES, totals):
+                    tables[name][p, origin] = total
+
+        tables['zone_aqi'] = aqi.astype(np.float32)
+        return tables
+
+    def build_and_save(self, directory: Optional[Path] = None,
+                       priorities: Optional[List[str]] = None) -> Dict:
+        """
+        Build the tables and publish them as a new version of the zone
+        matrix artifact; workers switch to it on their next lookup
+        """
+        priorities = priorities or ZONE_PRIORITIES
+
+        started = time.time()
+        tables = self.build(priorities)
+        meta = {
+            'grid': self.grid.to_dict(),
+            'priorities': priorities,
+            'built_at': int(time.time()),
+            'build_seconds': round(time.time() - started, 2),
+            'stations': self.aqi_source.station_count,
+        }
+        meta['version'] = ArtifactStore(directory or settings.ZONE_MATRIX_DIR).publish(tables, meta)
+        return meta
+
+
+class ZoneMatrix:
+    """
+    Read-only, memory-mapped view of one version of the zone matrix
+    """
+
+    def __init__(self, artifact: ArtifactVersion):
+        self.version = artifact.version
+        self.meta = artifact.meta
+        self.grid = ZoneGrid(tuple(self.meta['grid']['bbox']),
+                             (self.meta['grid']['rows'], self.meta['grid']['cols']))
+        self.priorities = self.meta['priorities']
+        self.tables = {name: artifact[name] for name in MATRIX_NAMES + ('zone_aqi',)}
+
+    @classmethod
+    def current(cls, directory: Optional[Path] = None) -> Optional['ZoneMatrix']:
+        """Current version, reopened when a new one is published; None if never built"""
+        return _current.get(directory or settings.ZONE_MATRIX_DIR)
+
+    def lookup(self, start_lat: float, start_lng: float,
+               end_lat: float, end_lng: float) -> Dict:
+        """
+        Coarse distance, duration and exposure between the zones of two
+        points, for every priority in the matrix
+        """
+        origin = int(self.grid.zone_of(start_lat, start_lng))
+        destination = int(self.grid.zone_of(end_lat, end_lng))
+
+        estimates = {}
+        for p, priority in enumerate(self.priorities):
+            duration = float(self.tables['duration'][p, origin, destination])
+            exposure = float(self.tables['exposure'][p, origin, destination])
+            estimates[priority] = {
+                'distance': round(float(self.tables['distance'][p, origin, destination]), 2),
+                'duration': round(duration, 2),
+                'exposure': round(exposure, 2),
+                'average_aqi': round(exposure / duration, 2) if duration > 0
+                else round(float(self.tables['zone_aqi'][origin]), 2),
+            }
+
+        return {
+            'source_zone': origin,
+            'destination_zone': destination,
+            'in_service_area': bool(self.grid.contains(start_lat, start_lng)
+                                    and self.grid.contains(end_lat, end_lng)),
+            'built_at': self.meta['built_at'],
+            'version': self.version,
+            'estimates': estimates,
+        }
+
+
+_current = LiveArtifact(ZoneMatrix)
@@ -0,0 +1,73 @@
+import numpy as np
+from django.conf import settings
+from typing import List, Optional, Tuple
+
+from .geo_utils import haversine_km
+
+
+class ZoneGrid:
+    """
+    Regular rows x cols partition of the service-area bounding box.
+    Zone ids run row-major from the south-west corner.
+    """
+
+    def __init__(self, bbox: Optional[Tuple[float, float, float, float]] = None,
+                 shape: Optional[Tuple[int, int]] = None):
+        self.min_lat, self.min_lng, self.max_lat, self.max_lng = bbox or settings.SERVICE_AREA_BBOX
+        self.rows, self.cols = shape or settings.ZONE_GRID_SHAPE
+        self.lat_step = (self.max_lat - self.min_lat) / self.rows
+        self.lng_step = (self.max_lng - self.min_lng) / self.cols
+
+    @property
+    def size(self) -> int:
+        return self.rows * self.cols
+
+    def contains(self, lats, lngs) -> np.ndarray:
+        lats = np.asarray(lats)
+        lngs = np.asarray(lngs)
+        return ((lats >= self.min_lat) & (lats <= self.max_lat) &
+                (lngs >= self.min_lng) & (lngs <= self.max_lng))
+
+    def zone_of(self, lats, lngs) -> np.ndarray:
+        """Zone id of each position (positions outside the box are clamped)"""
+        rows = np.clip(((np.asarray(lats) - self.min_lat) / self.lat_step).astype(int), 0, self.rows - 1)
+        cols = np.clip(((np.asarray(lngs) - self.min_lng) / self.lng_step).astype(int), 0, self.cols - 1)
+        return rows * self.cols + cols
+
+    def centroids(self) -> np.ndarray:
+        """(size, 2) array of zone centres as (lat, lng)"""
+        rows, cols = np.divmod(np.arange(self.size), self.cols)
+        lats = self.min_lat + (rows + 0.5) * self.lat_step
+        lngs = self.min_lng + (cols + 0.5) * self.lng_step
+        return np.stack([lats, lngs], axis=-1)
+
+    def neighbour_edges(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Directed edges between 8-connected neighbouring zones.
+        Returns: (from zone ids, to zone ids, straight-line length in km)
+        """
+        rows, cols = np.divmod(np.arange(self.size), self.cols)
+        sources: List[np.ndarray] = []
+        targets: List[np.ndarray] = []
+        for d_row in (-1, 0, 1):
+            for d_col in (-1, 0, 1):
+                if d_row == 0 and d_col == 0:
+                    continue
+                to_rows, to_cols = rows + d_row, cols + d_col
+                valid = (to_rows >= 0) & (to_rows < self.rows) & (to_cols >= 0) & (to_cols < self.cols)
+                sources.append(np.flatnonzero(valid))
+                targets.append(to_rows[valid] * self.cols + to_cols[valid])
+
+        sources = np.concatenate(sources)
+        targets = np.concatenate(targets)
+        centroids = self.centroids()
+        lengths = haversine_km(centroids[sources, 0], centroids[sources, 1],
+                               centroids[targets, 0], centroids[targets, 1])
+        return sources, targets, lengths
+
+    def to_dict(self) -> dict:
+        return {
+            'bbox': [self.min_lat, self.min_lng, self.max_lat, self.max_lng],
+            'rows': self.rows,
+            'cols': self.cols,
+        }
@@ -0,0 +1,38 @@
+from django.dispatch import Signal, receiver
+
+# Sent after a new AQI snapshot has been written to the Location table.
+# Keyword args: epoch (int), stations (number of stations updated)
+aqi_snapshot_ingested = Signal()
+
+
+@receiver(aqi_snapshot_ingested)
+def invalidate_route_cache(sender, epoch=None, **kwargs):
+    """Cached routes were scored against the previous snapshot"""
+    from .services.route_cache import RouteCache
+    RouteCache().set_snapshot_epoch(epoch)
+
+
+@receiver(aqi_snapshot_ingested)
+def rebuild_zone_matrix(sender, **kwargs):
+    """Recompute zone-to-zone exposure against the new snapshot (no upstream calls)"""
+    from django.conf import settings
+    if not settings.ZONE_MATRIX_REBUILD_ON_SNAPSHOT:
+        return
+
+    from .services.zone_matrix import ZoneMatrixBuilder
+    ZoneMatrixBuilder().build_and_save()
+
+
+@receiver(aqi_snapshot_ingested)
+def prewarm_route_cache(sender, **kwargs):
+    """Recompute the hottest routes for the current hour against the new snapshot"""
+    from django.conf import settings
+    if not settings.ROUTE_PREWARM_ON_SNAPSHOT:
+        return
+
+    from django.utils import timezone
+    from zoneinfo import ZoneInfo
+    from .services.route_prewarmer import RoutePrewarmer
+
+    hour = timezone.now().astimezone(ZoneInfo(settings.PREWARM_TIME_ZONE)).hour
+    RoutePrewarmer().prewarm(top_n=settings.PREWARM_TOP_N, hour=hour)
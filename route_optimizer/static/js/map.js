@@ -59,6 +59,68 @@ function getAQICategoryClass(aqi) {
     return 'status-hazardous';
 }
 
+// Decode a Google encoded polyline into [lat, lng] pairs
+function decodePolyline(encoded, precision = 5) {
+    const factor = Math.pow(10, precision);
+    const latlngs = [];
+    let index = 0, lat = 0, lng = 0;
+    
+    while (index < encoded.length) {
+        const deltas = [0, 0];
+        for (let i = 0; i < 2; i++) {
+            let result = 0, shift = 0, byte;
+            do {
+                byte = encoded.charCodeAt(index++) - 63;
+                result |= (byte & 0x1f) << shift;
+                shift += 5;
+            } while (byte >= 0x20);
+            deltas[i] = (result & 1) ? ~(result >> 1) : (result >> 1);
+        }
+        lat += deltas[0];
+        lng += deltas[1];
+        latlngs.push([lat / factor, lng / factor]);
+    }
+    
+    return latlngs;
+}
+
+// Route geometry as Leaflet [lat, lng] pairs (compact or full response)
+function getRouteLatLngs(route) {
+    if (route.geometry && route.geometry.encoding === 'polyline') {
+        return decodePolyline(route.geometry.polyline, route.geometry.precision);
+    }
+    return route.coordinates.map(coord => [coord[1], coord[0]]);
+}
+
+// Routes drawn with per-vertex zoom levels, redrawn on zoom changes
+let zoomAwareLayers = [];
+
+// Keep only the vertices needed at a zoom level
+function filterForZoom(latlngs, minZoom, zoom) {
+    if (!minZoom || minZoom.length !== latlngs.length) return latlngs;
+    return latlngs.filter((_, i) => minZoom[i] <= zoom);
+}
+
+// Draw a route polyline that simplifies itself to the current zoom
+function addRoutePolyline(route, options) {
+    const latlngs = getRouteLatLngs(route);
+    const minZoom = route.vertex_min_zoom;
+    const layer = L.polyline(filterForZoom(latlngs, minZoom, map.getZoom()), options).addTo(map);
+    
+    if (minZoom && minZoom.length === latlngs.length) {
+        zoomAwareLayers.push({ layer, latlngs, minZoom });
+    }
+    return layer;
+}
+
+map.on('zoomend', function() {
+    const zoom = map.getZoom();
+    zoomAwareLayers = zoomAwareLayers.filter(entry => map.hasLayer(entry.layer));
+    zoomAwareLayers.forEach(entry => {
+        entry.layer.setLatLngs(filterForZoom(entry.latlngs, entry.minZoom, zoom));
+    });
+});
+
 // Show loading overlay
 function showLoading() {
     document.getElementById('loadingOverlay').style.display = 'flex';
@@ -313,12 +375,11 @@ function displayRoute(routeData) {
     }).addTo(map);
     destMarker.bindPopup(`<b>Destination:</b><br>${route.destination.name}`);
     
-    const coordinates = route.coordinates.map(coord => [coord[1], coord[0]]);
-    routeLayer = L.polyline(coordinates, {
+    routeLayer = addRoutePolyline(route, {
         color: getAQIColor(route.average_aqi),
         weight: 6,
         opacity: 0.8
-    }).addTo(map);
+    });
     
     if (route.aqi_data && route.aqi_data.length > 0) {
         route.aqi_data.forEach((aqiPoint, index) => {
@@ -422,14 +483,13 @@ function displayComparisonRoutes(routes) {
     
     // Draw each route with different color
     routes.forEach(route => {
-        const coordinates = route.coordinates.map(coord => [coord[1], coord[0]]);
         const color = priorityColors[route.priority] || '#999999';
         
-        const routeLayer = L.polyline(coordinates, {
+        const routeLayer = addRoutePolyline(route, {
             color: color,
             weight: 5,
             opacity: 0.7
-        }).addTo(map);
+        });
         
         routeLayer.bindPopup(`
             <div style="font-family: Inter, sans-serif;">
@@ -528,7 +588,9 @@ async function compareAllRoutes() {
                     source_address: source,
                     destination_address: destination,
                     priority: priority,
-                    pollutant_type: ['pm25', 'pm10', 'co', 'o3', 'so2'].includes(priority) ? priority : null
+                    pollutant_type: ['pm25', 'pm10', 'co', 'o3', 'so2'].includes(priority) ? priority : null,
+                    compact: true,
+                    zoom_levels: true
                 })
             });
             
@@ -582,7 +644,9 @@ async function findRoute() {
                 source_address: source,
                 destination_address: destination,
                 priority: priority,
-                pollutant_type: ['pm25', 'pm10', 'co', 'o3', 'so2'].includes(priority) ? priority : null
+                pollutant_type: ['pm25', 'pm10', 'co', 'o3', 'so2'].includes(priority) ? priority : null,
+                compact: true,
+                zoom_levels: true
             })
         });
         
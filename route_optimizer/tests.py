@@ -1,3 +1,1138 @@
-from django.test import TestCase
+import importlib.util
+import itertools
+import os
+import pickle
+import tempfile
+import threading
+import time
+import unittest
+import warnings
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+from zoneinfo import ZoneInfo
 
-# Create your tests here.
+import numpy as np
+from django.conf import settings
+from django.core.cache.backends.locmem import LocMemCache
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+
+from .models import AQIReading, RouteHistory
+from .metrics import LATENCIES, ROUTE_CACHE_LOOKUPS, LatencyTracker
+from .services.admission import AdmissionController, queue_wait
+from .services.air_quality_service import AirQualityService
+from .services import artifact_store
+from .services.zoning import ZoneGrid
+from .services.artifact_store import ArtifactStore, LiveArtifact
+from .services.aqi_model import (
+    FEATURES, AQIModelService, LinearAQIModel, export_linear_model, fill_feature_defaults,
+)
+from .services.aqi_forecast import HourlyAQILayers
+from .services.climatology import CLIMATOLOGY_FIELDS, CLIMATOLOGY_STATS, Climatology, ClimatologyBuilder, hour_of_week
+from .services.deadline import Deadline, DeadlineExceeded, hedged
+from .services.dijkstra_optimizer import DijkstraOptimizer
+from .services.model_training import AQIModelTrainer, row_groups
+from .services.exposure_service import ExposureService
+from .services.graph_search import (
+    ContractionHierarchy, CSRGraph, astar, bidirectional_dijkstra, dijkstra, reverse_graph,
+)
+from .services.quota import coalesced
+from .services.route_cache import RouteCache
+from .services.route_prewarmer import RoutePrewarmer
+from .services.routing_service import RoutingService
+from .services.polyline_codec import decode_polyline, encode_polyline
+from .services.geo_utils import local_xy_km
+from .services.simplification import simplify, simplify_indices, vertex_importance
+from .services.stop_ordering import blended_cost, order_stops, path_cost
+
+
+@unittest.skipUnless(importlib.util.find_spec('sklearn'), 'scikit-learn is not installed')
+class LinearAQIModelExportTests(SimpleTestCase):
+    """The exported NumPy predictor must match the scikit-learn pickles"""
+
+    def setUp(self):
+        with open(settings.AQI_MODEL_PATH, 'rb') as f:
+            self.model = pickle.load(f)
+        with open(settings.AQI_SCALER_PATH, 'rb') as f:
+            self.scaler = pickle.load(f)
+
+        rng = np.random.default_rng(0)
+        self.features = np.column_stack([
+            rng.normal(150, 50, 500), rng.normal(200, 60, 500), rng.normal(80, 30, 500),
+            rng.normal(15, 5, 500), rng.normal(60, 20, 500), rng.normal(28, 8, 500),
+            rng.normal(60, 15, 500), rng.normal(8, 3, 500),
+            rng.integers(0, 24, 500), rng.integers(0, 7, 500),
+        ]).astype(float)
+
+    def sklearn_predict(self, features):
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', UserWarning)
+            return self.model.predict(self.scaler.transform(features))
+
+    def test_export_round_trip_matches_pickle(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'model.npz')
+            export_linear_model(self.model, self.scaler, path)
+            loaded = LinearAQIModel.load(path)
+
+        np.testing.assert_allclose(loaded.predict(self.features),
+                                   self.sklearn_predict(self.features), rtol=1e-12, atol=1e-9)
+
+    def test_shipped_artifact_matches_pickle(self):
+        loaded = LinearAQIModel.load(settings.AQI_MODEL_ARTIFACT_PATH)
+        np.testing.assert_allclose(loaded.predict(self.features),
+                                   self.sklearn_predict(self.features), rtol=1e-12, atol=1e-9)
+
+    def test_feature_order(self):
+        self.assertEqual(list(self.scaler.feature_names_in_), list(FEATURES))
+
+
+class _BandedSource:
+    """AQI source with one value south of a latitude and another north of it"""
+
+    def __init__(self, boundary, south, north):
+        self.boundary, self.south, self.north = boundary, south, north
+        self.calls = 0
+
+    def lookup(self, lats, lngs, field='aqi'):
+        self.calls += 1
+        return np.where(np.asarray(lats) < self.boundary, self.south, self.north).astype(float)
+
+
+class ExposureServiceTests(SimpleTestCase):
+    """Exposure is AQI integrated over the time spent on every segment"""
+
+    # Two segments due north, the second three times as long as the first
+    ROUTE = {'coordinates': [[88.0, 22.0], [88.0, 22.01], [88.0, 22.04]], 'duration': 10.0,
+             'steps': [{'way_points': [0, 1], 'duration': 240.0}]}
+
+    def test_segment_durations_follow_steps(self):
+        service = ExposureService()
+        # The step covers the first segment (4 min); the second gets the rest of the 10
+        np.testing.assert_allclose(service.segment_durations(np.array([1.0, 3.0]), 10.0, self.ROUTE['steps']),
+                                   [4.0, 6.0])
+        # Without steps, time is shared by length
+        np.testing.assert_allclose(service.segment_durations(np.array([1.0, 3.0]), 10.0), [2.5, 7.5])
+        np.testing.assert_array_equal(service.segment_durations(np.zeros(2), 10.0), [0.0, 0.0])
+
+    def test_integrate_route_matches_hand_sum(self):
+        service = ExposureService([_BandedSource(22.01, 100.0, 200.0)])
+        result = service.integrate_route(self.ROUTE)
+
+        self.assertAlmostEqual(result['exposure'], 100.0 * 4 + 200.0 * 6)
+        self.assertAlmostEqual(result['peak_aqi'], 200.0)
+        self.assertAlmostEqual(result['average_aqi'], 160.0)
+        np.testing.assert_allclose(result['profile']['duration_min'], [4.0, 6.0])
+        np.testing.assert_allclose(result['profile']['aqi'], [100.0, 200.0])
+        lengths = result['profile']['distance_km']
+        self.assertAlmostEqual(lengths[1] / lengths[0], 3.0, places=6)
+        self.assertIsNone(result['profile']['arrival'])
+
+    def test_readings_come_before_sources(self):
+        fallback = _BandedSource(0.0, 999.0, 999.0)
+        service = ExposureService([fallback], default_aqi=50.0)
+        readings = [{'aqi': 80, 'location': {'lat': 22.0, 'lng': 88.0}},
+                    {'aqi': '-', 'location': {'lat': 22.04, 'lng': 88.0}}]
+        result = service.integrate_route(self.ROUTE, readings)
+        # The '-' station does not report, so both segments take the other station, not the fallback
+        np.testing.assert_allclose(result['profile']['aqi'], [80.0, 80.0])
+        self.assertEqual(fallback.calls, 0)
+
+        result = ExposureService(default_aqi=50.0).integrate_route(self.ROUTE)
+        self.assertAlmostEqual(result['exposure'], 50.0 * 10)
+
+    def test_single_point_route(self):
+        result = ExposureService([_BandedSource(22.01, 100.0, 200.0)]).integrate_route(
+            {'coordinates': [[88.0, 22.02]], 'duration': 0})
+        self.assertEqual(result['exposure'], 0.0)
+        self.assertEqual(result['peak_aqi'], 200.0)
+
+
+class _RecordingForecast:
+    """Forecast that doubles AQI from a given time on and records the times asked for"""
+
+    def __init__(self, from_time):
+        self.from_time = from_time
+        self.times = []
+
+    def factors(self, lats, lngs, times):
+        self.times.append(np.array(times))
+        return np.where(np.asarray(times) >= self.from_time, 2.0, 1.0)
+
+
+# Relative AQI rising by a tenth each local hour, so hourly factors are easy to read
+_RISING_PROFILE = tuple(1.0 + hour / 10 for hour in range(24))
+
+
+@override_settings(AQI_DIURNAL_PROFILE=_RISING_PROFILE, AQI_FORECAST_HOURS=6)
+class ForecastExposureTests(SimpleTestCase):
+    """Forecast AQI is applied at the time each segment is reached"""
+
+    DEPARTURE = 1_700_000_000.0
+
+    def layers(self):
+        # The first full UTC hour whose local (Kolkata) hour is 01:00-05:59, so six hours never wrap
+        reference = 3600 * (self.DEPARTURE // 3600)
+        local_tz = ZoneInfo(settings.AQI_FORECAST_TIME_ZONE)
+        while not 1 <= hour_of_week(reference, local_tz)[0] % 24 <= 5:
+            reference += 3600
+        source = mock.Mock(lookup=lambda lats, lngs: np.full(len(lats), 100.0))
+        with mock.patch('route_optimizer.services.aqi_forecast.Climatology.current', return_value=None):
+            return HourlyAQILayers(source, ZoneGrid((22.4, 88.2, 22.7, 88.5), (2, 2)), reference=reference)
+
+    def test_segments_scaled_at_arrival(self):
+        service = ExposureService([_BandedSource(22.01, 100.0, 200.0)])
+        # Segments take 4 and 6 minutes; their midpoints are reached after 2 and 7
+        forecast = _RecordingForecast(self.DEPARTURE + 300)
+        result = service.integrate_route(ExposureServiceTests.ROUTE, departure=self.DEPARTURE, forecast=forecast)
+
+        np.testing.assert_allclose(forecast.times[0], [self.DEPARTURE + 120, self.DEPARTURE + 420])
+        np.testing.assert_allclose(result['profile']['arrival'], forecast.times[0])
+        self.assertAlmostEqual(result['exposure'], 100.0 * 4 * 1.0 + 200.0 * 6 * 2.0)
+
+    def test_hourly_layer_factors(self):
+        layers = self.layers()
+        hour = hour_of_week(layers.reference, layers.local_tz)[0] % 24
+        lats, lngs = np.full(4, 22.5), np.full(4, 88.3)
+        times = layers.reference + np.array([0, 3600, 5400, 3 * 3600])
+        expected = [1.0, _RISING_PROFILE[hour + 1] / _RISING_PROFILE[hour],
+                    (_RISING_PROFILE[hour + 1] + _RISING_PROFILE[hour + 2]) / 2 / _RISING_PROFILE[hour],
+                    _RISING_PROFILE[hour + 3] / _RISING_PROFILE[hour]]
+        np.testing.assert_allclose(layers.factors(lats, lngs, times), expected, rtol=1e-6)
+        # Beyond the last layer the forecast holds its final value
+        np.testing.assert_allclose(layers.factors(lats[:1], lngs[:1], [layers.reference + 10 * 3600]),
+                                   [_RISING_PROFILE[hour + 5] / _RISING_PROFILE[hour]], rtol=1e-6)
+
+    def test_departure_sweep_matches_single_departures(self):
+        layers = self.layers()
+        service = ExposureService([_BandedSource(22.51, 100.0, 200.0)])
+        route = {'coordinates': [[88.3, 22.5], [88.3, 22.52], [88.3, 22.56]], 'duration': 30.0}
+        departures = layers.reference + np.array([0.0, 1800.0, 7200.0])
+        static = service.integrate_route(route)
+        swept = service.exposure_by_departure(route['coordinates'], static['profile']['duration_min'],
+                                              static['profile']['aqi'], departures, layers)
+        single = [service.integrate_route(route, departure=d, forecast=layers)['exposure'] for d in departures]
+        np.testing.assert_allclose(swept, single)
+        # The profile rises through the morning, so later departures breathe more
+        self.assertTrue(np.all(np.diff(swept) > 0))
+
+
+class AdaptiveSamplingTests(SimpleTestCase):
+    """Route AQI is sampled by distance and refined only where it changes"""
+
+    KM_PER_DEG = np.radians(1.0) * 6371.0
+    # 10 km due north, with AQI jumping from 100 to 300 at 5.2 km
+    ROUTE = [[88.3, 22.5], [88.3, 22.5 + 5 / KM_PER_DEG], [88.3, 22.5 + 10 / KM_PER_DEG]]
+
+    def setUp(self):
+        self.service = RoutingService()
+        self.fetched = []
+
+    def fetch(self, step_km=5.2):
+        def fetch_aqi(points):
+            self.fetched.extend(points)
+            return [{'aqi': 100 if (lat - 22.5) * self.KM_PER_DEG < step_km else 300,
+                     'location': {'lat': lat, 'lng': lng}} for lat, lng in points]
+        return fetch_aqi
+
+    def distances(self, points):
+        return [round((lat - 22.5) * self.KM_PER_DEG, 6) for lat, _ in points]
+
+    def test_uniform_aqi_is_not_refined(self):
+        points, readings = self.service.adaptive_sample_route_points(self.ROUTE, self.fetch(step_km=99),
+                                                                     spacing_km=2.0, max_lookups=12)
+        self.assertEqual(self.distances(points), [0.0, 2.0, 4.0, 6.0, 8.0, 10.0])
+        self.assertEqual(len(readings), 6)
+
+    def test_refines_around_aqi_jump(self):
+        points, readings = self.service.adaptive_sample_route_points(
+            self.ROUTE, self.fetch(), spacing_km=2.0, aqi_threshold=25.0, max_lookups=12, min_spacing_km=0.4)
+        # Bisected between 4 and 6 km, then 5 and 6 km, until the gap is under 2 x min_spacing_km
+        self.assertEqual(self.distances(points), [0.0, 2.0, 4.0, 5.0, 5.5, 6.0, 8.0, 10.0])
+        self.assertEqual([r['aqi'] for r in readings], [100, 100, 100, 100, 300, 300, 300, 300])
+        self.assertEqual(len(self.fetched), len(points))
+
+    def test_stays_within_budget(self):
+        for budget in (1, 2, 4, 7):
+            self.fetched = []
+            points, _ = self.service.adaptive_sample_route_points(self.ROUTE, self.fetch(), spacing_km=0.5,
+                                                                  max_lookups=budget)
+            self.assertEqual(len(points), budget)
+            self.assertEqual(len(self.fetched), budget)
+        self.assertEqual(self.service.adaptive_sample_route_points(self.ROUTE, self.fetch(), max_lookups=0),
+                         ([], []))
+
+    def test_missing_readings_are_dropped(self):
+        points, readings = self.service.adaptive_sample_route_points(
+            self.ROUTE, lambda batch: [None] * len(batch), spacing_km=5.0)
+        self.assertEqual(len(points), 3)
+        self.assertEqual(readings, [])
+
+
+@override_settings(ROUTE_CACHE_CELL_DEG=0.002, ROUTE_CACHE_TTL=3600, ROUTE_CACHE_DEPARTURE_SLOT=900)
+class RouteCacheTests(SimpleTestCase):
+    """Route results are shared per OD cell and dropped when the AQI snapshot changes"""
+
+    def setUp(self):
+        backend = LocMemCache('route-cache-tests', {})
+        backend.clear()
+        self.cache = RouteCache(backend)
+        self.cache.set_snapshot_epoch(1_700_000_000)
+
+    def key(self, **kwargs):
+        params = {'start_lat': 22.5726, 'start_lng': 88.3639, 'end_lat': 22.5958, 'end_lng': 88.2636,
+                  'priority': 'balanced'}
+        params.update(kwargs)
+        return self.cache.make_key(**params)
+
+    def test_hit_until_snapshot_epoch_changes(self):
+        hits, misses = ROUTE_CACHE_LOOKUPS.value(result='hit'), ROUTE_CACHE_LOOKUPS.value(result='miss')
+        self.cache.set(self.key(), {'distance': 12.0})
+        self.assertEqual(self.cache.get(self.key()), {'distance': 12.0})
+
+        self.cache.set_snapshot_epoch(1_700_003_600)
+        self.assertIsNone(self.cache.get(self.key()))
+        self.assertEqual(self.cache.snapshot_epoch(), 1_700_003_600)
+        self.assertEqual(ROUTE_CACHE_LOOKUPS.value(result='hit') - hits, 1)
+        self.assertEqual(ROUTE_CACHE_LOOKUPS.value(result='miss') - misses, 1)
+
+    def test_key_parts(self):
+        # Within one snapped cell the key is shared
+        self.assertEqual(self.key(start_lat=22.5727, end_lng=88.2635), self.key())
+        self.assertNotEqual(self.key(start_lat=22.5766), self.key())
+        self.assertNotEqual(self.key(priority='cleanest'), self.key())
+        self.assertNotEqual(self.key(pollutant_type='pm25'), self.key())
+        # Departures share a key within a slot
+        self.assertEqual(self.key(departure=1_700_000_100), self.key(departure=1_700_000_800))
+        self.assertNotEqual(self.key(departure=1_700_000_100), self.key(departure=1_700_001_000))
+        self.assertNotEqual(self.key(departure=1_700_000_100), self.key())
+
+    def test_epoch_falls_back_to_current_hour(self):
+        empty = RouteCache(LocMemCache('route-cache-tests-empty', {}))
+        with mock.patch('route_optimizer.services.route_cache.time.time', return_value=7200.5):
+            self.assertEqual(empty.snapshot_epoch(), 2)
+
+
+class _SnapshotStub:
+    """Snapshot with pm25 55 and pm10 80 south of 22.7, no stations north of it"""
+
+    VALUES = {'pm25': 55.0, 'pm10': 80.0}
+
+    def lookup(self, lats, lngs, field='aqi'):
+        return np.where(np.asarray(lats) < 22.7, self.VALUES.get(field, np.nan), np.nan)
+
+
+@override_settings(AQI_READING_MAX_AGE=3 * 3600)
+class AQIModelFillTests(SimpleTestCase):
+    """Missing, unreported and stale readings are replaced by labelled model estimates"""
+
+    NOW = 1_700_000_000.0
+
+    def setUp(self):
+        # AQI = pm25 + temperature, so the inputs each estimate used are visible
+        coef = np.zeros(len(FEATURES))
+        coef[FEATURES.index('pm25')] = coef[FEATURES.index('temperature')] = 1.0
+        model = LinearAQIModel(np.zeros(len(FEATURES)), np.ones(len(FEATURES)), coef, 0.0)
+        self.service = AQIModelService(published=model)
+        patcher = mock.patch('route_optimizer.services.aqi_model.SnapshotAQISource.current',
+                             return_value=_SnapshotStub())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def observed(self, age):
+        return datetime.fromtimestamp(self.NOW - age, timezone.utc).isoformat()
+
+    def test_fill_readings(self):
+        points = [(22.5, 88.3), (22.55, 88.35), (22.6, 88.4), (22.8, 88.3), (22.65, 88.3)]
+        readings = [
+            {'aqi': 90, 'temperature': 20, 'observed_at': self.observed(600)},
+            {'aqi': 120, 'pm25': 70, 'pm10': 100, 'temperature': 30, 'observed_at': self.observed(4 * 3600)},
+            {'aqi': '-', 'pm25': '-', 'observed_at': self.observed(600)},
+            None,
+            {'aqi': 75},
+        ]
+        filled = self.service.fill_readings(points, readings, now=self.NOW)
+
+        self.assertEqual([r['source'] for r in filled], ['waqi', 'model', 'model', 'model', 'waqi'])
+        self.assertEqual([r['confidence'] for r in filled], ['high', 'medium', 'medium', 'low', 'high'])
+        self.assertEqual(filled[0]['aqi'], 90)
+        self.assertEqual(filled[4]['aqi'], 75)
+        # Stale: its own pollutants and weather
+        self.assertEqual(filled[1]['aqi'], 70 + 30)
+        self.assertEqual(filled[1]['measured_aqi'], 120)
+        self.assertEqual(filled[1]['observed_at'], readings[1]['observed_at'])
+        # '-': snapshot pollutants and the batch's mean temperature
+        self.assertEqual(filled[2]['aqi'], 55 + 25)
+        self.assertEqual(filled[2]['measured_aqi'], '-')
+        # Missing, outside the snapshot: training defaults for pollutants
+        defaults = settings.AQI_MODEL_FEATURE_DEFAULTS
+        self.assertEqual(filled[3]['aqi'], defaults['pm25'] + 25)
+        self.assertEqual(filled[3]['location'], {'lat': 22.8, 'lng': 88.3, 'name': 'Model estimate'})
+        self.assertNotIn('measured_aqi', filled[3])
+        # The caller's readings are not modified
+        self.assertNotIn('source', readings[0])
+
+    def test_zero_and_negative_weather_are_readings(self):
+        reading = {'aqi': 120, 'pm25': 0, 'pm10': 100, 'temperature': -2, 'wind_speed': 0,
+                   'observed_at': self.observed(4 * 3600)}
+        filled = self.service.fill_readings([(22.5, 88.3)], [reading], now=self.NOW)[0]
+        self.assertEqual((filled['temperature'], filled['wind_speed']), (-2.0, 0.0))
+        # A zero pollutant is WAQI's placeholder: the snapshot value is used
+        self.assertEqual(filled['pm25'], 55.0)
+        self.assertEqual(filled['aqi'], 55 - 2)
+
+        defaults = settings.AQI_MODEL_FEATURE_DEFAULTS
+        features = np.full((1, len(FEATURES)), np.nan)
+        features[0, :8] = [0, -1, np.nan, 3, 4, 0, np.nan, -0.5]
+        fill_feature_defaults(features)
+        np.testing.assert_array_equal(features[0, :8], [defaults['pm25'], defaults['pm10'], defaults['no2'],
+                                                        3, 4, 0, defaults['humidity'], -0.5])
+
+    def test_unreported_weather_is_missing(self):
+        parsed = AirQualityService()._parse_aqi_data({
+            'aqi': '-', 'iaqi': {'pm25': {'v': 60}, 'pm10': {'v': 90}, 't': {'v': 0}},
+            'city': {'geo': [22.5, 88.3], 'name': 'Central'}})
+        self.assertEqual((parsed['temperature'], parsed['humidity'], parsed['wind_speed']), (0, None, None))
+
+        filled = self.service.fill_readings([(22.5, 88.3)], [parsed], now=self.NOW)[0]
+        defaults = settings.AQI_MODEL_FEATURE_DEFAULTS
+        self.assertEqual((filled['temperature'], filled['wind_speed']), (0.0, defaults['wind_speed']))
+        self.assertEqual(filled['aqi'], 60)
+
+    def test_without_model_readings_pass_through(self):
+        with self.assertLogs('route_optimizer.services.aqi_model', 'WARNING'):
+            service = AQIModelService(artifact_path='/nonexistent.npz', model_path='/nonexistent.pkl')
+        self.assertFalse(service.available)
+        filled = service.fill_readings([(22.5, 88.3), (22.6, 88.3)], [{'aqi': 90}, None], now=self.NOW)
+        self.assertEqual(filled, [{'aqi': 90, 'source': 'waqi', 'confidence': 'high'}, None])
+
+
+class AQIModelTrainerTests(TestCase):
+    """Coefficients from streamed normal equations must match a direct least-squares fit"""
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = np.random.default_rng(0)
+        start = datetime(2024, 1, 1, tzinfo=timezone.utc).timestamp()
+        readings = []
+        for i in range(400):
+            pollutants = rng.uniform(5, 300, 5)
+            weather = [rng.uniform(-5, 40), rng.uniform(10, 95), rng.uniform(0, 20)]
+            if i % 7 == 0:
+                weather[1] = None  # trained on the humidity default
+            aqi = 20 + 0.6 * pollutants[0] + 0.2 * pollutants[1] + 0.5 * weather[0] + rng.normal(0, 5)
+            readings.append(AQIReading(
+                station_name=f'Station {i % 9}', latitude=22.5, longitude=88.3, aqi=aqi,
+                pm25=pollutants[0], pm10=pollutants[1], no2=pollutants[2], co=pollutants[3], o3=pollutants[4],
+                temperature=weather[0], humidity=weather[1], wind_speed=weather[2],
+                observed_at=datetime.fromtimestamp(start + rng.uniform(0, 60 * 86400), timezone.utc)))
+        AQIReading.objects.bulk_create(readings)
+
+    def expected_fit(self, folds, test_size):
+        """Raw-feature OLS over the training rows, built without the trainer"""
+        local_tz = ZoneInfo(settings.AQI_FORECAST_TIME_ZONE)
+        defaults = settings.AQI_MODEL_FEATURE_DEFAULTS
+        rows = AQIReading.objects.order_by('id')
+        ids = np.array([r.id for r in rows])
+        features = np.array([[getattr(r, f) if getattr(r, f) is not None else defaults[f] for f in FEATURES[:8]]
+                             + [r.observed_at.astimezone(local_tz).hour, r.observed_at.astimezone(local_tz).weekday()]
+                             for r in rows])
+        target = np.array([r.aqi for r in rows])
+        train = row_groups(ids, folds, test_size) < folds
+        design = np.column_stack([features[train], np.ones(train.sum())])
+        solution = np.linalg.lstsq(design, target[train], rcond=None)[0]
+        return solution[:-1], solution[-1]
+
+    def test_matches_lstsq(self):
+        coef, intercept = self.expected_fit(folds=5, test_size=0.2)
+        for chunk_size in (1, 37, 10000):
+            trainer = AQIModelTrainer(folds=5, test_size=0.2, chunk_size=chunk_size, jobs=1,
+                                      alphas={'Linear Regression': 0.0})
+            report = trainer.train()
+            model = report['models']['Linear Regression']
+            raw = model.coef / model.scale
+            with self.subTest(chunk_size=chunk_size):
+                np.testing.assert_allclose(raw, coef, rtol=1e-6, atol=1e-8)
+                self.assertAlmostEqual(model.intercept - raw @ model.mean, intercept, places=5)
+                self.assertEqual(report['rows'], 400)
+
+        metrics = report['metrics'][0]
+        self.assertGreater(metrics['Test R²'], 0.95)
+        self.assertGreater(metrics['CV R² Mean'], 0.95)
+        self.assertLess(metrics['Test RMSE'], 10)
+
+    def test_ridge_shrinks_coefficients(self):
+        trainer = AQIModelTrainer(folds=5, jobs=1, alphas={'Linear Regression': 0.0, 'Ridge Regression': 50.0})
+        models = trainer.train()['models']
+        self.assertLess(np.linalg.norm(models['Ridge Regression'].coef),
+                        np.linalg.norm(models['Linear Regression'].coef))
+
+    def test_too_few_readings(self):
+        AQIReading.objects.filter(id__gt=AQIReading.objects.order_by('id')[5].id).delete()
+        with self.assertRaises(ValueError):
+            AQIModelTrainer(folds=5, jobs=1).train()
+
+
+@override_settings(CLIMATOLOGY_DAYS=365, CLIMATOLOGY_MIN_SAMPLES=3)
+class ClimatologyBuilderTests(TestCase):
+    """Hour-of-week statistics streamed from the reading history"""
+
+    GRID = ZoneGrid((22.4, 88.2, 22.7, 88.5), (2, 2))
+
+    @classmethod
+    def setUpTestData(cls):
+        local_tz = ZoneInfo(settings.AQI_FORECAST_TIME_ZONE)
+        today = datetime.now(local_tz).replace(hour=8, minute=0, second=0, microsecond=0)
+        # Last week's Monday 08:00-08:59 local: AQI 1..100, one reading every 30 s
+        cls.monday = today - timedelta(days=today.weekday() + 7)
+        readings = [AQIReading(station_name='Central', latitude=22.55, longitude=88.35, aqi=float(value),
+                               pm25=None, observed_at=cls.monday + timedelta(seconds=30 * value))
+                    for value in range(1, 101)]
+        # Too few readings on Monday 09:00 to describe that hour
+        readings += [AQIReading(station_name='Central', latitude=22.55, longitude=88.35, aqi=200.0,
+                                observed_at=cls.monday + timedelta(hours=1, minutes=i)) for i in range(2)]
+        AQIReading.objects.bulk_create(readings)
+
+    def stat(self, values, stat, hour, field='aqi'):
+        return values[CLIMATOLOGY_FIELDS.index(field), CLIMATOLOGY_STATS.index(stat), hour]
+
+    def test_percentiles_from_histogram(self):
+        result = ClimatologyBuilder(grid=self.GRID).build()
+        self.assertEqual((result['readings'], result['stations']), (102, 1))
+        values = result['values'].astype(float)
+        self.assertEqual(values.shape, (len(CLIMATOLOGY_FIELDS), len(CLIMATOLOGY_STATS), 168, 4))
+
+        # Monday 08:00 is hour of week 8; one station, so every zone gets its values
+        np.testing.assert_allclose(self.stat(values, 'mean', 8), 50.5)
+        # Centre of the 2.5-wide bin holding the 50th and 90th of 100 values
+        np.testing.assert_allclose(self.stat(values, 'p50', 8), 51.25)
+        np.testing.assert_allclose(self.stat(values, 'p90', 8), 91.25)
+        self.assertTrue(np.isnan(self.stat(values, 'mean', 9)).all())
+        self.assertTrue(np.isnan(self.stat(values, 'p50', 8, field='pm25')).all())
+        self.assertTrue(np.isnan(np.delete(values[0, 0], 8, axis=0)).all())
+
+    def test_published_climatology_lookup(self):
+        with tempfile.TemporaryDirectory() as directory:
+            meta = ClimatologyBuilder(grid=self.GRID).build_and_save(directory)
+            self.assertEqual(meta['readings'], 102)
+            climatology = Climatology.current(directory)
+            # Both halves of the local hour, which straddle a UTC hour in Kolkata
+            at = (self.monday + timedelta(minutes=20)).timestamp()
+            for offset in (0, 1800):
+                np.testing.assert_allclose(climatology.lookup([22.45, 22.65], [88.25, 88.45], at + offset,
+                                                              stat='p90'), 91.25)
+            self.assertTrue(np.isnan(climatology.lookup([22.45], [88.25], at + 2 * 3600)).all())
+            self.assertTrue(np.isnan(climatology.lookup([22.45], [88.25], at, field='humidity')).all())
+
+
+@override_settings(AQI_LOOKUP_BUDGET=12, ROUTE_CACHE_CELL_DEG=0.002)
+class RoutePrewarmerTests(TestCase):
+    """The pre-warm budget goes to the routes requested most"""
+
+    PAIRS = {'a': (22.5726, 88.3639, 22.5958, 88.2636), 'b': (22.6, 88.4, 22.52, 88.33)}
+
+    @classmethod
+    def setUpTestData(cls):
+        requests = [('a', 'balanced')] * 3 + [('a', 'pm25')] * 2 + [('b', 'shortest')] * 3
+        RouteHistory.objects.bulk_create([
+            RouteHistory(source_name='From', source_lat=cls.PAIRS[pair][0], source_lng=cls.PAIRS[pair][1],
+                         destination_name='To', destination_lat=cls.PAIRS[pair][2],
+                         destination_lng=cls.PAIRS[pair][3], priority=priority, total_distance=10.0,
+                         estimated_time=20.0, average_aqi=150.0, route_geometry=[])
+            for pair, priority in requests])
+
+    def setUp(self):
+        backend = LocMemCache('prewarm-tests', {})
+        backend.clear()
+        self.optimizer = mock.Mock(route_cache=RouteCache(backend))
+        self.optimizer.find_optimal_route.return_value = {'distance': 10.0}
+        self.prewarmer = RoutePrewarmer(self.optimizer)
+
+    def order(self):
+        pairs = self.prewarmer.hot_od_pairs()
+        names = {pair['source_lat']: name for name, pair in zip(('a', 'b'), pairs)}
+        return [(names[pair['source_lat']], priority)
+                for pair, priority in self.prewarmer.warm_order(pairs, ['shortest', 'cleanest', 'balanced', 'pm25'])]
+
+    def test_requested_routes_first(self):
+        self.assertEqual(self.order(), [
+            ('a', 'balanced'), ('b', 'shortest'), ('a', 'pm25'),
+            ('a', 'shortest'), ('a', 'cleanest'), ('b', 'cleanest'), ('b', 'balanced'),
+            ('b', 'pm25'),
+        ])
+
+    def test_budget_spent_in_order(self):
+        # Two-call routes cost 14 and shortest 13, so 41 of 42 covers the three requested routes
+        report = self.prewarmer.prewarm(upstream_budget=42, min_interval=0)
+        warmed = [(call.args[0], call.kwargs['priority'], call.kwargs['pollutant_type'])
+                  for call in self.optimizer.find_optimal_route.call_args_list]
+        self.assertEqual(warmed, [(22.5726, 'balanced', None), (22.6, 'shortest', None),
+                                  (22.5726, 'pm25', 'pm25')])
+        self.assertEqual((report['warmed'], report['upstream_calls'], report['coverage']), (3, 41, 1.0))
+
+        # A second run finds them warm and spends the budget on the next routes
+        report = self.prewarmer.prewarm(upstream_budget=14, min_interval=0)
+        self.assertEqual(report['already_warm'], 3)
+        self.assertEqual(self.optimizer.find_optimal_route.call_args.kwargs['priority'], 'shortest')
+        self.assertEqual(self.optimizer.find_optimal_route.call_args.args[0], 22.5726)
+
+
+class OptimizerPartialTests(SimpleTestCase):
+    """Deadline cut-offs and cache keys of optimizer results"""
+
+    ROUTE = {'distance': 5.0, 'duration': 10.0, 'coordinates': [[88.3, 22.5], [88.3, 22.55]],
+             'geometry': {'type': 'LineString', 'coordinates': [[88.3, 22.5], [88.3, 22.55]]}, 'steps': []}
+
+    def setUp(self):
+        patches = [
+            mock.patch('route_optimizer.services.dijkstra_optimizer.SnapshotAQISource.current',
+                       return_value=_SnapshotStub()),
+            mock.patch('route_optimizer.services.dijkstra_optimizer.ClimatologyAQISource',
+                       return_value=_BandedSource(0.0, np.nan, np.nan)),
+            mock.patch('route_optimizer.services.dijkstra_optimizer.AQIModelService.instance'),
+        ]
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.deadline = Deadline(30.0)
+        self.optimizer = DijkstraOptimizer(self.deadline)
+        backend = LocMemCache('optimizer-partial-tests', {})
+        backend.clear()
+        self.optimizer.route_cache = RouteCache(backend)
+        self.optimizer.routing_service = mock.Mock(get_route=mock.Mock(return_value=dict(self.ROUTE)),
+                                                   get_route_via_waypoint=mock.Mock(return_value=None))
+
+    def test_later_routes_are_not_partial(self):
+        sampled = []
+
+        def sample_route_aqi(route):
+            # Routing the first priority (shortest) runs out of time for a lookup
+            sampled.append(route)
+            if len(sampled) == 1:
+                self.deadline.skip('waqi', 'feed')
+            return [], []
+
+        with mock.patch.object(self.optimizer, '_sample_route_aqi', sample_route_aqi):
+            results = self.optimizer.compare_routes(22.5, 88.3, 22.55, 88.3)
+
+        self.assertEqual({priority: route['partial'] for priority, route in results.items()},
+                         {'shortest': True, 'balanced': False, 'cleanest': False})
+        self.assertTrue(self.deadline.cut_short)
+        cached = {priority: self.optimizer.route_cache.get(self.optimizer.route_cache.make_key(
+            22.5, 88.3, 22.55, 88.3, priority)) is not None for priority in results}
+        self.assertEqual(cached, {'shortest': False, 'balanced': True, 'cleanest': True})
+
+    def test_departure_window_shares_find_route_cache_entries(self):
+        forecast = mock.Mock(factors=lambda lats, lngs, times: np.ones(len(lats)))
+        with mock.patch('route_optimizer.services.dijkstra_optimizer.HourlyAQILayers.current',
+                        return_value=forecast), \
+                mock.patch.object(self.optimizer, '_sample_route_aqi', return_value=([], [])):
+            results = self.optimizer.departure_window(22.5, 88.3, 22.55, 88.3,
+                                                      [0.0, 900.0], ['pm25', 'balanced'])
+
+        self.assertEqual(len(results['pm25']['exposure']), 2)
+        # The map sends pm25 as pollutant_type too, so find_route keys it that way
+        cache = self.optimizer.route_cache
+        self.assertIsNotNone(cache.get(cache.make_key(22.5, 88.3, 22.55, 88.3, 'pm25', 'pm25')))
+        self.assertIsNone(cache.get(cache.make_key(22.5, 88.3, 22.55, 88.3, 'pm25')))
+        self.assertIsNotNone(cache.get(cache.make_key(22.5, 88.3, 22.55, 88.3, 'balanced')))
+
+
+class PolylineCodecTests(SimpleTestCase):
+    """Encoded polylines must match Google's reference algorithm"""
+
+    # Example from Google's encoded polyline algorithm format documentation
+    REFERENCE = [[-120.2, 38.5], [-120.95, 40.7], [-126.453, 43.252]]
+    REFERENCE_ENCODED = '_p~iF~ps|U_ulLnnqC_mqNvxq`@'
+
+    def test_encode_reference_example(self):
+        self.assertEqual(encode_polyline(self.REFERENCE), self.REFERENCE_ENCODED)
+
+    def test_decode_reference_example(self):
+        np.testing.assert_allclose(decode_polyline(self.REFERENCE_ENCODED), self.REFERENCE)
+
+    def test_round_trip(self):
+        rng = np.random.default_rng(0)
+        coordinates = np.column_stack([rng.uniform(88.2, 88.5, 200), rng.uniform(22.4, 22.75, 200)])
+        for precision in (5, 6):
+            decoded = decode_polyline(encode_polyline(coordinates, precision), precision)
+            np.testing.assert_allclose(decoded, np.round(coordinates, precision), atol=10 ** -precision / 2)
+
+    def test_empty(self):
+        self.assertEqual(encode_polyline([]), '')
+        self.assertEqual(decode_polyline(''), [])
+
+
+def _douglas_peucker(xy, first, last, tolerance, keep):
+    """Textbook recursive Douglas-Peucker over projected points"""
+    if last - first < 2:
+        return
+    start, end = xy[first], xy[last]
+    segment = end - start
+    length_sq = segment @ segment
+    best, split = -1.0, -1
+    for i in range(first + 1, last):
+        t = 0.0 if length_sq == 0 else min(1.0, max(0.0, (xy[i] - start) @ segment / length_sq))
+        distance = np.linalg.norm(xy[i] - (start + t * segment))
+        if distance > best:
+            best, split = distance, i
+    if best >= tolerance:
+        keep.add(split)
+        _douglas_peucker(xy, first, split, tolerance, keep)
+        _douglas_peucker(xy, split, last, tolerance, keep)
+
+
+class SimplificationTests(SimpleTestCase):
+    """One importance pass must reproduce Douglas-Peucker at every tolerance"""
+
+    def test_matches_recursive_douglas_peucker(self):
+        rng = np.random.default_rng(0)
+        for n in (3, 10, 57, 200):
+            coords = np.column_stack([88.3 + np.cumsum(rng.normal(0, 1e-3, n)),
+                                      22.5 + np.cumsum(rng.normal(0, 1e-3, n))])
+            xy = local_xy_km(coords[:, 1], coords[:, 0], float(coords[:, 1].mean())) * 1000
+            importance = vertex_importance(coords)
+            self.assertTrue(np.isinf(importance[[0, -1]]).all())
+            for tolerance in (0.5, 5.0, 20.0, 80.0, 300.0):
+                keep = {0, n - 1}
+                _douglas_peucker(xy, 0, n - 1, tolerance, keep)
+                with self.subTest(n=n, tolerance=tolerance):
+                    self.assertEqual(simplify_indices(importance, tolerance).tolist(), sorted(keep))
+
+    def test_straight_line_keeps_endpoints(self):
+        line = [[88.3 + i * 1e-3, 22.5 + i * 1e-3] for i in range(6)]
+        self.assertEqual(simplify(line, 1.0), [line[0], line[-1]])
+        self.assertEqual(vertex_importance([]).tolist(), [])
+        self.assertEqual(vertex_importance(line[:2]).tolist(), [np.inf, np.inf])
+
+
+class GraphSearchTests(SimpleTestCase):
+    """Point-to-point search variants must agree with plain Dijkstra"""
+
+    def random_graph(self, rng, num_nodes=40, num_edges=160):
+        sources = rng.integers(0, num_nodes, num_edges)
+        targets = rng.integers(0, num_nodes, num_edges)
+        # A two-node cycle through node 0 and a self-loop, so s == t has a non-empty alternative
+        sources = np.concatenate([sources, [0, 1, 2]])
+        targets = np.concatenate([targets, [1, 0, 2]])
+        graph = CSRGraph(num_nodes, sources, targets)
+        return graph, graph.edge_values(rng.uniform(0.1, 5.0, len(sources)))
+
+    def test_variants_match_dijkstra(self):
+        rng = np.random.default_rng(0)
+        for _ in range(5):
+            graph, weights = self.random_graph(rng)
+            backward = reverse_graph(graph)
+            backward_weights = backward.edge_values(weights)
+            hierarchy = ContractionHierarchy(graph, weights)
+            pairs = [(s, s) for s in range(3)] + [tuple(map(int, pair)) for pair in rng.integers(0, graph.num_nodes, (30, 2))]
+            for source, target in pairs:
+                expected = dijkstra(graph, source, weights)[0][target]
+                # Half the true remaining cost is an admissible, consistent potential
+                potential = 0.5 * dijkstra(backward, target, backward_weights)[0]
+                results = {
+                    'bidirectional': bidirectional_dijkstra(graph, backward, source, target, weights,
+                                                            backward_weights),
+                    'astar': astar(graph, source, target, weights, np.nan_to_num(potential, posinf=0.0)),
+                    'ch': hierarchy.query(source, target),
+                }
+                for name, (cost, path, _) in results.items():
+                    with self.subTest(name=name, source=source, target=target):
+                        if np.isinf(expected):
+                            self.assertTrue(np.isinf(cost))
+                            self.assertEqual(path, [])
+                            continue
+                        self.assertAlmostEqual(cost, expected, places=9)
+                        self.assertEqual((path[0], path[-1]), (source, target))
+                        if source == target:
+                            self.assertEqual(path, [source])
+
+    def test_paths_follow_graph_edges(self):
+        rng = np.random.default_rng(1)
+        graph, weights = self.random_graph(rng)
+        backward = reverse_graph(graph)
+        hierarchy = ContractionHierarchy(graph, weights)
+        edge_cost = {}
+        for u in range(graph.num_nodes):
+            for edge in range(graph.indptr[u], graph.indptr[u + 1]):
+                v = int(graph.indices[edge])
+                edge_cost[(u, v)] = min(edge_cost.get((u, v), np.inf), weights[edge])
+        for source, target in rng.integers(0, graph.num_nodes, (20, 2)):
+            for cost, path, _ in (bidirectional_dijkstra(graph, backward, source, target, weights,
+                                                         backward.edge_values(weights)),
+                                  hierarchy.query(source, target)):
+                if path:
+                    self.assertAlmostEqual(sum(edge_cost[edge] for edge in zip(path[:-1], path[1:])), cost)
+
+
+class StopOrderingTests(SimpleTestCase):
+    """Stop orders must be valid paths and optimal on small known cases"""
+
+    def line_cost(self, positions):
+        positions = np.asarray(positions, dtype=float)
+        return np.abs(positions[:, None] - positions[None, :])
+
+    def test_stops_on_a_line_are_visited_in_order(self):
+        # Node 0 at the start of the line, node 1 at its end, the rest shuffled between
+        positions = [0.0, 10.0, 7.0, 2.0, 9.0, 4.0, 1.0, 5.5]
+        order = order_stops(self.line_cost(positions), start=0, end=1)
+        self.assertEqual(order, sorted(range(len(positions)), key=positions.__getitem__))
+
+    def test_matches_brute_force_optimum(self):
+        rng = np.random.default_rng(1)
+        points = rng.uniform(0, 10, (8, 2))
+        cost = np.linalg.norm(points[:, None] - points[None, :], axis=2)
+        # Asymmetric, like road distances with one-way streets
+        cost *= rng.uniform(1.0, 1.3, cost.shape)
+
+        best = min(path_cost(cost, [0, *middle, 7]) for middle in itertools.permutations(range(1, 7)))
+        order = order_stops(cost, start=0, end=7)
+        self.assertAlmostEqual(path_cost(cost, order), best)
+
+    def test_fixed_endpoints(self):
+        cost = blended_cost(*np.random.default_rng(2).uniform(1, 5, (2, 9, 9)), exposure_weight=0.5)
+        order = order_stops(cost, start=3, end=1)
+        self.assertEqual((order[0], order[-1]), (3, 1))
+        self.assertEqual(sorted(order), list(range(9)))
+
+    def test_open_path_visits_every_node(self):
+        order = order_stops(self.line_cost([5.0, 0.0, 10.0, 3.0]), start=0)
+        self.assertEqual(order[0], 0)
+        self.assertEqual(sorted(order), [0, 1, 2, 3])
+        self.assertEqual(len(order), 4)
+
+    def test_blended_cost(self):
+        distance = np.array([[0.0, 2.0, 4.0], [2.0, 0.0, np.inf], [4.0, 8.0, 0.0]])
+        exposure = np.array([[0.0, 10.0, 10.0], [20.0, 0.0, 30.0], [10.0, 10.0, 0.0]])
+
+        # Each matrix is scaled by the mean of its finite off-diagonal entries
+        np.testing.assert_allclose(blended_cost(distance, exposure, 0.0)[0], [0.0, 0.5, 1.0])
+        np.testing.assert_allclose(blended_cost(distance, exposure, 1.0)[2], [10 / 15, 10 / 15, 0.0])
+
+        cost = blended_cost(distance, exposure, 0.5)
+        self.assertTrue(np.all(np.diag(cost) == 0.0))
+        self.assertGreaterEqual(cost[1, 2], 1e9)
+
+
+class _FakeResponse:
+    status_code = 200
+    request = None
+
+    def __init__(self, payload):
+        self.payload = payload
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.payload
+
+
+def _waqi_feed(lat, lng):
+    return {'status': 'ok', 'data': {'aqi': 100, 'city': {'geo': [lat, lng], 'name': 'Test station'}}}
+
+
+@override_settings(UPSTREAM_RATE_LIMIT_ENABLED=False, HEDGE_ENABLED=False)
+class DeadlineTests(SimpleTestCase):
+    """Request deadlines, hedged calls and the WAQI fan-out"""
+
+    def setUp(self):
+        # Released at the end of each test so hanging upstream calls return
+        self.release = threading.Event()
+        self.addCleanup(self.release.set)
+
+    def test_timeout_is_capped_by_time_left(self):
+        deadline = Deadline(2.0)
+        timeout = deadline.timeout(10.0, reserve=1.0)
+        self.assertTrue(0.9 < timeout <= 1.0)
+        self.assertEqual(Deadline().timeout(10.0), 10.0)
+
+    def test_expired_deadline_raises(self):
+        deadline = Deadline(0.05)
+        time.sleep(0.1)
+        self.assertTrue(deadline.expired)
+        with self.assertRaises(DeadlineExceeded):
+            deadline.timeout(10.0)
+
+    def test_expired_deadline_skips_call_and_marks_cut_short(self):
+        deadline = Deadline(0.05)
+        time.sleep(0.1)
+        service = AirQualityService(deadline)
+        with mock.patch('requests.Session.get') as get:
+            self.assertIsNone(service.get_aqi_by_coordinates(22.5, 88.3))
+        get.assert_not_called()
+        self.assertTrue(deadline.cut_short)
+
+    @override_settings(HEDGE_ENABLED=True, HEDGE_MIN_SAMPLES=1, HEDGE_MIN_DELAY=0.01)
+    def test_hedged_first_answer_wins(self):
+        LATENCIES.observe(('test', 'hedge_wins'), 0.05)
+        calls = itertools.count()
+
+        def call():
+            if next(calls) == 0:
+                self.release.wait(5)
+                return 'slow'
+            return 'fast'
+
+        started = time.perf_counter()
+        self.assertEqual(hedged(call, 'test', 'hedge_wins', Deadline(5.0)), 'fast')
+        self.assertLess(time.perf_counter() - started, 1.0)
+
+    @override_settings(HEDGE_ENABLED=True, HEDGE_MIN_SAMPLES=1, HEDGE_MIN_DELAY=0.01)
+    def test_hedged_call_past_deadline_is_abandoned(self):
+        LATENCIES.observe(('test', 'hedge_deadline'), 0.05)
+        deadline = Deadline(0.3)
+
+        def call():
+            self.release.wait(5)
+            return 'late'
+
+        with self.assertRaises(DeadlineExceeded):
+            hedged(call, 'test', 'hedge_deadline', deadline)
+        self.assertTrue(deadline.cut_short)
+
+    def test_fanout_leaves_none_for_abandoned_lookups(self):
+        def get(session, url, params=None, timeout=None):
+            lat, lng = map(float, url.rstrip('/').split('geo:')[1].split(';'))
+            if lat > 23:
+                self.release.wait(5)  # never answers within the deadline
+            return _FakeResponse(_waqi_feed(lat, lng))
+
+        deadline = Deadline(0.5)
+        points = [(22.5, 88.3), (23.5, 88.3), (22.6, 88.4)]
+        with mock.patch('requests.Session.get', get):
+            readings = AirQualityService(deadline).get_aqi_for_points(points)
+
+        self.assertEqual([reading is not None for reading in readings], [True, False, True])
+        self.assertEqual(readings[2]['location'], {'lat': 22.6, 'lng': 88.4, 'name': 'Test station'})
+        self.assertTrue(deadline.cut_short)
+
+
+class UpstreamQuotaTests(SimpleTestCase):
+    """Quota waits and shared calls must stay within each caller's deadline"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        limits = override_settings(
+            UPSTREAM_RATE_LIMIT_ENABLED=True, HEDGE_ENABLED=False,
+            UPSTREAM_RATE_LIMIT_DB=os.path.join(directory.name, 'quota.sqlite3'),
+            # One call at once, the next 0.5 s later
+            UPSTREAM_RATE_LIMITS={'waqi': (2.0, 1), 'ors.directions': (2.0, 1)},
+        )
+        limits.enable()
+        self.addCleanup(limits.disable)
+
+    def test_waqi_timeout_is_taken_after_the_quota_wait(self):
+        timeouts = []
+
+        def get(session, url, params=None, timeout=None):
+            timeouts.append(timeout)
+            return _FakeResponse(_waqi_feed(22.5, 88.3))
+
+        deadline = Deadline(1.0)
+        service = AirQualityService(deadline)
+        with mock.patch('requests.Session.get', get):
+            service.get_aqi_by_coordinates(22.5, 88.3)
+            service.get_aqi_by_coordinates(22.6, 88.4)  # waits ~0.5 s for a token
+
+        self.assertEqual(len(timeouts), 2)
+        self.assertLess(timeouts[1], 0.6)
+
+    def test_ors_timeout_is_taken_after_the_quota_wait(self):
+        timeouts = []
+
+        def post(session, url, json=None, timeout=None, **kwargs):
+            timeouts.append(timeout)
+            return _FakeResponse({'type': 'FeatureCollection', 'features': []})
+
+        client = RoutingService(Deadline(1.0)).client
+        with mock.patch('requests.Session.post', post):
+            for end in ([88.4, 22.6], [88.5, 22.7]):
+                client.request('/v2/directions/driving-car/geojson', {},
+                               post_json={'coordinates': [[88.3, 22.5], end]})
+
+        self.assertEqual(len(timeouts), 2)
+        self.assertLess(timeouts[1], 0.6)
+
+    def _lead(self, function, deadline):
+        """Start a shared call in another thread; returns once it is in flight"""
+        started = threading.Event()
+
+        def leader():
+            started.set()
+            return function()
+
+        thread = threading.Thread(target=self._run, args=(leader, deadline), daemon=True)
+        thread.start()
+        started.wait(5)
+        self.addCleanup(thread.join, 5)
+
+    def _run(self, function, deadline):
+        try:
+            coalesced('shared', function, 'test', 'flight', deadline)
+        except DeadlineExceeded:
+            pass
+
+    def test_follower_with_more_time_retries_under_its_own_deadline(self):
+        def leader_call():
+            time.sleep(0.3)
+            raise DeadlineExceeded('leader ran out of time')
+
+        self._lead(leader_call, Deadline(0.6))
+        deadline = Deadline(30.0)
+        self.assertEqual(coalesced('shared', lambda: 'fresh', 'test', 'flight', deadline), 'fresh')
+        self.assertFalse(deadline.cut_short)
+
+    def test_follower_with_less_time_is_cut_short(self):
+        follower_call = mock.Mock(return_value='fresh')
+
+        def leader_call():
+            time.sleep(0.3)
+            raise DeadlineExceeded('leader ran out of time')
+
+        self._lead(leader_call, Deadline(30.0))
+        deadline = Deadline(10.0)
+        with self.assertRaises(DeadlineExceeded):
+            coalesced('shared', follower_call, 'test', 'flight', deadline)
+        self.assertTrue(deadline.cut_short)
+        follower_call.assert_not_called()
+
+    def test_follower_shares_a_successful_answer(self):
+        follower_call = mock.Mock(return_value='own')
+
+        def leader_call():
+            time.sleep(0.3)
+            return 'shared'
+
+        self._lead(leader_call, Deadline(0.6))
+        self.assertEqual(coalesced('shared', follower_call, 'test', 'flight', Deadline(30.0)), 'shared')
+        follower_call.assert_not_called()
+
+
+class AdmissionQueueTests(SimpleTestCase):
+    """Queue waits from the front proxy's request-start header"""
+
+    def test_queue_wait_units(self):
+        now = 1_700_000_010.0
+        for header in ('t=1700000009.5', '1700000009.5', 't=1700000009500', 't=1700000009500000'):
+            self.assertAlmostEqual(queue_wait(header, now), 0.5, places=3)
+        self.assertEqual(queue_wait('t=1700000011', now), 0.0)
+        self.assertIsNone(queue_wait('soon', now))
+
+    def test_queue_wait_rejects_implausible_stamps(self):
+        now = 1_700_000_010.0
+        for header in ('t=1', 't=-5', 't=1699999000', 't=1700000100'):
+            self.assertIsNone(queue_wait(header, now), header)
+
+    @override_settings(ADMISSION_MIN_SAMPLES=3, ADMISSION_WINDOW=60.0)
+    def test_spoofed_header_ignored_unless_configured(self):
+        waits = LatencyTracker()
+        stale = f't={time.time() - 30:.3f}'
+        request = RequestFactory().get('/', HTTP_X_REQUEST_START=stale)
+        with mock.patch('route_optimizer.services.admission.QUEUE_WAITS', waits):
+            controller = AdmissionController()
+            with override_settings(ADMISSION_QUEUE_HEADER=''):
+                for _ in range(10):
+                    controller.observe_queue(request, 'interactive')
+                self.assertEqual(controller.queue_pressure(), 0.0)
+            with override_settings(ADMISSION_QUEUE_HEADER='X-Request-Start', ADMISSION_QUEUE_TARGET=0.5):
+                for _ in range(3):
+                    controller.observe_queue(request, 'interactive')
+                self.assertGreater(controller.queue_pressure(), 1.0)
+
+    @override_settings(ADMISSION_QUEUE_TARGET=0.5, ADMISSION_MIN_SAMPLES=3, ADMISSION_WINDOW=60.0,
+                       UPSTREAM_RATE_LIMIT_ENABLED=False)
+    def test_queue_wait_raises_pressure(self):
+        waits = LatencyTracker()
+        with mock.patch('route_optimizer.services.admission.QUEUE_WAITS', waits):
+            controller = AdmissionController()
+            self.assertEqual(controller.queue_pressure(), 0.0)
+            for _ in range(3):
+                waits.observe(('app', 'queue'), 1.0)
+            self.assertAlmostEqual(controller.queue_pressure(), 2.0)
+            pressures = controller.pressures()
+        self.assertGreaterEqual(pressures['live'], 2.0)
+        self.assertLess(pressures['shortest_only'], pressures['live'])
+
+
+@override_settings(ARTIFACT_KEEP_VERSIONS=3, ARTIFACT_RELOAD_INTERVAL=60.0)
+class ArtifactStoreTests(SimpleTestCase):
+    """Versioned artifacts: atomic publish, hot reload, pruning and the legacy layout"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.store = ArtifactStore(self.directory)
+
+    def publish(self, value):
+        return self.store.publish({'table': np.full((2, 3), value)}, {'value': value})
+
+    def test_publish_swaps_current(self):
+        self.assertIsNone(self.store.current_version())
+        self.assertIsNone(self.store.open())
+
+        first = self.publish(1.0)
+        second = self.publish(2.0)
+        self.assertEqual(self.store.current_version(), second)
+        self.assertEqual(os.readlink(os.path.join(self.directory, 'current')),
+                         os.path.join('versions', second))
+
+        artifact = self.store.open()
+        self.assertEqual(artifact.version, second)
+        self.assertEqual(artifact.meta, {'value': 2.0, 'version': second})
+        self.assertIsInstance(artifact['table'], np.memmap)
+        self.assertFalse(artifact['table'].flags.writeable)
+        np.testing.assert_array_equal(self.store.open(first)['table'], np.full((2, 3), 1.0))
+        # Nothing left over from staging
+        self.assertEqual(sorted(os.listdir(self.directory)), ['current', 'versions'])
+        self.assertEqual(sorted(os.listdir(os.path.join(self.directory, 'versions'))), [first, second])
+
+    def test_prune_keeps_newest_versions(self):
+        versions = [self.publish(float(i)) for i in range(5)]
+        self.assertEqual(self.store.versions(), versions[-3:])
+        self.assertEqual(self.store.current_version(), versions[-1])
+
+    def test_pruned_version_stays_readable_while_mapped(self):
+        artifact = self.store.open(self.publish(1.0))
+        for i in range(3):
+            self.publish(float(i + 2))
+        self.assertNotIn(artifact.version, self.store.versions())
+        np.testing.assert_array_equal(artifact['table'], np.full((2, 3), 1.0))
+
+    def test_live_artifact_reloads_after_publish(self):
+        live = LiveArtifact(lambda artifact: float(artifact['table'][0, 0]))
+        self.assertIsNone(live.get(self.directory))
+
+        self.publish(1.0)
+        self.assertEqual(live.get(self.directory), 1.0)
+        # Publishing in this process is seen at once, despite the reload interval
+        self.publish(2.0)
+        self.assertEqual(live.get(self.directory), 2.0)
+
+    def test_live_artifact_sees_other_publishers_after_interval(self):
+        live = LiveArtifact(lambda artifact: artifact.version)
+        first = self.publish(1.0)
+        self.assertEqual(live.get(self.directory), first)
+
+        # As if another process published: this process's publish count is unchanged
+        with mock.patch.dict(artifact_store._publishes):
+            second = self.publish(2.0)
+        self.assertEqual(live.get(self.directory), first)
+        with override_settings(ARTIFACT_RELOAD_INTERVAL=0.0):
+            self.assertEqual(live.get(self.directory), second)
+
+    def test_legacy_layout(self):
+        np.save(os.path.join(self.directory, 'table.npy'), np.arange(4.0))
+        with open(os.path.join(self.directory, 'meta.json'), 'w') as f:
+            f.write('{"value": 0}')
+
+        self.assertEqual(self.store.current_version(), 'legacy')
+        artifact = self.store.open()
+        self.assertEqual(artifact.meta, {'value': 0})
+        np.testing.assert_array_equal(artifact['table'], np.arange(4.0))
+
+        # A publish takes over from the legacy files
+        version = self.publish(1.0)
+        self.assertEqual(self.store.current_version(), version)
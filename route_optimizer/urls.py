@@ -9,4 +9,9 @@ urlpatterns = [
     path('api/compare-routes/', views.compare_routes, name='compare_routes'),
     path('api/history/', views.get_history, name='get_history'),
     path('api/get-aqi/', views.get_aqi, name='get_aqi'),
+    path('api/route-cache/stats/', views.route_cache_stats, name='route_cache_stats'),
+    path('api/zone-matrix/', views.zone_matrix, name='zone_matrix'),
+    path('api/exposure-matrix/', views.exposure_matrix, name='exposure_matrix'),
+    path('api/departure-window/', views.departure_window, name='departure_window'),
+    path('metrics', views.metrics, name='metrics'),
 ]
@@ -1,19 +1,30 @@
 from django.shortcuts import render
-from django.http import JsonResponse
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 import json
+import time
 import traceback
 import logging
-from .services.dijkstra_optimizer import DijkstraOptimizer
-from .services.routing_service import RoutingService
-from .services.air_quality_service import AirQualityService
+from datetime import datetime
+from zoneinfo import ZoneInfo
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+# Services that pull in numpy, requests or openrouteservice are imported in
+# the views that use them, so loading the URLconf (which every management
+# command's system checks do) stays cheap. Serving processes import them
+# during the startup warm-up (see apps.py).
+from .services.route_cache import RouteCache
+from .services.deadline import Deadline
+from .services.admission import admission_controlled
 from .models import RouteHistory, Location
+from .http import FastJsonResponse
+from .metrics import REGISTRY, span
 
 # Set up logging
 logger = logging.getLogger(__name__)
 
-
 def index(request):
     """Main page"""
     return render(request, 'route_optimizer/index.html')
@@ -21,6 +32,7 @@ def index(request):
 
 @csrf_exempt
 @require_http_methods(["POST"])
+@admission_controlled('interactive')
 def find_route(request):
     """
     API endpoint to find optimal route
@@ -38,41 +50,56 @@ def find_route(request):
         dest_lng = data.get('dest_lng')
         priority = data.get('priority', 'balanced')
         pollutant_type = data.get('pollutant_type')
-        
-        print(f"\n{'='*60}")
-        print(f"🔍 ROUTE REQUEST")
-        print(f"{'='*60}")
-        print(f"Source Address: {source_address}")
-        print(f"Destination Address: {dest_address}")
-        print(f"Priority: {priority}")
-        print(f"Pollutant Type: {pollutant_type}")
-        
-        # Initialize services
-        routing_service = RoutingService()
-        optimizer = DijkstraOptimizer()
+        # Only a JSON true; bool() would turn the string "false" into True
+        compact = data.get('compact') is True
+        precision = int(data.get('precision', settings.ROUTE_POLYLINE_PRECISION))
+        if not 1 <= precision <= 6:
+            # map.js decodes with 32-bit integer ops, which overflow beyond 6
+            raise ValueError('precision must be between 1 and 6')
+        zoom = data.get('zoom')
+        tolerance = data.get('tolerance')
+        zoom_levels = data.get('zoom_levels') is True
+        # Multi-stop: unordered [{'lat', 'lng'}, ...] visited between source and destination
+        stops = [(float(stop['lat']), float(stop['lng'])) for stop in data.get('stops') or []]
+        if len(stops) > settings.MULTI_STOP_MAX_STOPS:
+            raise ValueError(f'At most {settings.MULTI_STOP_MAX_STOPS} stops are supported')
+        objective = data.get('objective', 'balanced')
+        exposure_weight = data.get('exposure_weight')
+        departure_time = _parse_departure_time(data.get('departure_time'))
+        
+        logger.info("Route request: %s -> %s (priority %s, pollutant %s)",
+                    source_address, dest_address, priority, pollutant_type)
+        
+        from .services.dijkstra_optimizer import DijkstraOptimizer
+        from .services.routing_service import RoutingService
+        from .services.polyline_codec import encode_polyline
+        from .services.simplification import simplify_indices, vertex_importance, vertex_min_zoom, zoom_tolerance_m
+        
+        # Initialize services, sharing one time budget for upstream calls
+        deadline = Deadline.for_request()
+        routing_service = RoutingService(deadline)
+        optimizer = DijkstraOptimizer(deadline, request.service_mode)
         
         # Geocode addresses if coordinates not provided
         if not (source_lat and source_lng) and source_address:
-            print(f"\n📍 Geocoding source: {source_address}")
-            source_coords = routing_service.geocode_address(f"{source_address}, Kolkata")
+            with span('geocode'):
+                source_coords = routing_service.geocode_address(f"{source_address}, Kolkata")
             if source_coords:
                 source_lng, source_lat = source_coords  # Returns (lng, lat)
-                print(f"   ✓ Source coords: ({source_lat}, {source_lng})")
             else:
-                print(f"   ✗ Failed to geocode source")
+                logger.info("Failed to geocode source: %s", source_address)
                 return JsonResponse({
                     'success': False,
                     'error': f'Could not geocode source address: {source_address}'
                 }, status=400)
         
         if not (dest_lat and dest_lng) and dest_address:
-            print(f"\n📍 Geocoding destination: {dest_address}")
-            dest_coords = routing_service.geocode_address(f"{dest_address}, Kolkata")
+            with span('geocode'):
+                dest_coords = routing_service.geocode_address(f"{dest_address}, Kolkata")
             if dest_coords:
                 dest_lng, dest_lat = dest_coords  # Returns (lng, lat)
-                print(f"   ✓ Destination coords: ({dest_lat}, {dest_lng})")
             else:
-                print(f"   ✗ Failed to geocode destination")
+                logger.info("Failed to geocode destination: %s", dest_address)
                 return JsonResponse({
                     'success': False,
                     'error': f'Could not geocode destination address: {dest_address}'
@@ -80,9 +107,8 @@ def find_route(request):
         
         # Validate coordinates
         if not all([source_lat, source_lng, dest_lat, dest_lng]):
-            print(f"\n✗ Invalid coordinates:")
-            print(f"   Source: ({source_lat}, {source_lng})")
-            print(f"   Destination: ({dest_lat}, {dest_lng})")
+            logger.info("Invalid coordinates: (%s, %s) -> (%s, %s)",
+                        source_lat, source_lng, dest_lat, dest_lng)
             return JsonResponse({
                 'success': False,
                 'error': 'Invalid coordinates or addresses. Please provide valid locations.'
@@ -94,91 +120,147 @@ def find_route(request):
         dest_lat = float(dest_lat)
         dest_lng = float(dest_lng)
         
-        print(f"\n🚗 Finding optimal route...")
-        print(f"   From: ({source_lat}, {source_lng})")
-        print(f"   To: ({dest_lat}, {dest_lng})")
-        print(f"   Priority: {priority}")
-        
         # Find optimal route
-        route_result = optimizer.find_optimal_route(
-            source_lat, source_lng,
-            dest_lat, dest_lng,
-            priority=priority,
-            pollutant_type=pollutant_type
-        )
+        if stops:
+            route_result = optimizer.find_multi_stop_route(
+                source_lat, source_lng,
+                stops,
+                dest_lat, dest_lng,
+                objective=objective,
+                exposure_weight=float(exposure_weight) if exposure_weight is not None else None,
+                priority=priority
+            )
+        else:
+            route_result = optimizer.find_optimal_route(
+                source_lat, source_lng,
+                dest_lat, dest_lng,
+                priority=priority,
+                pollutant_type=pollutant_type,
+                departure_time=departure_time
+            )
+        
+        if not route_result and deadline.expired:
+            logger.info("Route request ran out of time (%s, %s) -> (%s, %s)",
+                        source_lat, source_lng, dest_lat, dest_lng)
+            return JsonResponse({
+                'success': False,
+                'error': 'Routing took too long. Please try again.'
+            }, status=504)
         
         if not route_result:
-            print(f"\n✗ Could not find route")
+            logger.info("Could not find route (%s, %s) -> (%s, %s)",
+                        source_lat, source_lng, dest_lat, dest_lng)
             return JsonResponse({
                 'success': False,
                 'error': 'Could not find route. Please try different locations.'
             }, status=400)
         
-        print(f"\n✓ Route found!")
-        print(f"   Distance: {route_result['distance']} km")
-        print(f"   Duration: {route_result['duration']} min")
-        print(f"   Average AQI: {route_result['average_aqi']}")
+        logger.info("Route found: %.2f km, %.1f min, average AQI %.1f",
+                    route_result['distance'], route_result['duration'], route_result['average_aqi'])
         
         # Reverse geocode for names (with fallback)
         try:
-            source_name = routing_service.reverse_geocode(source_lng, source_lat) or source_address or "Source"
-            dest_name = routing_service.reverse_geocode(dest_lng, dest_lat) or dest_address or "Destination"
-            print(f"\n📝 Location names:")
-            print(f"   Source: {source_name}")
-            print(f"   Destination: {dest_name}")
+            with span('reverse_geocode'):
+                source_name = routing_service.reverse_geocode(source_lng, source_lat) or source_address or "Source"
+                dest_name = routing_service.reverse_geocode(dest_lng, dest_lat) or dest_address or "Destination"
         except Exception as e:
-            print(f"\n⚠️ Warning: Could not reverse geocode: {e}")
+            logger.warning("Could not reverse geocode: %s", e)
             source_name = source_address or "Source"
             dest_name = dest_address or "Destination"
         
         # Save to history
         try:
-            RouteHistory.objects.create(
-                source_name=source_name,
-                source_lat=source_lat,
-                source_lng=source_lng,
-                destination_name=dest_name,
-                destination_lat=dest_lat,
-                destination_lng=dest_lng,
-                priority=priority,
-                total_distance=route_result['distance'],
-                estimated_time=route_result['duration'],
-                average_aqi=route_result['average_aqi'],
-                route_geometry=route_result['geometry']
-            )
-            print(f"✓ Saved to history")
+            with span('history_write'):
+                RouteHistory.objects.create(
+                    source_name=source_name,
+                    source_lat=source_lat,
+                    source_lng=source_lng,
+                    destination_name=dest_name,
+                    destination_lat=dest_lat,
+                    destination_lng=dest_lng,
+                    priority=priority,
+                    total_distance=route_result['distance'],
+                    estimated_time=route_result['duration'],
+                    average_aqi=route_result['average_aqi'],
+                    route_geometry=route_result['geometry']
+                )
         except Exception as e:
-            print(f"⚠️ Warning: Could not save to history: {e}")
+            logger.warning("Could not save to history: %s", e)
             # Don't fail the request if history save fails
         
-        print(f"{'='*60}\n")
+        # Return only the vertices needed at the requested zoom/tolerance
+        coordinates = route_result['coordinates']
+        mid_lat = (source_lat + dest_lat) / 2
+        if tolerance is None and zoom is not None:
+            tolerance = zoom_tolerance_m(float(zoom), mid_lat)
+        if tolerance is not None or zoom_levels:
+            with span('simplification'):
+                importance = vertex_importance(coordinates)
+        if tolerance is not None:
+            kept = simplify_indices(importance, float(tolerance))
+            coordinates = [coordinates[i] for i in kept]
+            importance = importance[kept]
         
         # Return response
+        route = {
+            'source': {
+                'lat': source_lat, 
+                'lng': source_lng, 
+                'name': source_name
+            },
+            'destination': {
+                'lat': dest_lat, 
+                'lng': dest_lng, 
+                'name': dest_name
+            },
+            'distance': round(route_result['distance'], 2),
+            'duration': round(route_result['duration'], 2),
+            'average_aqi': round(route_result['average_aqi'], 2),
+            'exposure': round(route_result['exposure'], 2),
+            'peak_aqi': round(route_result['peak_aqi'], 2),
+            'geometry': {'type': 'LineString', 'coordinates': coordinates},
+            'coordinates': coordinates,
+            'aqi_data': route_result['aqi_data'],
+            'priority': priority,
+            'partial': route_result.get('partial', False),
+            # How this route was computed; a cached live route can answer a degraded request
+            'service_mode': route_result.get('service_mode', request.service_mode)
+        }
+        
+        if departure_time is not None:
+            route['departure_time'] = _format_time(route_result['departure_time'])
+            route['arrival_time'] = _format_time(route_result['arrival_time'])
+        
+        if stops:
+            route['stops'] = route_result['stops']
+            route['stop_order'] = route_result['stop_order']
+            route['legs'] = [
+                {'distance': round(leg['distance'], 2), 'duration': round(leg['duration'], 2)}
+                for leg in route_result['legs']
+            ]
+        
+        if zoom_levels:
+            # Lowest zoom at which each returned vertex is needed
+            route['vertex_min_zoom'] = vertex_min_zoom(importance, mid_lat).tolist()
+        
+        if compact:
+            # Geometry once, as an encoded polyline, through the fast serializer
+            route.pop('coordinates')
+            route['geometry'] = {
+                'type': 'LineString',
+                'encoding': 'polyline',
+                'precision': precision,
+                'polyline': encode_polyline(coordinates, precision)
+            }
+            return FastJsonResponse({'success': True, 'route': route, 'service_mode': request.service_mode})
+        
         return JsonResponse({
             'success': True,
-            'route': {
-                'source': {
-                    'lat': source_lat, 
-                    'lng': source_lng, 
-                    'name': source_name
-                },
-                'destination': {
-                    'lat': dest_lat, 
-                    'lng': dest_lng, 
-                    'name': dest_name
-                },
-                'distance': round(route_result['distance'], 2),
-                'duration': round(route_result['duration'], 2),
-                'average_aqi': round(route_result['average_aqi'], 2),
-                'geometry': route_result['geometry'],
-                'coordinates': route_result['coordinates'],
-                'aqi_data': route_result['aqi_data'],
-                'priority': priority
-            }
+            'route': route,
+            'service_mode': request.service_mode
         })
         
     except json.JSONDecodeError as e:
-        print(f"\n✗ JSON Parse Error: {e}")
         logger.error(f"JSON decode error: {e}")
         return JsonResponse({
             'success': False,
@@ -186,7 +268,6 @@ def find_route(request):
         }, status=400)
         
     except ValueError as e:
-        print(f"\n✗ Value Error: {e}")
         logger.error(f"Value error: {e}")
         logger.error(traceback.format_exc())
         return JsonResponse({
@@ -195,14 +276,6 @@ def find_route(request):
         }, status=400)
         
     except Exception as e:
-        print(f"\n{'='*60}")
-        print(f"💥 UNEXPECTED ERROR")
-        print(f"{'='*60}")
-        print(f"Error: {str(e)}")
-        print(f"\nFull Traceback:")
-        print(traceback.format_exc())
-        print(f"{'='*60}\n")
-        
         logger.error(f"Unexpected error in find_route: {str(e)}")
         logger.error(traceback.format_exc())
         
@@ -216,10 +289,18 @@ def find_route(request):
 
 @csrf_exempt
 @require_http_methods(["POST"])
+@admission_controlled('interactive')
 def compare_routes(request):
     """
-    API endpoint to compare routes with different priorities
+    API endpoint to compare routes with different priorities.
+    mode=coarse answers at once with the zone-matrix estimate only (no
+    upstream calls). The default exact mode computes every route before
+    responding and includes the coarse estimate alongside; a client that
+    wants an early answer sends a coarse request first, then an exact one.
     """
+    from .services.dijkstra_optimizer import DijkstraOptimizer
+    from .services.zone_matrix import ZoneMatrix
+    
     try:
         data = json.loads(request.body)
         
@@ -227,30 +308,36 @@ def compare_routes(request):
         source_lng = float(data.get('source_lng'))
         dest_lat = float(data.get('dest_lat'))
         dest_lng = float(data.get('dest_lng'))
+        mode = data.get('mode', 'exact')
         
-        print(f"\n{'='*60}")
-        print(f"🔄 COMPARING ROUTES")
-        print(f"{'='*60}")
-        print(f"From: ({source_lat}, {source_lng})")
-        print(f"To: ({dest_lat}, {dest_lng})")
+        # Coarse estimate from the precomputed zone matrix (a memory-mapped lookup)
+        zone_matrix = ZoneMatrix.current()
+        coarse = zone_matrix.lookup(source_lat, source_lng, dest_lat, dest_lng) if zone_matrix else None
+        if mode == 'coarse':
+            if coarse is None:
+                return JsonResponse({
+                    'success': False,
+                    'error': 'Zone matrix has not been built yet'
+                }, status=503)
+            return JsonResponse({'success': True, 'mode': 'coarse', 'coarse': coarse,
+                                 'service_mode': request.service_mode})
+        
+        logger.info("Comparing routes (%s, %s) -> (%s, %s)", source_lat, source_lng, dest_lat, dest_lng)
         
-        optimizer = DijkstraOptimizer()
+        optimizer = DijkstraOptimizer(Deadline.for_request(), request.service_mode)
         comparison = optimizer.compare_routes(
             source_lat, source_lng, dest_lat, dest_lng
         )
         
-        print(f"✓ Comparison complete")
-        print(f"{'='*60}\n")
-        
         return JsonResponse({
             'success': True,
-            'comparison': comparison
+            'mode': 'exact',
+            'comparison': comparison,
+            'coarse': coarse,
+            'service_mode': request.service_mode
         })
         
     except Exception as e:
-        print(f"\n💥 Error comparing routes: {e}")
-        print(traceback.format_exc())
-        
         logger.error(f"Error comparing routes: {str(e)}")
         logger.error(traceback.format_exc())
         
@@ -261,6 +348,198 @@ def compare_routes(request):
         }, status=500)
 
 
+@csrf_exempt
+@require_http_methods(["POST"])
+@admission_controlled('batch')
+def exposure_matrix(request):
+    """
+    Distance, duration and exposure matrices between many sources and
+    destinations (e.g. depots x stops), for fleet dispatch. Outside live
+    mode the matrices come from the zone tables, without ORS calls.
+    """
+    from .services.exposure_matrix import ExposureMatrixService
+    
+    try:
+        data = json.loads(request.body)
+        sources = [(float(point['lat']), float(point['lng'])) for point in data.get('sources') or []]
+        destinations = [(float(point['lat']), float(point['lng'])) for point in data.get('destinations') or []]
+        mode = data.get('mode', 'zone')
+        priority = data.get('priority', 'shortest')
+        
+        limit = settings.EXPOSURE_MATRIX_MAX_LOCATIONS
+        if not sources or not destinations:
+            raise ValueError('sources and destinations are required')
+        if len(sources) > limit or len(destinations) > limit:
+            raise ValueError(f'At most {limit} sources and {limit} destinations are supported')
+    except (ValueError, TypeError, KeyError) as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+    
+    if request.service_mode != 'live':
+        mode = 'zone'
+    
+    try:
+        matrices = ExposureMatrixService().compute(sources, destinations, mode, priority)
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+    except Exception as e:
+        logger.error(f"Error computing exposure matrix: {str(e)}")
+        logger.error(traceback.format_exc())
+        return JsonResponse({'success': False, 'error': str(e)}, status=500)
+    
+    if matrices is None:
+        return JsonResponse({
+            'success': False,
+            'error': 'Could not get a distance matrix from the routing service'
+        }, status=502)
+    
+    return FastJsonResponse({
+        'success': True,
+        'mode': mode,
+        'priority': priority,
+        'service_mode': request.service_mode,
+        # Unroutable pairs are null
+        **{name: [[round(value, 2) if value != float('inf') else None for value in row]
+                  for row in matrix.tolist()]
+           for name, matrix in matrices.items()}
+    })
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+@admission_controlled('batch')
+def departure_window(request):
+    """
+    Exposure-vs-departure curve over a window of departure times for each
+    priority's route, and the best slot to leave
+    """
+    import numpy as np
+    from .services.dijkstra_optimizer import DijkstraOptimizer
+    
+    try:
+        data = json.loads(request.body)
+        source_lat = float(data.get('source_lat'))
+        source_lng = float(data.get('source_lng'))
+        dest_lat = float(data.get('dest_lat'))
+        dest_lng = float(data.get('dest_lng'))
+        # A single priority, or the whole shortest/balanced/cleanest set
+        priority = data.get('priority')
+        priorities = [priority] if priority else None
+        
+        start = _parse_departure_time(data.get('departure_time')) or time.time()
+        window_hours = float(data.get('window_hours', 3))
+        step_minutes = float(data.get('step_minutes', 15))
+        if step_minutes <= 0 or window_hours < 0:
+            raise ValueError('window_hours and step_minutes must be positive')
+        departures = np.arange(start, start + window_hours * 3600 + 1, step_minutes * 60)
+        if len(departures) > settings.DEPARTURE_WINDOW_MAX_SLOTS:
+            raise ValueError(f'At most {settings.DEPARTURE_WINDOW_MAX_SLOTS} departure slots are supported')
+        if departures[-1] > time.time() + settings.AQI_FORECAST_HOURS * 3600:
+            raise ValueError(f'The window must end within the next {settings.AQI_FORECAST_HOURS} hours')
+    except (ValueError, TypeError) as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+    
+    try:
+        optimizer = DijkstraOptimizer(Deadline.for_request(), request.service_mode)
+        results = optimizer.departure_window(source_lat, source_lng, dest_lat, dest_lng,
+                                             departures, priorities)
+    except Exception as e:
+        logger.error(f"Error sweeping departure window: {str(e)}")
+        logger.error(traceback.format_exc())
+        return JsonResponse({'success': False, 'error': str(e)}, status=500)
+    
+    routes = {}
+    best = None
+    for name, result in results.items():
+        if result is None:
+            routes[name] = None
+            continue
+        exposure = result['exposure']
+        slot = int(np.argmin(exposure))
+        duration = result['route']['duration']
+        routes[name] = {
+            'distance': round(result['route']['distance'], 2),
+            'duration': round(duration, 2),
+            'exposure': [round(float(value), 2) for value in exposure],
+            'best': {
+                'departure_time': _format_time(departures[slot]),
+                'exposure': round(float(exposure[slot]), 2),
+                'average_aqi': round(float(exposure[slot]) / duration, 2) if duration > 0 else None,
+            }
+        }
+        if best is None or exposure[slot] < best['exposure']:
+            best = {'priority': name, 'departure_time': _format_time(departures[slot]),
+                    'exposure': round(float(exposure[slot]), 2)}
+    
+    if best is None:
+        return JsonResponse({
+            'success': False,
+            'error': 'Could not find route. Please try different locations.'
+        }, status=400)
+    
+    return JsonResponse({
+        'success': True,
+        'departures': [_format_time(departure) for departure in departures],
+        'routes': routes,
+        'best': best,
+        'service_mode': request.service_mode
+    })
+
+
+def _parse_departure_time(value):
+    """
+    Departure as epoch seconds from an ISO 8601 string (local time if no
+    offset) or a number; None means depart now with the snapshot as-is
+    """
+    if value in (None, ''):
+        return None
+    if isinstance(value, (int, float)):
+        departure = float(value)
+    else:
+        parsed = parse_datetime(str(value))
+        if parsed is None:
+            raise ValueError(f'Invalid departure_time: {value}')
+        if timezone.is_naive(parsed):
+            parsed = parsed.replace(tzinfo=ZoneInfo(settings.AQI_FORECAST_TIME_ZONE))
+        departure = parsed.timestamp()
+    
+    now = time.time()
+    if not now - 3600 <= departure <= now + settings.AQI_FORECAST_HOURS * 3600:
+        raise ValueError(f'departure_time must be within the next {settings.AQI_FORECAST_HOURS} hours')
+    return departure
+
+
+def _format_time(epoch):
+    """Local ISO 8601 time for an epoch"""
+    return datetime.fromtimestamp(epoch, ZoneInfo(settings.AQI_FORECAST_TIME_ZONE)).isoformat(timespec='seconds')
+
+
+def _raster_aqi(lat, lng):
+    """AQI reading for a point from the station snapshot, else the climatology (None if neither covers it)"""
+    import numpy as np
+    from .services.aqi_snapshot import SNAPSHOT_FIELDS, SnapshotAQISource
+    from .services.climatology import ClimatologyAQISource
+    
+    lats, lngs = np.array([lat]), np.array([lng])
+    for name, source, confidence in (('snapshot', SnapshotAQISource.current(), 'medium'),
+                                     ('climatology', ClimatologyAQISource(), 'low')):
+        aqi = source.lookup(lats, lngs, 'aqi')[0]
+        if np.isnan(aqi):
+            continue
+        reading = {'aqi': round(float(aqi))}
+        for field in SNAPSHOT_FIELDS:
+            if field != 'aqi':
+                value = source.lookup(lats, lngs, field)[0]
+                reading[field] = None if np.isnan(value) else round(float(value), 1)
+        reading.update({
+            'location': {'lat': lat, 'lng': lng, 'name': f'{name.capitalize()} estimate'},
+            'time': '',
+            'source': name,
+            'confidence': confidence,
+        })
+        return reading
+    return None
+
+
 @require_http_methods(["GET"])
 def get_history(request):
     """
@@ -292,35 +571,38 @@ def get_history(request):
 
 @csrf_exempt
 @require_http_methods(["POST"])
+@admission_controlled('interactive')
 def get_aqi(request):
     """
-    Get AQI for specific location
+    Get AQI for specific location (from the snapshot or climatology
+    outside live mode)
     """
     try:
         data = json.loads(request.body)
         lat = float(data.get('lat'))
         lng = float(data.get('lng'))
         
-        print(f"\n🌍 Fetching AQI for ({lat}, {lng})")
-        
-        aqi_service = AirQualityService()
-        aqi_data = aqi_service.get_aqi_by_coordinates(lat, lng)
+        if request.service_mode == 'live':
+            from .services.air_quality_service import AirQualityService
+            aqi_service = AirQualityService(Deadline.for_request())
+            aqi_data = aqi_service.get_aqi_by_coordinates(lat, lng)
+        else:
+            aqi_data = _raster_aqi(lat, lng)
         
         if aqi_data:
-            print(f"✓ AQI: {aqi_data.get('aqi', 'N/A')}")
             return JsonResponse({
                 'success': True,
-                'aqi_data': aqi_data
+                'aqi_data': aqi_data,
+                'service_mode': request.service_mode
             })
         else:
-            print(f"✗ Could not fetch AQI data")
+            logger.info("Could not fetch AQI data for (%s, %s)", lat, lng)
             return JsonResponse({
                 'success': False,
                 'error': 'Could not fetch AQI data for this location'
             }, status=400)
             
     except Exception as e:
-        print(f"💥 Error fetching AQI: {e}")
         logger.error(f"Error fetching AQI: {str(e)}")
         logger.error(traceback.format_exc())
         
@@ -328,3 +610,60 @@ def get_aqi(request):
             'success': False,
             'error': str(e)
         }, status=500)
+
+
+@require_http_methods(["GET"])
+def route_cache_stats(request):
+    """
+    Route cache hit ratio of this worker and the current AQI snapshot epoch
+    """
+    return JsonResponse({'success': True, 'stats': RouteCache().stats()})
+
+
+@require_http_methods(["GET"])
+def zone_matrix(request):
+    """
+    Zone matrix metadata, or coarse estimates between two points when
+    source_lat, source_lng, dest_lat and dest_lng are given
+    """
+    from .services.zone_matrix import ZoneMatrix
+    
+    matrix = ZoneMatrix.current()
+    if matrix is None:
+        return JsonResponse({
+            'success': False,
+            'error': 'Zone matrix has not been built yet'
+        }, status=503)
+    
+    try:
+        params = ['source_lat', 'source_lng', 'dest_lat', 'dest_lng']
+        if all(request.GET.get(param) for param in params):
+            coords = [float(request.GET[param]) for param in params]
+            return JsonResponse({'success': True, 'matrix': matrix.lookup(*coords)})
+        
+        return JsonResponse({
+            'success': True,
+            'matrix': {
+                'grid': matrix.meta['grid'],
+                'priorities': matrix.priorities,
+                'built_at': matrix.meta['built_at'],
+                'version': matrix.version,
+                'centroids': matrix.grid.centroids().round(6).tolist(),
+                'zone_aqi': matrix.tables['zone_aqi'].round(1).tolist(),
+            }
+        })
+    
+    except ValueError as e:
+        return JsonResponse({
+            'success': False,
+            'error': f'Invalid data format: {str(e)}'
+        }, status=400)
+
+
+@require_http_methods(["GET"])
+def metrics(request):
+    """
+    Pipeline stage timings and upstream call counters in the Prometheus
+    text format (this worker process only)
+    """
+    return HttpResponse(REGISTRY.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
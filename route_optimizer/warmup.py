@@ -0,0 +1,169 @@
+"""
+Startup warm-up for serving processes. Imports the service modules the
+views load lazily (numpy, requests, openrouteservice, ...), loads the
+shared artifacts (zone matrix, AQI snapshot and climatology rasters,
+forecast layers, AQI model) and sets up the upstream connection pools and
+quota file, so the first requests on a worker do not pay for them. Each
+step is timed; the report is logged, exported as
+startup_step_duration_seconds and returned by startup_report().
+"""
+import importlib
+import logging
+import os
+import sys
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from django.conf import settings
+
+from .metrics import STARTUP_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Process names of WSGI/ASGI servers (argv[0], or the module run with -m)
+SERVER_PROGRAMS = ('gunicorn', 'uvicorn', 'daphne', 'hypercorn', 'uwsgi', 'waitress', 'mod_wsgi')
+
+# Modules the views import on first use
+LAZY_MODULES = (
+    'numpy',
+    'route_optimizer.services.dijkstra_optimizer',
+    'route_optimizer.services.routing_service',
+    'route_optimizer.services.air_quality_service',
+    'route_optimizer.services.polyline_codec',
+    'route_optimizer.services.simplification',
+    'route_optimizer.services.zone_matrix',
+    'route_optimizer.services.exposure_matrix',
+    'route_optimizer.services.aqi_snapshot',
+    'route_optimizer.services.climatology',
+)
+
+_report: Dict = {'state': 'not started', 'steps': {}, 'seconds': None}
+_report_lock = threading.Lock()
+
+
+def is_serving_process(argv: Optional[List[str]] = None) -> bool:
+    """
+    True under a WSGI/ASGI server or runserver (its reloading child only),
+    False for other management commands, tests and scripts
+    """
+    argv = sys.argv if argv is None else argv
+    if not argv:
+        return False
+    if any(name in os.path.basename(argv[0]) or f'{os.sep}{name}{os.sep}' in argv[0]
+           for name in SERVER_PROGRAMS):
+        return True
+    if len(argv) > 1 and argv[1] == 'runserver':
+        return os.environ.get('RUN_MAIN') == 'true' or '--noreload' in argv
+    return False
+
+
+def _import_modules():
+    for name in LAZY_MODULES:
+        importlib.import_module(name)
+
+
+def _zone_matrix():
+    from .services.zone_matrix import ZoneMatrix
+    ZoneMatrix.current()
+
+
+def _aqi_snapshot():
+    from .services.aqi_snapshot import SnapshotAQISource
+    SnapshotAQISource.current().arrays
+
+
+def _climatology():
+    from .services.climatology import Climatology
+    Climatology.current()
+
+
+def _forecast_layers():
+    from .services.aqi_forecast import HourlyAQILayers
+    HourlyAQILayers.current()
+
+
+def _aqi_model():
+    from .services.aqi_model import AQIModelService
+    AQIModelService.instance()
+
+
+def _upstream_clients():
+    """Connection pools and the quota file; no upstream calls are made"""
+    from .services.http_pool import upstream_session
+    from .services.quota import QuotaLimiter
+    from .services.routing_service import RoutingService
+
+    upstream_session('ors')
+    upstream_session('waqi')
+    RoutingService()
+    if settings.UPSTREAM_RATE_LIMIT_ENABLED:
+        # Create the file and table; request threads open their own connections
+        quota = QuotaLimiter(settings.UPSTREAM_RATE_LIMIT_DB)
+        quota.tokens('warmup', 1.0, 1.0)
+        quota._local.connection.close()
+
+
+def warmup_steps() -> List[Tuple[str, Callable[[], None]]]:
+    steps = [
+        ('imports', _import_modules),
+        ('zone_matrix', _zone_matrix),
+        ('aqi_snapshot', _aqi_snapshot),
+        ('climatology', _climatology),
+        ('forecast_layers', _forecast_layers),
+    ]
+    if settings.AQI_MODEL_PRELOAD:
+        steps.append(('aqi_model', _aqi_model))
+    steps.append(('upstream_clients', _upstream_clients))
+    return steps
+
+
+def run_warmup() -> Dict:
+    """Run every step (a failing step is logged and skipped); returns the report"""
+    from django.db import connections
+
+    with _report_lock:
+        _report.update(state='running', steps={}, seconds=None)
+    started = time.perf_counter()
+    try:
+        for name, step in warmup_steps():
+            step_started = time.perf_counter()
+            try:
+                step()
+                ok = True
+            except Exception as e:
+                logger.warning("Warm-up step %s failed: %s", name, e)
+                ok = False
+            seconds = time.perf_counter() - step_started
+            STARTUP_SECONDS.observe(seconds, step=name)
+            with _report_lock:
+                _report['steps'][name] = {'seconds': round(seconds, 4), 'ok': ok}
+    finally:
+        # Database connections are per thread; don't keep this one open
+        connections.close_all()
+
+    with _report_lock:
+        _report.update(state='done', seconds=round(time.perf_counter() - started, 4))
+    report = startup_report()
+    logger.info("Startup warm-up done in %.0f ms (%s)", report['seconds'] * 1000,
+                ', '.join(f"{name} {step['seconds'] * 1000:.0f} ms{'' if step['ok'] else ' FAILED'}"
+                          for name, step in report['steps'].items()))
+    return report
+
+
+def start_warmup(background: bool = True):
+    """
+    Warm up in a daemon thread (the process starts answering at once and
+    early requests load what they need themselves), or inline
+    """
+    if not background:
+        run_warmup()
+        return
+    threading.Thread(target=run_warmup, name='startup-warmup', daemon=True).start()
+
+
+def startup_report() -> Dict:
+    """{'state', 'seconds', 'steps': {name: {'seconds', 'ok'}}} for this process"""
+    with _report_lock:
+        return {'state': _report['state'], 'seconds': _report['seconds'],
+                'steps': {name: dict(step) for name, step in _report['steps'].items()}}